@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bloodmgmt.settings')
+# streaming admin updates hold a connection open; only offer them under ASGI
+os.environ.setdefault('BLOODMGMT_ASGI', '1')
 
 application = get_asgi_application()
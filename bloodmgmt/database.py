@@ -0,0 +1,119 @@
+"""
+DATABASES for settings.py, configured from the environment.
+
+SQLite (the default) is tuned for several concurrent writers: every new
+connection switches to WAL (readers no longer block the writer),
+synchronous=NORMAL (safe with WAL, far fewer fsyncs), a memory map and a
+larger page cache, and waits busy_timeout ms for a lock instead of failing
+with "database is locked". Transactions start with BEGIN IMMEDIATE, so an
+approval takes the write lock up front rather than failing when it tries to
+upgrade a read lock mid-transaction. Connections are kept open between
+requests (CONN_MAX_AGE), except under ASGI: each request there may run on a
+different thread, so a kept connection would be left idle rather than reused.
+
+BLOODMGMT_DB_ENGINE=postgresql switches to PostgreSQL, optionally with
+psycopg's connection pool (BLOODMGMT_DB_POOL=1, needs psycopg[pool]).
+
+A second, read-only "replica" alias is added when BLOODMGMT_DB_REPLICA_NAME
+(a SQLite snapshot written by the snapshot_replica command, or a PostgreSQL
+database name) or BLOODMGMT_DB_REPLICA_HOST is set; core.routers decides what
+reads it.
+"""
+import os
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,
+    'cache_size': -65536,
+    'busy_timeout': 5000,
+}
+
+
+def _int(env, name, default):
+    return int(env.get(name, default))
+
+
+def _conn_max_age(env):
+    return _int(env, 'BLOODMGMT_DB_CONN_MAX_AGE', 0 if env.get('BLOODMGMT_ASGI') == '1' else 600)
+
+
+def sqlite_config(base_dir, env):
+    pragmas = dict(SQLITE_PRAGMAS)
+    pragmas['mmap_size'] = _int(env, 'BLOODMGMT_SQLITE_MMAP_SIZE', pragmas['mmap_size'])
+    pragmas['cache_size'] = _int(env, 'BLOODMGMT_SQLITE_CACHE_SIZE', pragmas['cache_size'])
+    pragmas['busy_timeout'] = _int(env, 'BLOODMGMT_SQLITE_BUSY_TIMEOUT', pragmas['busy_timeout'])
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': env.get('BLOODMGMT_DB_NAME', str(base_dir / 'db.sqlite3')),
+        'CONN_MAX_AGE': _conn_max_age(env),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ''.join(f'PRAGMA {name}={value};' for name, value in pragmas.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+
+
+def postgresql_config(env):
+    pooled = env.get('BLOODMGMT_DB_POOL', '') == '1'
+    options = {}
+    if pooled:
+        options['pool'] = {
+            'min_size': _int(env, 'BLOODMGMT_DB_POOL_MIN_SIZE', 2),
+            'max_size': _int(env, 'BLOODMGMT_DB_POOL_MAX_SIZE', 10),
+        }
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('BLOODMGMT_DB_NAME', 'bloodmgmt'),
+        'USER': env.get('BLOODMGMT_DB_USER', ''),
+        'PASSWORD': env.get('BLOODMGMT_DB_PASSWORD', ''),
+        'HOST': env.get('BLOODMGMT_DB_HOST', ''),
+        'PORT': env.get('BLOODMGMT_DB_PORT', ''),
+        # the pool keeps connections itself; Django refuses both at once
+        'CONN_MAX_AGE': 0 if pooled else _conn_max_age(env),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': options,
+    }
+
+
+def sqlite_replica_config(primary, path):
+    pragmas = {
+        name: value for name, value in SQLITE_PRAGMAS.items() if name not in ('journal_mode', 'synchronous')
+    }
+    init = ''.join(f'PRAGMA {name}={value};' for name, value in pragmas.items())
+    return dict(
+        primary,
+        NAME=f'file:{path}?mode=ro',
+        # the snapshot file is replaced wholesale; a fresh connection sees the new one
+        CONN_MAX_AGE=0,
+        OPTIONS={'uri': True, 'init_command': init + 'PRAGMA query_only=1;'},
+    )
+
+
+def postgresql_replica_config(primary, env):
+    return dict(
+        primary,
+        NAME=env.get('BLOODMGMT_DB_REPLICA_NAME', primary['NAME']),
+        HOST=env.get('BLOODMGMT_DB_REPLICA_HOST', primary['HOST']),
+        PORT=env.get('BLOODMGMT_DB_REPLICA_PORT', primary['PORT']),
+        OPTIONS=dict(primary['OPTIONS']),
+    )
+
+
+def databases(base_dir, env=os.environ):
+    engine = env.get('BLOODMGMT_DB_ENGINE', 'sqlite')
+    if engine == 'sqlite':
+        config = {'default': sqlite_config(base_dir, env)}
+        if env.get('BLOODMGMT_DB_REPLICA_NAME'):
+            config['replica'] = sqlite_replica_config(config['default'], env['BLOODMGMT_DB_REPLICA_NAME'])
+    elif engine == 'postgresql':
+        config = {'default': postgresql_config(env)}
+        if env.get('BLOODMGMT_DB_REPLICA_NAME') or env.get('BLOODMGMT_DB_REPLICA_HOST'):
+            config['replica'] = postgresql_replica_config(config['default'], env)
+    else:
+        raise ValueError(f'BLOODMGMT_DB_ENGINE must be sqlite or postgresql, not {engine!r}')
+    if 'replica' in config:
+        # tests read the replica through the test copy of default
+        config['replica']['TEST'] = {'MIRROR': 'default'}
+    return config
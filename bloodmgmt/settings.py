@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import databases
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'core.routers.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,15 +82,117 @@ WSGI_APPLICATION = 'bloodmgmt.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Tuned SQLite by default; see bloodmgmt/database.py for the BLOODMGMT_DB_* variables.
+
+DATABASES = databases(BASE_DIR)
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+# After writing, a user reads from the primary for this long while the replica catches up
+REPLICA_STICKY_SECONDS = int(os.environ.get('BLOODMGMT_DB_REPLICA_STICKY_SECONDS', 10))
+
+
+# Cache
+# BLOODMGMT_CACHE_BACKEND selects locmem (default, per process), file or redis;
+# BLOODMGMT_CACHE_LOCATION is the directory or redis:// URL for the latter two.
 
-DATABASES = {
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.environ.get('BLOODMGMT_CACHE_BACKEND', 'locmem')
+CACHE_DEFAULT_LOCATIONS = {
+    'locmem': 'bloodmgmt',
+    'file': str(BASE_DIR / '.django_cache'),
+    'redis': 'redis://127.0.0.1:6379/1',
+}
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('BLOODMGMT_CACHE_LOCATION', CACHE_DEFAULT_LOCATIONS[CACHE_BACKEND]),
+        'TIMEOUT': int(os.environ.get('BLOODMGMT_CACHE_TIMEOUT', 300)),
+        'KEY_PREFIX': 'bloodmgmt',
     }
 }
 
 
+# Units each blood group starts with when a blood bank is created
+DEFAULT_INVENTORY_UNITS = int(os.environ.get('BLOODMGMT_DEFAULT_INVENTORY_UNITS', 10))
+
+# Days from collection to expiry for stock received without an explicit expiry date
+BLOOD_SHELF_LIFE_DAYS = int(os.environ.get('BLOODMGMT_BLOOD_SHELF_LIFE_DAYS', 42))
+
+# Inventory rows holding fewer units raise a low-stock alert (see run_scheduler)
+LOW_STOCK_THRESHOLD = int(os.environ.get('BLOODMGMT_LOW_STOCK_THRESHOLD', 5))
+
+
+# Days a donor must wait after each kind of donation before they are eligible again
+# (BLOODMGMT_DEFERRAL_DAYS_WHOLE_BLOOD, _DOUBLE_RED, _PLASMA, _PLATELETS)
+DONATION_DEFERRAL_DAYS = {
+    kind: int(os.environ.get(f'BLOODMGMT_DEFERRAL_DAYS_{kind.upper()}', days))
+    for kind, days in {'whole_blood': 56, 'double_red': 112, 'plasma': 28, 'platelets': 7}.items()
+}
+
+
+# Run background tasks in process after commit instead of leaving them to run_worker;
+# on by default with DEBUG so runserver works without a worker
+TASKS_EAGER = os.environ.get('BLOODMGMT_TASKS_EAGER', '1' if DEBUG else '0') == '1'
+# run_worker deletes finished tasks this many days old
+TASKS_KEEP_DONE_DAYS = int(os.environ.get('BLOODMGMT_TASKS_KEEP_DONE_DAYS', 7))
+
+
+# Donor notifications for new requests
+# BLOODMGMT_NOTIFICATION_BACKEND selects email (Django's EMAIL_BACKEND) or file
+# (JSON lines appended to BLOODMGMT_NOTIFICATION_FILE). With DEBUG the default is
+# file: tasks run eagerly then, and would otherwise send email from the request.
+
+NOTIFICATION_BACKENDS = {
+    'email': 'core.notifications.EmailBackend',
+    'file': 'core.notifications.FileBackend',
+}
+NOTIFICATION_BACKEND = NOTIFICATION_BACKENDS[os.environ.get('BLOODMGMT_NOTIFICATION_BACKEND', 'file' if DEBUG else 'email')]
+NOTIFICATION_FILE_PATH = os.environ.get('BLOODMGMT_NOTIFICATION_FILE', str(BASE_DIR / 'notifications.log'))
+# A donor gets at most one request notification per this many hours
+NOTIFICATION_MIN_INTERVAL_HOURS = int(os.environ.get('BLOODMGMT_NOTIFICATION_MIN_INTERVAL_HOURS', 24))
+
+
+# Live admin updates (server-sent events)
+# BLOODMGMT_EVENT_BROKER selects local (default, per process) or redis.
+# The streams are only served under ASGI (bloodmgmt/asgi.py sets BLOODMGMT_ASGI);
+# under WSGI each open stream would hold a worker thread for good.
+
+LIVE_UPDATES = os.environ.get('BLOODMGMT_ASGI', '') == '1'
+
+EVENT_BROKERS = {
+    'local': 'core.events.LocalBroker',
+    'redis': 'core.events.RedisBroker',
+}
+EVENT_BROKER = {
+    'BACKEND': EVENT_BROKERS[os.environ.get('BLOODMGMT_EVENT_BROKER', 'local')],
+    'OPTIONS': {'url': os.environ['BLOODMGMT_EVENT_BROKER_URL']} if 'BLOODMGMT_EVENT_BROKER_URL' in os.environ else {},
+}
+
+
+# Request profiling (core.profiling): fraction of requests to sample, 0 = off
+PROFILING_SAMPLE_RATE = float(os.environ.get('BLOODMGMT_PROFILING_SAMPLE_RATE', 0))
+PROFILING_BUFFER_SIZE = int(os.environ.get('BLOODMGMT_PROFILING_BUFFER_SIZE', 200))
+# Seconds between per-view summaries logged by core.profiling
+PROFILING_LOG_INTERVAL = int(os.environ.get('BLOODMGMT_PROFILING_LOG_INTERVAL', 60))
+
+# Metrics (core.metrics): directory shared by all worker processes; empty keeps them per process
+METRICS_DIR = os.environ.get('BLOODMGMT_METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = int(os.environ.get('BLOODMGMT_METRICS_FLUSH_SECONDS', 5))
+# Bearer token a scraper can use for /metrics; staff sessions can always read it
+METRICS_TOKEN = os.environ.get('BLOODMGMT_METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {'core.profiling': {'handlers': ['console'], 'level': 'INFO'}},
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, BloodBank, DonorProfile, BloodInventory, DonationRequest, DonationHistory
+from .models import User, BloodBank, DonorProfile, BloodInventory, BloodLot, DonationRequest, DonationHistory, StockAlert, Task
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
 @admin.register(User)
@@ -10,5 +10,19 @@ class UserAdmin(BaseUserAdmin):
 admin.site.register(BloodBank)
 admin.site.register(DonorProfile)
 admin.site.register(BloodInventory)
+admin.site.register(BloodLot)
 admin.site.register(DonationRequest)
 admin.site.register(DonationHistory)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'name')
+
+
+@admin.register(StockAlert)
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ('inventory', 'units', 'threshold', 'raised_at', 'notified_at', 'resolved_at')
+    list_filter = ('resolved_at',)
+    list_select_related = ('inventory__blood_bank',)
@@ -0,0 +1,117 @@
+"""
+Splitting a DonationRequest across blood banks.
+
+Candidates are all inventory rows of a compatible group. They are ranked by
+group preference (see core.compatibility), then by how close the bank is to
+the request (same city, then a bank city named in the hospital), then by the
+earliest expiry among the row's lots, so stock closest to expiring is used
+first, then by stock. The plan is built from a plain read and then applied
+as one conditional decrement per row drawn from (see core.inventory), in
+primary key order so that concurrent approvals touch rows in the same order. If any
+decrement finds the stock gone, the attempt is rolled back and re-planned.
+"""
+from dataclasses import dataclass
+from datetime import date
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .compatibility import source_groups
+from .inventory import adjust_units, fifo_order
+from .models import BloodInventory, BloodLot
+from .search import normalize
+
+
+class ApprovalError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+@dataclass
+class Draw:
+    inventory_id: int
+    blood_bank_id: int
+    blood_group: str
+    units: int
+
+
+def locality_rank(bank_city, city, hospital_name):
+    bank_key = normalize(bank_city)
+    if not bank_key:
+        return 2
+    if bank_key == normalize(city):
+        return 0
+    if f' {bank_key} ' in f' {normalize(hospital_name)} ':
+        return 1
+    return 2
+
+
+def candidate_rows(groups):
+    """
+    Inventory rows with stock in any of `groups`, as
+    (id, bank_id, group, units, bank_city, first_expiry).
+    """
+    first_expiry = (
+        BloodLot.objects.filter(inventory=OuterRef('pk'), units_left__gt=0)
+        .order_by(*fifo_order()).values('expires_on')[:1]
+    )
+    return list(
+        BloodInventory.objects.filter(blood_group__in=groups, units__gt=0)
+        .annotate(first_expiry=Subquery(first_expiry))
+        .order_by()
+        .values_list('id', 'blood_bank_id', 'blood_group', 'units', 'blood_bank__city', 'first_expiry')
+    )
+
+
+def _expiry_rank(expires_on):
+    # undated (pre-tracking) stock goes last
+    return expires_on or date.max
+
+
+def plan(req, rows=None):
+    """
+    Rank candidate rows and draw greedily until the request is covered.
+    `rows` lets a caller plan several requests against one snapshot.
+    """
+    ranks = {group: rank for rank, group in enumerate(source_groups(req.blood_group))}
+    if rows is None:
+        rows = candidate_rows(ranks)
+    rows = [r for r in rows if r[2] in ranks and r[3] > 0]
+    if not rows:
+        raise ApprovalError('No inventory available for this blood group.', 'no_inventory')
+
+    rows.sort(key=lambda r: (
+        ranks[r[2]], locality_rank(r[4], req.city, req.hospital_name), _expiry_rank(r[5]), -r[3], r[0],
+    ))
+    draws = []
+    remaining = req.units
+    for inventory_id, bank_id, group, units, *_ in rows:
+        take = min(units, remaining)
+        draws.append(Draw(inventory_id, bank_id, group, take))
+        remaining -= take
+        if not remaining:
+            return draws
+    raise ApprovalError('Not enough units', 'insufficient')
+
+
+class _StockMoved(Exception):
+    pass
+
+
+def allocate(req, attempts=3):
+    """
+    Plan and apply the inventory decrements for `req`. Must run inside a
+    transaction; returns the list of Draws taken.
+    """
+    for _ in range(attempts):
+        draws = plan(req)
+        try:
+            with transaction.atomic():
+                for d in sorted(draws, key=lambda d: d.inventory_id):
+                    if not adjust_units(d.inventory_id, -d.units, d.blood_group):
+                        raise _StockMoved
+        except _StockMoved:
+            continue
+        return draws
+    raise ApprovalError('Not enough units', 'insufficient')
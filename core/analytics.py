@@ -0,0 +1,190 @@
+"""
+Daily rollups behind the analytics API.
+
+DailyStat holds units donated, requested, approved and rejected per day x
+blood group x bank x city. New history rows and request transitions add to
+the matching rows with F() updates (see core.approvals, core.signals);
+rebuild() recomputes a date range from the source tables. Reports read only
+the rollups, so their cost depends on the number of days asked for, not on
+the size of DonationHistory. Deleting a bank folds its rows into the rows
+without a bank, matching its history once the foreign key is nulled.
+
+Changes made outside core.approvals (e.g. editing a request's status in the
+Django admin) are not tracked incrementally; rebuild_daily_stats reconciles
+them.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import ISSUED, BloodBank, DailyStat, DonationHistory, DonationRequest
+from .search import normalize
+
+METRICS = ('donated_units', 'requested_units', 'approved_units', 'rejected_units')
+INTERVALS = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
+DIMENSIONS = {'blood_group': 'blood_group', 'bank': 'blood_bank', 'city': 'city'}
+STATUS_METRIC = {'approved': 'approved_units', 'rejected': 'rejected_units'}
+
+
+def _day(value):
+    return timezone.localdate(value) if isinstance(value, datetime) else value
+
+
+def bump(deltas):
+    """
+    Apply {(day, blood_group, bank_id, city): {metric: delta}} to the rollups,
+    creating rows as needed.
+    """
+    for (day, blood_group, bank_id, city), values in deltas.items():
+        values = {metric: delta for metric, delta in values.items() if delta}
+        if not values:
+            continue
+        row = DailyStat.objects.filter(day=day, blood_group=blood_group, blood_bank_id=bank_id, city=city)
+        update = {metric: F(metric) + delta for metric, delta in values.items()}
+        if row.update(**update):
+            continue
+        try:
+            with transaction.atomic():
+                DailyStat.objects.create(day=day, blood_group=blood_group, blood_bank_id=bank_id, city=city, **values)
+        except IntegrityError:
+            # created concurrently since the UPDATE
+            row.update(**update)
+
+
+def record_history(entries):
+    """Add freshly created DonationHistory rows to the rollups (issued rows are not donations)."""
+    entries = [e for e in entries if e.kind != ISSUED]
+    bank_ids = {e.blood_bank_id for e in entries if e.blood_bank_id}
+    cities = dict(BloodBank.objects.filter(id__in=bank_ids).values_list('id', 'city')) if bank_ids else {}
+    deltas = defaultdict(lambda: defaultdict(int))
+    for entry in entries:
+        day = _day(entry.donated_at) if entry.donated_at else timezone.localdate()
+        key = (day, entry.blood_group, entry.blood_bank_id, normalize(cities.get(entry.blood_bank_id)))
+        deltas[key]['donated_units'] += entry.units
+    bump(deltas)
+
+
+def detach_bank(bank_id):
+    """
+    Fold a bank's rollups into the rows without a bank before it is deleted,
+    the way rebuild() counts its history once blood_bank is set to NULL.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    rows = DailyStat.objects.filter(blood_bank_id=bank_id)
+    for row in rows:
+        for metric in METRICS:
+            deltas[(row.day, row.blood_group, None, '')][metric] += getattr(row, metric)
+    with transaction.atomic():
+        rows.delete()
+        bump(deltas)
+
+
+def _request_key(req):
+    return (_day(req.created_at), req.blood_group, None, normalize(req.city))
+
+
+def record_requests(requests, metric='requested_units'):
+    """Count `requests` under `metric`: requested on creation, approved/rejected on decision."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for req in requests:
+        deltas[_request_key(req)][metric] += req.units
+    bump(deltas)
+
+
+def record_decision(requests, status):
+    record_requests(requests, STATUS_METRIC[status])
+
+
+def _day_range(start, end):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def rebuild(start, end):
+    """Recompute the rollups for the days start..end (inclusive); returns rows written."""
+    since, until = _day_range(start, end)
+    rows = defaultdict(lambda: defaultdict(int))
+
+    history = (
+        DonationHistory.objects.filter(donated_at__gte=since, donated_at__lt=until).exclude(kind=ISSUED)
+        .annotate(day=TruncDate('donated_at'))
+        .values('day', 'blood_group', 'blood_bank_id', 'blood_bank__city')
+        .annotate(units=Sum('units'))
+        .order_by()
+    )
+    for row in history:
+        key = (row['day'], row['blood_group'], row['blood_bank_id'], normalize(row['blood_bank__city']))
+        rows[key]['donated_units'] += row['units']
+
+    requests = (
+        DonationRequest.objects.filter(created_at__gte=since, created_at__lt=until)
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'blood_group', 'city')
+        .annotate(
+            requested=Sum('units'),
+            approved=Sum('units', filter=Q(status='approved')),
+            rejected=Sum('units', filter=Q(status='rejected')),
+        )
+        .order_by()
+    )
+    for row in requests:
+        # raw city spellings that normalize alike fold into one row
+        key = (row['day'], row['blood_group'], None, normalize(row['city']))
+        rows[key]['requested_units'] += row['requested'] or 0
+        rows[key]['approved_units'] += row['approved'] or 0
+        rows[key]['rejected_units'] += row['rejected'] or 0
+
+    with transaction.atomic():
+        DailyStat.objects.filter(day__gte=start, day__lte=end).delete()
+        DailyStat.objects.bulk_create(
+            [
+                DailyStat(day=day, blood_group=group, blood_bank_id=bank_id, city=city, **values)
+                for (day, group, bank_id, city), values in rows.items()
+            ],
+            batch_size=1000,
+        )
+    return len(rows)
+
+
+def _filtered(start, end, blood_group=None, bank=None, city=None):
+    qs = DailyStat.objects.filter(day__gte=start, day__lte=end)
+    if blood_group:
+        qs = qs.filter(blood_group=blood_group)
+    if bank:
+        qs = qs.filter(blood_bank_id=bank)
+    if city:
+        qs = qs.filter(city=normalize(city))
+    return qs
+
+
+def timeseries(metric, start, end, interval='day', **filters):
+    """[{'period': date, 'value': units}] for each day/week/month with data."""
+    qs = _filtered(start, end, **filters)
+    trunc = INTERVALS[interval]
+    period = trunc('day') if trunc else F('day')
+    return [
+        {'period': row['period'], 'value': row['value']}
+        for row in qs.annotate(period=period).values('period').annotate(value=Sum(metric)).order_by('period')
+    ]
+
+
+def top(metric, by, start, end, limit=10, **filters):
+    """The `limit` blood groups, banks or cities with the most `metric` units."""
+    field = DIMENSIONS[by]
+    qs = _filtered(start, end, **filters)
+    if by == 'bank':
+        qs = qs.exclude(blood_bank=None)
+        rows = qs.values('blood_bank', 'blood_bank__name')
+    else:
+        rows = qs.values(field)
+    rows = rows.annotate(value=Sum(metric)).filter(value__gt=0).order_by('-value')[:limit]
+    if by == 'bank':
+        return [{'key': r['blood_bank'], 'name': r['blood_bank__name'], 'value': r['value']} for r in rows]
+    return [{'key': r[field], 'value': r['value']} for r in rows]
@@ -0,0 +1,239 @@
+"""
+Approve/reject transitions for DonationRequest, shared by the HTML admin
+views and the API viewset.
+
+Only the request status and the stock decrements are written while the admin
+waits; the history rows recording the blood issued to the requester are
+written by a background task queued in the same transaction. They are of
+kind ISSUED, so they neither defer the requester nor count as donations.
+Each transition also adds to the daily rollups in core.analytics. queue()
+reads the staff request list the transitions are made from.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import analytics, events, metrics, stats, tasks
+from .allocation import ApprovalError, allocate, candidate_rows, plan
+from .compatibility import source_groups
+from .inventory import adjust_units
+from .models import ISSUED, DonationHistory, DonationRequest
+from .pagination import rows_after
+
+QUEUE_ORDERING = ('-created_at', '-id')
+QUEUE_PAGE_SIZE = 50
+
+
+def queue(after=None):
+    """One page of the staff request queue, newest first, plus one row to tell whether there is another."""
+    # the queue page shows each requester's name
+    qs = DonationRequest.objects.select_related('requester').order_by(*QUEUE_ORDERING)
+    if after:
+        qs = qs.filter(rows_after(QUEUE_ORDERING, after))
+    return qs[:QUEUE_PAGE_SIZE + 1]
+
+
+def _claim(req, new_status, approver):
+    """Move a pending request to `new_status`; the conditional UPDATE makes a second claim fail."""
+    claimed = DonationRequest.objects.filter(pk=req.pk, status='pending').update(
+        status=new_status, approved_by=approver,
+    )
+    if not claimed:
+        raise ApprovalError('Already processed.', 'processed')
+    stats.bump(stats.PENDING, -1)
+    analytics.record_decision([req], new_status)
+    events.publish_on_commit(events.REQUESTS, {'type': 'status', 'ids': [req.pk], 'status': new_status})
+    req.status = new_status
+    req.approved_by = approver
+
+
+@tasks.task
+def record_approval(request_id, requester_id, draws):
+    """Record one ISSUED history row per bank an approved request drew from."""
+    DonationHistory.objects.bulk_create([
+        DonationHistory(
+            donor_id=requester_id, blood_bank_id=bank_id, blood_group=group, units=units, kind=ISSUED,
+        )
+        for bank_id, group, units in draws
+    ])
+
+
+def _approval_task(req, draws):
+    payload = {
+        'request_id': req.pk,
+        'requester_id': req.requester_id,
+        'draws': [[d.blood_bank_id, d.blood_group, d.units] for d in draws],
+    }
+    return payload, f'approval:{req.pk}'
+
+
+def approve_request(req, approver):
+    """
+    Allocate stock for a pending request and mark it approved; the history
+    rows are queued (see record_approval). Raises ApprovalError.
+    """
+    try:
+        with transaction.atomic():
+            _claim(req, 'approved', approver)
+            draws = allocate(req)
+            tasks.enqueue_many(record_approval, [_approval_task(req, draws)])
+    except ApprovalError as exc:
+        metrics.REQUEST_DECISIONS.inc(action='approve', outcome='error', reason=exc.code)
+        raise
+    metrics.REQUEST_DECISIONS.inc(action='approve', outcome='approved')
+    return draws
+
+
+def reject_request(req, approver):
+    try:
+        with transaction.atomic():
+            _claim(req, 'rejected', approver)
+    except ApprovalError as exc:
+        metrics.REQUEST_DECISIONS.inc(action='reject', outcome='error', reason=exc.code)
+        raise
+    metrics.REQUEST_DECISIONS.inc(action='reject', outcome='rejected')
+
+
+BATCH_ACTIONS = ('approve', 'reject')
+BATCH_CHUNK_SIZE = 200
+
+
+class _BatchConflict(Exception):
+    pass
+
+
+def _result(req_id, state, detail, draws=None):
+    result = {'id': req_id, 'status': state, 'detail': detail}
+    if draws is not None:
+        result['allocations'] = [
+            {'blood_bank': d.blood_bank_id, 'blood_group': d.blood_group, 'units': d.units}
+            for d in draws
+        ]
+    return result
+
+
+def _one_by_one(requests, action, approver):
+    results = []
+    for req in requests:
+        try:
+            if action == 'approve':
+                results.append(_result(req.id, 'approved', 'Approved', approve_request(req, approver)))
+            else:
+                reject_request(req, approver)
+                results.append(_result(req.id, 'rejected', 'Rejected'))
+        except ApprovalError as exc:
+            results.append(_result(req.id, 'error', str(exc)))
+    return results
+
+
+def _approve_chunk(requests, approver):
+    """
+    Plan every request of the chunk against one inventory snapshot, then apply
+    the summed per-row deltas, the status change and the queued history tasks
+    with a handful of set-based statements.
+    """
+    groups = {g for req in requests for g in source_groups(req.blood_group)}
+    snapshot = {row[0]: row for row in candidate_rows(groups)}
+    deltas = {}
+    planned = []
+    results = {}
+    failures = Counter()
+    for req in requests:
+        try:
+            draws = plan(req, list(snapshot.values()))
+        except ApprovalError as exc:
+            results[req.id] = _result(req.id, 'error', str(exc))
+            failures[exc.code] += 1
+            continue
+        for d in draws:
+            row = snapshot[d.inventory_id]
+            snapshot[d.inventory_id] = row[:3] + (row[3] - d.units,) + row[4:]
+            deltas[d.inventory_id] = deltas.get(d.inventory_id, 0) + d.units
+        planned.append((req, draws))
+        results[req.id] = _result(req.id, 'approved', 'Approved', draws)
+
+    if planned:
+        with transaction.atomic():
+            ids = [req.id for req, _ in planned]
+            claimed = DonationRequest.objects.filter(id__in=ids, status='pending').update(
+                status='approved', approved_by=approver,
+            )
+            if claimed != len(ids):
+                raise _BatchConflict
+            stats.bump(stats.PENDING, -claimed)
+            analytics.record_decision([req for req, _ in planned], 'approved')
+            events.publish_on_commit(events.REQUESTS, {'type': 'status', 'ids': ids, 'status': 'approved'})
+            for inventory_id in sorted(deltas):
+                if not adjust_units(inventory_id, -deltas[inventory_id], snapshot[inventory_id][2]):
+                    raise _BatchConflict
+            tasks.enqueue_many(record_approval, [_approval_task(req, draws) for req, draws in planned])
+    # counted once the chunk has committed; a conflicting chunk is counted by _one_by_one
+    metrics.REQUEST_DECISIONS.inc(len(planned), action='approve', outcome='approved')
+    for reason, count in failures.items():
+        metrics.REQUEST_DECISIONS.inc(count, action='approve', outcome='error', reason=reason)
+    return [results[req.id] for req in requests]
+
+
+def _reject_chunk(requests, approver):
+    ids = [req.id for req in requests]
+    with transaction.atomic():
+        rejected = DonationRequest.objects.filter(id__in=ids, status='pending').update(
+            status='rejected', approved_by=approver,
+        )
+        if rejected != len(ids):
+            raise _BatchConflict
+        stats.bump(stats.PENDING, -rejected)
+        analytics.record_decision(requests, 'rejected')
+        events.publish_on_commit(events.REQUESTS, {'type': 'status', 'ids': ids, 'status': 'rejected'})
+    metrics.REQUEST_DECISIONS.inc(len(ids), action='reject', outcome='rejected')
+    return [_result(req_id, 'rejected', 'Rejected') for req_id in ids]
+
+
+def process_batch(action, approver, ids=None, filters=None, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Approve or reject many requests, selected by `ids` or by `filters` (field
+    lookups on DonationRequest; only pending requests are ever selected).
+    Work is done in chunks, each in its own transaction, oldest request first.
+    A chunk that races with another writer is redone one request at a time.
+    Returns one result dict per request.
+    """
+    if action not in BATCH_ACTIONS:
+        raise ValueError(f'Unknown batch action {action!r}')
+
+    results = []
+    qs = DonationRequest.objects.only(
+        'id', 'requester_id', 'blood_group', 'units', 'city', 'hospital_name', 'status', 'created_at',
+    )
+    if ids is not None:
+        ids = list(dict.fromkeys(ids))
+        found = set(DonationRequest.objects.filter(id__in=ids).values_list('id', flat=True))
+        results.extend(_result(i, 'error', 'Not found.') for i in ids if i not in found)
+        processed = set(
+            DonationRequest.objects.filter(id__in=found).exclude(status='pending').values_list('id', flat=True)
+        )
+        results.extend(_result(i, 'error', 'Already processed.') for i in ids if i in processed)
+        qs = qs.filter(id__in=found - processed)
+    if filters:
+        qs = qs.filter(**filters)
+    qs = qs.filter(status='pending').order_by('created_at', 'id')
+
+    # keyset over (created_at, id) so that already-processed rows drop out of
+    # later chunks without OFFSET
+    last = None
+    while True:
+        page = qs
+        if last is not None:
+            page = page.filter(Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.id))
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            break
+        try:
+            if action == 'approve':
+                results.extend(_approve_chunk(chunk, approver))
+            else:
+                results.extend(_reject_chunk(chunk, approver))
+        except _BatchConflict:
+            results.extend(_one_by_one(chunk, action, approver))
+        last = chunk[-1]
+    return results
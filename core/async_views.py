@@ -0,0 +1,176 @@
+"""
+Async twins of the read-heavy pages and API lists, mounted under /async/.
+
+They run on the event loop when the site is served through
+bloodmgmt/asgi.py, so a slow read parks a coroutine instead of holding a
+worker thread. Queries use the async ORM (async iteration, aiterator,
+acount, aaggregate); the pages share their query building with the sync
+views in core.views and render the same templates.
+
+The JSON lists return plain value rows with keyset cursors, in the same
+{"next", "previous", "results"} shape as the DRF API.
+"""
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.db.models import Sum
+from django.http import JsonResponse
+from django.shortcuts import render
+
+from . import caching, search, stats
+from .models import (
+    BLOOD_GROUP_CODES, BloodBank, BloodInventory, DonationHistory, DonationRequest, DonorProfile,
+)
+from .pagination import KeysetPagination, decode_cursor, encode_cursor, rows_after
+from .routers import read_alias, use_replica
+
+LISTS = {
+    'bloodbanks': {
+        'model': BloodBank,
+        'ordering': ('id',),
+        'fields': ('id', 'name', 'city', 'address', 'contact'),
+        'staff_only': True,
+    },
+    'inventory': {
+        'model': BloodInventory,
+        'ordering': ('id',),
+        'fields': ('id', 'blood_bank_id', 'blood_bank__name', 'blood_group', 'units'),
+        'staff_only': True,
+        'totals': {'total_units': Sum('units')},
+    },
+    'requests': {
+        'model': DonationRequest,
+        'ordering': ('-created_at', '-id'),
+        'fields': ('id', 'requester_id', 'blood_group', 'units', 'city', 'hospital_name', 'status',
+                   'created_at', 'approved_by_id'),
+        'owner': 'requester',
+        'sees_all': lambda user: user.is_staff or user.role == 'admin',
+    },
+    'history': {
+        'model': DonationHistory,
+        'ordering': ('-donated_at', '-id'),
+        'fields': ('id', 'donor_id', 'blood_group', 'units', 'kind', 'donated_at', 'blood_bank_id'),
+        'owner': 'donor',
+        'sees_all': lambda user: user.is_staff,
+        'replica': True,
+    },
+}
+
+
+async def _user(request):
+    # resolve the user once and put it back on the request, so templates and
+    # context processors never hit the database synchronously
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+@login_required
+@use_replica
+async def dashboard(request):
+    user = await _user(request)
+    summary = await caching.acached('stats', ['snapshot', read_alias()], stats.asnapshot)
+    if user.is_staff or user.role == 'admin':
+        return render(request, 'core/admin_dashboard.html', {
+            'total_donors': summary['total_donors'],
+            'inventory_by_group': summary['inventory_by_group'],
+            'pending_requests': summary['pending_requests'],
+        })
+    profile = await DonorProfile.objects.select_related('user').filter(user=user).afirst()
+    donation_history = [
+        entry async for entry in
+        DonationHistory.objects.filter(donor=user).select_related('blood_bank').order_by('-donated_at')
+    ]
+    return render(request, 'core/donor_dashboard.html', {
+        'profile': profile,
+        'donation_history': donation_history,
+        'available': summary['inventory_by_group'],
+    })
+
+
+@login_required
+@use_replica
+async def search_donors(request):
+    await _user(request)
+    q = request.GET.get('q', '').strip()
+    blood_group = request.GET.get('blood_group', '')
+    if blood_group not in BLOOD_GROUP_CODES:
+        blood_group = ''
+    city = request.GET.get('city', '').strip()
+    eligible = request.GET.get('eligible') == '1'
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+
+    result_page = await search.asearch(
+        q, blood_group=blood_group, city=city, eligible=eligible,
+        after=request.GET.get('after'), before=request.GET.get('before'), page=page,
+    )
+    return render(request, 'core/search.html', {
+        'results': result_page.results,
+        'page': result_page,
+        'q': q,
+        'blood_group': blood_group,
+        'city': city,
+        'eligible': eligible,
+        'blood_groups': BLOOD_GROUP_CODES,
+    })
+
+
+def _decode_cursor(model, ordering, cursor):
+    values = decode_cursor(cursor, len(ordering))
+    return [model._meta.get_field(name.lstrip('-')).to_python(v) for name, v in zip(ordering, values)]
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get(KeysetPagination.page_size_query_param, KeysetPagination.page_size))
+    except ValueError:
+        size = KeysetPagination.page_size
+    return max(1, min(size, KeysetPagination.max_page_size))
+
+
+async def api_list(request, kind):
+    if LISTS[kind].get('replica'):
+        with use_replica():
+            return await _api_list(request, kind)
+    return await _api_list(request, kind)
+
+
+async def _api_list(request, kind):
+    spec = LISTS[kind]
+    user = await _user(request)
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    if spec.get('staff_only') and not user.is_staff:
+        return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=403)
+
+    qs = spec['model'].objects.all()
+    if 'owner' in spec and not spec['sees_all'](user):
+        qs = qs.filter(**{spec['owner']: user})
+    ordering = spec['ordering']
+    page = qs
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            page = qs.filter(rows_after(ordering, _decode_cursor(spec['model'], ordering, cursor)))
+        except (ValueError, TypeError, ValidationError):
+            return JsonResponse({'detail': 'Invalid cursor'}, status=404)
+
+    size = _page_size(request)
+    fields = spec['fields']
+    results = []
+    # one extra row tells whether there is a next page
+    async for row in page.order_by(*ordering).values(*fields)[:size + 1].aiterator(chunk_size=size + 1):
+        results.append(row)
+    data = {'next': None, 'previous': None, 'results': results[:size]}
+    if len(results) > size:
+        last = results[size - 1]
+        query = request.GET.copy()
+        query['cursor'] = encode_cursor([last[name.lstrip('-')] for name in ordering])
+        data['next'] = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+    if request.GET.get('count') == '1':
+        data['count'] = await qs.acount()
+    if 'totals' in spec:
+        data.update(await qs.aaggregate(**spec['totals']))
+    return JsonResponse(data)
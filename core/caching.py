@@ -0,0 +1,133 @@
+"""
+Read-through caching for the read-heavy pages and API lists.
+
+Keys are grouped into namespaces. Each namespace has a version number stored
+in the cache itself and baked into every key, so invalidate('inventory')
+drops every variant of every inventory entry (all roles, all cursors) with a
+single increment, across processes when the backend is shared. Keys vary by
+the role of the requesting user, never by the user themselves.
+
+Hit/miss counters are kept per process and per namespace; see cache_stats().
+"""
+from collections import Counter
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import transaction
+
+_counters = Counter()
+_counters_lock = Lock()
+
+
+def _count(namespace, outcome):
+    with _counters_lock:
+        _counters[(namespace, outcome)] += 1
+
+
+def cache_stats():
+    with _counters_lock:
+        snapshot = dict(_counters)
+    result = {}
+    for (namespace, outcome), value in snapshot.items():
+        result.setdefault(namespace, {'hits': 0, 'misses': 0})[outcome] = value
+    for counts in result.values():
+        total = counts['hits'] + counts['misses']
+        counts['hit_ratio'] = round(counts['hits'] / total, 3) if total else None
+    return result
+
+
+def role_for(user):
+    if user is None or not user.is_authenticated:
+        return 'anon'
+    if user.is_staff:
+        return 'staff'
+    return user.role
+
+
+def _version_key(namespace):
+    return f'ns:{namespace}'
+
+
+def namespace_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), 1, timeout=None)
+        version = cache.get(_version_key(namespace), 1)
+    return version
+
+
+def invalidate(*namespaces):
+    for namespace in namespaces:
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            cache.set(_version_key(namespace), 2, timeout=None)
+
+
+def invalidate_on_commit(*namespaces):
+    transaction.on_commit(lambda: invalidate(*namespaces))
+
+
+def _key(namespace, version, parts, user):
+    joined = ':'.join(str(p) for p in parts)
+    return f'{namespace}:v{version}:{role_for(user)}:{joined}'
+
+
+def make_key(namespace, parts, user=None):
+    return _key(namespace, namespace_version(namespace), parts, user)
+
+
+def cached(namespace, parts, builder, user=None, timeout=None):
+    """Return the cached value for (namespace, parts, role), building it on a miss."""
+    key = make_key(namespace, parts, user)
+    value = cache.get(key)
+    if value is not None:
+        _count(namespace, 'hits')
+        return value
+    _count(namespace, 'misses')
+    value = builder()
+    if timeout is None:
+        cache.set(key, value)
+    else:
+        cache.set(key, value, timeout)
+    return value
+
+
+async def anamespace_version(namespace):
+    version = await cache.aget(_version_key(namespace))
+    if version is None:
+        await cache.aadd(_version_key(namespace), 1, timeout=None)
+        version = await cache.aget(_version_key(namespace), 1)
+    return version
+
+
+async def acached(namespace, parts, builder, user=None, timeout=None):
+    """cached() for async views; `builder` is a coroutine function."""
+    key = _key(namespace, await anamespace_version(namespace), parts, user)
+    value = await cache.aget(key)
+    if value is not None:
+        _count(namespace, 'hits')
+        return value
+    _count(namespace, 'misses')
+    value = await builder()
+    if timeout is None:
+        await cache.aset(key, value)
+    else:
+        await cache.aset(key, value, timeout)
+    return value
+
+
+class CachedListMixin:
+    """Cache the serialized list response of a viewset, per role and full URL (cursor included)."""
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        from rest_framework.response import Response
+
+        data = cached(
+            self.cache_namespace,
+            [request.get_full_path()],
+            lambda: super(CachedListMixin, self).list(request, *args, **kwargs).data,
+            user=request.user,
+        )
+        return Response(data)
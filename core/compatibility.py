@@ -0,0 +1,73 @@
+"""
+Red cell compatibility between BLOOD_GROUPS.
+
+The donor -> recipient matrix and each recipient's ranked list of source
+groups are computed once at import time, so a compatibility check is a dict
+lookup and the database only has to be asked about stock.
+"""
+from django.db.models import Count, Sum
+
+from .models import BLOOD_GROUPS, BloodInventory
+
+GROUPS = [code for code, _ in BLOOD_GROUPS]
+
+_ABO_RECIPIENTS = {
+    'O': {'O', 'A', 'B', 'AB'},
+    'A': {'A', 'AB'},
+    'B': {'B', 'AB'},
+    'AB': {'AB'},
+}
+
+
+def _can_give(donor, recipient):
+    donor_abo, donor_rh = donor[:-1], donor[-1]
+    recipient_abo, recipient_rh = recipient[:-1], recipient[-1]
+    return recipient_abo in _ABO_RECIPIENTS[donor_abo] and (donor_rh == '-' or recipient_rh == '+')
+
+
+# donor group -> groups that can receive it
+DONOR_TO_RECIPIENTS = {
+    donor: frozenset(r for r in GROUPS if _can_give(donor, r)) for donor in GROUPS
+}
+
+# recipient group -> compatible donor groups, best first: the exact group,
+# then groups that serve the fewest other recipients (Rh+ before the scarcer
+# Rh- on ties), so O- always comes last
+RECIPIENT_SOURCES = {
+    recipient: tuple(sorted(
+        (d for d in GROUPS if recipient in DONOR_TO_RECIPIENTS[d]),
+        key=lambda d: (d != recipient, len(DONOR_TO_RECIPIENTS[d]), d.endswith('-'), GROUPS.index(d)),
+    ))
+    for recipient in GROUPS
+}
+
+
+def can_receive(recipient, donor):
+    return recipient in DONOR_TO_RECIPIENTS.get(donor, ())
+
+
+def source_groups(recipient):
+    return RECIPIENT_SOURCES.get(recipient, ())
+
+
+def candidate_sources(recipient):
+    """Stock per compatible group, best first, from one grouped query."""
+    sources = source_groups(recipient)
+    totals = {
+        row['blood_group']: row
+        for row in BloodInventory.objects.filter(blood_group__in=sources, units__gt=0)
+        .order_by()
+        .values('blood_group')
+        .annotate(total_units=Sum('units'), banks=Count('id'))
+    }
+    return [
+        {
+            'blood_group': group,
+            'rank': rank,
+            'exact': group == recipient,
+            'total_units': totals[group]['total_units'],
+            'banks': totals[group]['banks'],
+        }
+        for rank, group in enumerate(sources) if group in totals
+    ]
+
@@ -0,0 +1,108 @@
+"""
+Donor eligibility.
+
+DonorProfile.next_eligible_on is kept equal to the latest end of a deferral:
+each donation defers its donor by the interval of its kind
+(settings.DONATION_DEFERRAL_DAYS), so a plasma donation after a double red
+cell one does not shorten the wait. Donors who never gave have
+ELIGIBLE_ALWAYS. History rows of kind ISSUED record blood given to a
+requester and are ignored. Recording donations moves both columns forward
+with a set-based UPDATE per distinct date pair; rebuild() recomputes them in
+batches from DonationHistory. Filtering on eligibility is then an index
+range scan.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import ELIGIBLE_ALWAYS, ISSUED, DonationHistory, DonorProfile
+
+WHOLE_BLOOD = 'whole_blood'
+DEFAULT_DEFERRAL_DAYS = {WHOLE_BLOOD: 56, 'double_red': 112, 'plasma': 28, 'platelets': 7}
+
+
+def deferral(kind=WHOLE_BLOOD):
+    days = getattr(settings, 'DONATION_DEFERRAL_DAYS', {})
+    return timedelta(days=days.get(kind, DEFAULT_DEFERRAL_DAYS[kind]))
+
+
+def next_eligible_date(last_donated, kind=WHOLE_BLOOD):
+    if last_donated is None:
+        return ELIGIBLE_ALWAYS
+    return last_donated + deferral(kind)
+
+
+def eligible_q(on=None):
+    return Q(next_eligible_on__lte=on or timezone.localdate())
+
+
+def record_donations(donations):
+    """
+    Move donors' last_donated and next_eligible_on forward. `donations` maps
+    user id -> (date, next eligible date); neither column ever moves back.
+    """
+    by_dates = {}
+    for user_id, dates in donations.items():
+        by_dates.setdefault(dates, []).append(user_id)
+    updated = 0
+    for (day, next_on), user_ids in by_dates.items():
+        updated += DonorProfile.objects.filter(user_id__in=user_ids).filter(
+            Q(last_donated__isnull=True) | Q(last_donated__lt=day) | Q(next_eligible_on__lt=next_on)
+        ).update(
+            last_donated=Greatest(Coalesce('last_donated', Value(day)), Value(day)),
+            next_eligible_on=Greatest('next_eligible_on', Value(next_on)),
+        )
+    return updated
+
+
+def record_history(entries):
+    """record_donations() for freshly created DonationHistory rows."""
+    donations = {}
+    for entry in entries:
+        if entry.kind == ISSUED:
+            continue
+        day = timezone.localdate(entry.donated_at) if entry.donated_at else timezone.localdate()
+        last, next_on = donations.get(entry.donor_id, (ELIGIBLE_ALWAYS, ELIGIBLE_ALWAYS))
+        donations[entry.donor_id] = (max(last, day), max(next_on, next_eligible_date(day, entry.kind)))
+    return record_donations(donations)
+
+
+def rebuild(batch_size=2000):
+    """Recompute last_donated/next_eligible_on for every profile; returns rows changed."""
+    changed_total = 0
+    last_id = 0
+    while True:
+        batch = list(
+            DonorProfile.objects.filter(id__gt=last_id).order_by('id')
+            .only('id', 'user_id', 'last_donated', 'next_eligible_on')[:batch_size]
+        )
+        if not batch:
+            return changed_total
+        latest = {}
+        for donor_id, kind, donated_at in (
+            DonationHistory.objects.filter(donor_id__in=[p.user_id for p in batch]).exclude(kind=ISSUED)
+            .order_by()
+            .values('donor_id', 'kind')
+            .annotate(last=Max('donated_at'))
+            .values_list('donor_id', 'kind', 'last')
+        ):
+            latest.setdefault(donor_id, []).append((kind, timezone.localdate(donated_at)))
+        changed = []
+        for profile in batch:
+            donations = latest.get(profile.user_id, ())
+            last = max((day for _, day in donations), default=None)
+            next_on = max((next_eligible_date(day, kind) for kind, day in donations), default=ELIGIBLE_ALWAYS)
+            # a later date entered by hand has no history row; treat it as whole blood
+            if profile.last_donated and (last is None or profile.last_donated > last):
+                last = profile.last_donated
+                next_on = max(next_on, next_eligible_date(last))
+            if (last, next_on) != (profile.last_donated, profile.next_eligible_on):
+                profile.last_donated = last
+                profile.next_eligible_on = next_on
+                changed.append(profile)
+        DonorProfile.objects.bulk_update(changed, ['last_donated', 'next_eligible_on'])
+        changed_total += len(changed)
+        last_id = batch[-1].id
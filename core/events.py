@@ -0,0 +1,147 @@
+"""
+Live updates for the admin pages.
+
+Code that changes stock or request status calls publish_on_commit(); once
+the transaction commits, the broker hands the event to every open
+server-sent-event stream subscribed to that channel (see
+views.admin_events). An idle stream is a parked coroutine waiting on its
+queue, so open dashboards cost no queries until something changes.
+
+LocalBroker delivers within one process. Set BLOODMGMT_EVENT_BROKER=redis
+when several processes serve the site or when the task worker should reach
+browsers too.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+INVENTORY = 'inventory'
+REQUESTS = 'requests'
+CHANNELS = (INVENTORY, REQUESTS)
+
+# events queued for a client that stopped reading are dropped past this
+QUEUE_SIZE = 1000
+
+
+class _LocalSubscription:
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = set(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def deliver(self, channel, data):
+        # called from whichever thread published
+        self.loop.call_soon_threadsafe(self._put, (channel, data))
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+    async def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Fan events out to subscribers in this process, across threads and event loops."""
+
+    def __init__(self, **options):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        subscription = _LocalSubscription(self, channels)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, channel, data):
+        with self._lock:
+            subscribers = [s for s in self._subscribers if channel in s.channels]
+        for subscription in subscribers:
+            try:
+                subscription.deliver(channel, data)
+            except RuntimeError:
+                # its event loop has closed
+                self.unsubscribe(subscription)
+
+
+class _RedisSubscription:
+    def __init__(self, url, prefix, channels):
+        import redis.asyncio
+
+        self.prefix = prefix
+        self.client = redis.asyncio.Redis.from_url(url)
+        self.pubsub = self.client.pubsub()
+        self.channels = [prefix + c for c in channels]
+        self.subscribed = False
+
+    async def get(self):
+        if not self.subscribed:
+            await self.pubsub.subscribe(*self.channels)
+            self.subscribed = True
+        while True:
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            if message is not None:
+                return message['channel'].decode()[len(self.prefix):], json.loads(message['data'])
+
+    async def close(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class RedisBroker:
+    """Relay events through Redis pub/sub so every process sees them."""
+
+    def __init__(self, url='redis://127.0.0.1:6379/2', prefix='bloodmgmt:events:'):
+        import redis
+
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+
+    def subscribe(self, channels):
+        return _RedisSubscription(self.url, self.prefix, channels)
+
+    def publish(self, channel, data):
+        self.client.publish(self.prefix + channel, json.dumps(data))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = getattr(settings, 'EVENT_BROKER', {})
+                backend = import_string(config.get('BACKEND', 'core.events.LocalBroker'))
+                _broker = backend(**config.get('OPTIONS', {}))
+    return _broker
+
+
+def publish(channel, data):
+    get_broker().publish(channel, data)
+
+
+def publish_on_commit(channel, data):
+    transaction.on_commit(lambda: publish(channel, data))
+
+
+def format_sse(channel, data):
+    return f'event: {channel}\ndata: {json.dumps(data)}\n\n'
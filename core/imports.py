@@ -0,0 +1,300 @@
+"""
+Bulk import of donors and blood banks from CSV, NDJSON or JSON.
+
+Records are read and validated one at a time and written in chunks with
+bulk_create, one transaction per chunk. bulk_create sends no post_save
+signals, so the work those signals do per row (donor profile, inventory rows,
+search tokens, dashboard counters, cache eviction) is done here once per
+chunk instead. Password hashing, the dominant cost for donors, can run in a
+process pool; the import_data command uses one, web requests hash inline.
+
+A record that cannot be parsed or is not an object is reported against its
+line like any other invalid record, and the rest of the file is still
+imported. Only a failure before anything was written (a JSON file that is not
+a list, an unknown format) raises ValueError.
+"""
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.utils.dateparse import parse_date
+
+from . import caching, eligibility, inventory, search, stats
+from .models import BLOOD_GROUP_CODES, BloodBank, DonorProfile, User
+
+BATCH_SIZE = 1000
+MAX_ERRORS = 1000
+# below this many passwords a pool costs more than it saves
+POOL_THRESHOLD = 50
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+
+    def error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {'created': self.created, 'skipped': self.skipped, 'errors': self.errors}
+
+
+@dataclass
+class Unreadable:
+    """Stands in for a record that could not be parsed."""
+    message: str
+
+
+def read_records(stream, fmt):
+    """
+    Yield (line, record) from a text stream without loading it whole (except
+    plain JSON arrays). An NDJSON line that is not valid JSON yields an
+    Unreadable record; a stream that breaks off (bad encoding, malformed CSV)
+    yields one for the line it stopped at and ends.
+    """
+    if fmt == 'json':
+        data = json.load(stream)
+        if not isinstance(data, list):
+            raise ValueError('A JSON import must be a list of records.')
+        yield from enumerate(data, start=1)
+        return
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError(f'Unknown import format {fmt!r}')
+    line = 0
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(stream)
+            for record in reader:
+                line = reader.line_num
+                yield line, record
+        else:
+            for line, text in enumerate(stream, start=1):
+                if text.strip():
+                    try:
+                        record = json.loads(text)
+                    except ValueError as exc:
+                        record = Unreadable(f'Invalid JSON: {exc}')
+                    yield line, record
+    except (UnicodeDecodeError, csv.Error) as exc:
+        yield line + 1, Unreadable(f'Could not read the rest of the file: {exc}')
+
+
+def format_for(filename, default='csv'):
+    ext = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return {'csv': 'csv', 'json': 'json', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}.get(ext, default)
+
+
+def text_stream(uploaded):
+    return io.TextIOWrapper(uploaded, encoding='utf-8-sig', newline='')
+
+
+def _check_record(record):
+    if isinstance(record, Unreadable):
+        raise ValidationError(record.message)
+    if not isinstance(record, dict):
+        raise ValidationError('Each record must be an object.')
+
+
+def _clean(record, name):
+    value = record.get(name)
+    return '' if value is None else str(value).strip()
+
+
+def _chunks(records, size):
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# -- donors -------------------------------------------------------------------
+
+def _validate_donor(record):
+    _check_record(record)
+    username = _clean(record, 'username')
+    email = _clean(record, 'email').lower()
+    if not username or not email:
+        raise ValidationError('username and email are required.')
+    validate_email(email)
+    blood_group = _clean(record, 'blood_group').upper() or None
+    if blood_group and blood_group not in BLOOD_GROUP_CODES:
+        raise ValidationError(f'Invalid blood group {blood_group!r}.')
+    last_donated = _clean(record, 'last_donated')
+    if last_donated:
+        last_donated = parse_date(last_donated)
+        if last_donated is None:
+            raise ValidationError('last_donated must be YYYY-MM-DD.')
+    return {
+        'username': username,
+        'email': email,
+        'password': _clean(record, 'password') or None,
+        'first_name': _clean(record, 'first_name'),
+        'last_name': _clean(record, 'last_name'),
+        'phone': _clean(record, 'phone'),
+        'blood_group': blood_group,
+        'city': _clean(record, 'city'),
+        'last_donated': last_donated or None,
+    }
+
+
+def _valid_donors(records, result):
+    seen_usernames, seen_emails = set(), set()
+    for line, record in records:
+        try:
+            row = _validate_donor(record)
+        except ValidationError as exc:
+            result.error(line, '; '.join(exc.messages))
+            continue
+        if row['username'] in seen_usernames or row['email'] in seen_emails:
+            result.error(line, 'Duplicate username or email in file.')
+            continue
+        seen_usernames.add(row['username'])
+        seen_emails.add(row['email'])
+        yield line, row
+
+
+def _init_worker():
+    # workers started with "spawn" (macOS, Windows) begin without Django set up
+    import django
+    django.setup()
+
+
+def _hash_passwords(passwords, pool):
+    if pool is None or len(passwords) < POOL_THRESHOLD:
+        return [make_password(p) for p in passwords]
+    return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // 32)))
+
+
+def _write_donors(chunk, pool, result):
+    usernames = [row['username'] for _, row in chunk]
+    emails = [row['email'] for _, row in chunk]
+    taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    taken_emails = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+    rows = []
+    for line, row in chunk:
+        if row['username'] in taken_usernames or row['email'] in taken_emails:
+            result.error(line, 'Username or email already exists.')
+        else:
+            rows.append((line, row))
+    if not rows:
+        return
+
+    hashes = _hash_passwords([row['password'] for _, row in rows], pool)
+    try:
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    username=row['username'], email=row['email'], password=hashed,
+                    first_name=row['first_name'], last_name=row['last_name'], role='donor',
+                )
+                for (_, row), hashed in zip(rows, hashes)
+            ])
+            profiles = DonorProfile.objects.bulk_create([
+                DonorProfile(
+                    user_id=user.pk, phone=row['phone'], blood_group=row['blood_group'],
+                    city=row['city'], city_key=search.normalize(row['city']),
+                    last_donated=row['last_donated'],
+                    next_eligible_on=eligibility.next_eligible_date(row['last_donated']),
+                )
+                for user, (_, row) in zip(users, rows)
+            ])
+            search.index_profiles(profiles)
+            stats.bump(stats.DONORS, len(users))
+    except IntegrityError as exc:
+        for line, _ in rows:
+            result.error(line, f'Not imported: {exc}')
+        return
+    result.created += len(users)
+
+
+def import_donors(records, batch_size=BATCH_SIZE, workers=1, dry_run=False):
+    """Create donor users and profiles from (line, dict) records; `workers` > 1 hashes in a process pool."""
+    result = ImportResult()
+    valid = _valid_donors(records, result)
+    if dry_run:
+        result.created = sum(1 for _ in valid)
+        return result
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+    try:
+        for chunk in _chunks(valid, batch_size):
+            _write_donors(chunk, pool, result)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return result
+
+
+# -- blood banks --------------------------------------------------------------
+
+def _validate_bank(record):
+    _check_record(record)
+    name = _clean(record, 'name')
+    if not name:
+        raise ValidationError('name is required.')
+    units = {}
+    for group in BLOOD_GROUP_CODES:
+        raw = _clean(record, group)
+        if not raw:
+            continue
+        try:
+            units[group] = int(raw)
+        except ValueError:
+            raise ValidationError(f'Units for {group} must be an integer.')
+        if units[group] < 0:
+            raise ValidationError(f'Units for {group} cannot be negative.')
+    return {
+        'name': name,
+        'city': _clean(record, 'city') or None,
+        'address': _clean(record, 'address'),
+        'contact': _clean(record, 'contact'),
+        'units': units,
+    }
+
+
+def _valid_banks(records, result):
+    for line, record in records:
+        try:
+            yield line, _validate_bank(record)
+        except ValidationError as exc:
+            result.error(line, '; '.join(exc.messages))
+
+
+def _write_banks(chunk, result):
+    with transaction.atomic():
+        banks = BloodBank.objects.bulk_create([
+            BloodBank(name=row['name'], city=row['city'], address=row['address'], contact=row['contact'])
+            for _, row in chunk
+        ])
+        inventory.seed_bank_inventory(
+            banks, overrides={bank.pk: row['units'] for bank, (_, row) in zip(banks, chunk)},
+        )
+        caching.invalidate_on_commit('banks')
+    result.created += len(banks)
+
+
+def import_banks(records, batch_size=BATCH_SIZE, dry_run=False):
+    """Create blood banks and their inventory rows from (line, dict) records."""
+    result = ImportResult()
+    valid = _valid_banks(records, result)
+    if dry_run:
+        result.created = sum(1 for _ in valid)
+        return result
+    for chunk in _chunks(valid, batch_size):
+        _write_banks(chunk, result)
+    return result
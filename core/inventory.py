@@ -0,0 +1,217 @@
+"""
+Inventory writes.
+
+Every change to BloodInventory.units goes through here as a single UPDATE
+evaluated by the database (units = units + delta), guarded by a WHERE clause
+so a decrement can never take stock below zero. Success is read from the
+rowcount, so no row is read-modified-written in Python and no lock is needed
+for correctness, including on SQLite where select_for_update is a no-op.
+
+The units live in BloodLot rows and BloodInventory.units is kept equal to
+their sum in the same transaction, so reads of the total stay a single row.
+Stock leaves lots earliest expiry first; the inventory UPDATE runs first and
+holds the row's lock, so concurrent writers never consume the same lot.
+Stock added without dates counts as collected today and expires after
+settings.BLOOD_SHELF_LIFE_DAYS.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import caching, events, metrics, stats
+from .models import BLOOD_GROUP_CODES, BloodInventory, BloodLot
+
+
+def shelf_life():
+    return timedelta(days=getattr(settings, 'BLOOD_SHELF_LIFE_DAYS', 42))
+
+
+def fifo_order():
+    """Lot ordering for consumption: earliest expiry first, undated stock last."""
+    return [F('expires_on').asc(nulls_last=True), 'id']
+
+
+def _new_lot(inventory_id, units, expires_on=None, collected_on=None):
+    collected_on = collected_on or timezone.localdate()
+    return BloodLot(
+        inventory_id=inventory_id, units=units, units_left=units,
+        collected_on=collected_on, expires_on=expires_on or collected_on + shelf_life(),
+    )
+
+
+def consume_lots(inventory_id, units):
+    """
+    Take `units` from a row's lots, earliest expiry first, with at most two
+    UPDATEs. Call with the row's units already decremented in the current
+    transaction. Returns the units taken from lots.
+    """
+    emptied = []
+    partial = None
+    remaining = units
+    lots = (
+        BloodLot.objects.filter(inventory_id=inventory_id, units_left__gt=0)
+        .order_by(*fifo_order()).values_list('id', 'units_left')
+    )
+    for lot_id, left in lots.iterator(chunk_size=50):
+        if left <= remaining:
+            emptied.append(lot_id)
+            remaining -= left
+        else:
+            partial = (lot_id, remaining)
+            remaining = 0
+        if not remaining:
+            break
+    if emptied:
+        BloodLot.objects.filter(id__in=emptied).update(units_left=0)
+    if partial:
+        BloodLot.objects.filter(pk=partial[0]).update(units_left=F('units_left') - partial[1])
+    return units - remaining
+
+
+def count_on_commit(kind, deltas):
+    transaction.on_commit(lambda: metrics.count_inventory(kind, deltas))
+
+
+def _changed(inventory_id, blood_group, delta, kind):
+    stats.bump_units({blood_group: delta})
+    count_on_commit(kind, {blood_group: delta})
+    caching.invalidate_on_commit('inventory')
+    events.publish_on_commit(events.INVENTORY, {
+        'type': 'delta', 'id': inventory_id, 'blood_group': blood_group, 'delta': delta,
+    })
+
+
+def adjust_units(inventory_id, delta, blood_group=None):
+    """
+    Add `delta` (may be negative) to a row; False if there was not enough
+    stock. Pass the row's blood_group when known to save a lookup for the
+    dashboard counters.
+    """
+    with transaction.atomic():
+        qs = BloodInventory.objects.filter(pk=inventory_id)
+        if delta < 0:
+            qs = qs.filter(units__gte=-delta)
+        if qs.update(units=F('units') + delta) != 1:
+            return False
+        if delta < 0:
+            consume_lots(inventory_id, -delta)
+        elif delta > 0:
+            _new_lot(inventory_id, delta).save()
+        if blood_group is None:
+            blood_group = BloodInventory.objects.values_list('blood_group', flat=True).get(pk=inventory_id)
+        _changed(inventory_id, blood_group, delta, 'adjust')
+    return True
+
+
+def receive_lot(inventory, units, expires_on=None, collected_on=None):
+    """Add a collection of `units` to an inventory row; returns the new BloodLot."""
+    with transaction.atomic():
+        BloodInventory.objects.filter(pk=inventory.pk).update(units=F('units') + units)
+        lot = _new_lot(inventory.pk, units, expires_on, collected_on)
+        lot.save()
+        _changed(inventory.pk, inventory.blood_group, units, 'receive')
+    inventory.units += units
+    return lot
+
+
+def _sync_lots(inventory_id, units):
+    """Make a row's lots add up to `units` after its total was overwritten."""
+    total = BloodLot.objects.filter(inventory_id=inventory_id).aggregate(total=Sum('units_left'))['total'] or 0
+    if units > total:
+        _new_lot(inventory_id, units - total).save()
+    elif units < total:
+        consume_lots(inventory_id, total - units)
+
+
+def set_units(inventory, units, expected=None):
+    """
+    Overwrite the unit count. When `expected` is given the write only happens
+    if the row still holds that value (compare-and-set), so an admin editing a
+    stale page cannot silently undo a concurrent approval.
+    """
+    with transaction.atomic():
+        qs = BloodInventory.objects.filter(pk=inventory.pk)
+        if expected is not None:
+            qs = qs.filter(units=expected)
+        if qs.update(units=units) != 1:
+            return False
+        _sync_lots(inventory.pk, units)
+        if expected is not None:
+            stats.bump_units({inventory.blood_group: units - expected})
+            count_on_commit('set', {inventory.blood_group: units - expected})
+        else:
+            stats.refresh_groups(inventory.blood_group)
+            count_on_commit('set', {})
+    inventory.units = units
+    caching.invalidate_on_commit('inventory')
+    events.publish_on_commit(events.INVENTORY, {
+        'type': 'set', 'id': inventory.pk, 'blood_group': inventory.blood_group, 'units': units,
+    })
+    return True
+
+
+def save_changes(instance, data):
+    """Apply `data` to a model instance and save only the fields that changed."""
+    changed = [name for name, value in data.items() if getattr(instance, name) != value]
+    old_group = getattr(instance, 'blood_group', None)
+    for name in changed:
+        setattr(instance, name, data[name])
+    if changed:
+        instance.save(update_fields=changed)
+    if 'blood_group' in changed and isinstance(instance, BloodInventory):
+        # post_save only refreshes the row's new group
+        stats.refresh_groups(old_group)
+    return changed
+
+
+def default_units():
+    return getattr(settings, 'DEFAULT_INVENTORY_UNITS', 10)
+
+
+def seed_bank_inventory(banks, units=None, overrides=None):
+    """
+    Create the missing inventory row of every blood group for each bank in
+    one bulk_create. Each row starts at `units` (default:
+    settings.DEFAULT_INVENTORY_UNITS) unless `overrides` gives
+    {bank_pk: {blood_group: units}}; the stock is held in one fresh lot.
+    """
+    units = default_units() if units is None else units
+    overrides = overrides or {}
+    bank_ids = [bank.pk for bank in banks]
+    existing = set(
+        BloodInventory.objects.filter(blood_bank_id__in=bank_ids).values_list('blood_bank_id', 'blood_group')
+    )
+    rows = [
+        BloodInventory(
+            blood_bank_id=bank_id, blood_group=group,
+            units=overrides.get(bank_id, {}).get(group, units),
+        )
+        for bank_id in bank_ids
+        for group in BLOOD_GROUP_CODES
+        if (bank_id, group) not in existing
+    ]
+    if not rows:
+        return 0
+    BloodInventory.objects.bulk_create(rows, ignore_conflicts=True)
+    stocked = {(row.blood_bank_id, row.blood_group): row.units for row in rows if row.units}
+    if stocked:
+        # ignore_conflicts leaves the pks unset
+        created = BloodInventory.objects.filter(blood_bank_id__in=bank_ids).order_by().values_list(
+            'id', 'blood_bank_id', 'blood_group',
+        )
+        BloodLot.objects.bulk_create([
+            _new_lot(pk, stocked[(bank_id, group)])
+            for pk, bank_id, group in created
+            if (bank_id, group) in stocked
+        ])
+    totals = {}
+    for row in rows:
+        totals[row.blood_group] = totals.get(row.blood_group, 0) + row.units
+    stats.bump_units(totals)
+    count_on_commit('seed', totals)
+    caching.invalidate_on_commit('inventory')
+    events.publish_on_commit(events.INVENTORY, {'type': 'seeded', 'banks': bank_ids})
+    return len(rows)
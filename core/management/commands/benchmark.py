@@ -0,0 +1,226 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import local
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from core.models import BloodBank, DonationHistory, DonationRequest, DonorProfile, User
+
+from .benchmark_asgi import HOST, percentile
+
+READS = [
+    ('dashboard', '/dashboard/'),
+    ('search_donors', '/search_donors/?blood_group=O%2B&city=Dhaka&eligible=1'),
+    ('admin_requests', '/custom_admin/requests/'),
+    ('admin_donors', '/custom_admin/donors/'),
+    ('manage_inventory', '/custom_admin/inventory/'),
+    ('api_donors', '/api/donors/?blood_group=O%2B&eligible=1'),
+    ('api_bloodbanks', '/api/bloodbanks/'),
+    ('api_inventory', '/api/inventory/'),
+    ('api_requests', '/api/requests/'),
+    ('api_history', '/api/history/'),
+    ('api_analytics_timeseries', '/api/analytics/timeseries/?metric=donated_units&interval=week'),
+    ('api_analytics_top', '/api/analytics/top/?metric=requested_units&by=city'),
+    ('metrics', '/metrics'),
+]
+# decided on a fresh pending request each time, inside a transaction that is rolled back
+WRITES = [
+    ('api_approve', '/api/requests/{pk}/approve/'),
+    ('api_reject', '/api/requests/{pk}/reject/'),
+]
+
+
+def default_baseline():
+    return os.path.join(settings.BASE_DIR, 'benchmark_baseline.json')
+
+
+def _result(latencies, errors, elapsed, queries):
+    ordered = sorted(latencies) or [0]
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'queries': queries,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(ordered, 50), 2),
+        'p95_ms': round(percentile(ordered, 95), 2),
+        'p99_ms': round(percentile(ordered, 99), 2),
+    }
+
+
+def _data_size():
+    return {
+        'users': User.objects.count(),
+        'donors': DonorProfile.objects.count(),
+        'banks': BloodBank.objects.count(),
+        'requests': DonationRequest.objects.count(),
+        'history': DonationHistory.objects.count(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure query counts, latency percentiles and throughput of the main views and API endpoints '
+        'in process (no network), and compare them with a stored baseline. Approve/reject requests '
+        'are rolled back. Use generate_data first for realistic volumes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='bench_admin', help='Staff username to make the requests as.')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Threads for the read endpoints.')
+        parser.add_argument('--only', action='append', metavar='NAME', help='Endpoint to run; repeatable.')
+        parser.add_argument('--no-writes', action='store_true', help='Skip the approve/reject endpoints.')
+        parser.add_argument('--baseline', help='Baseline JSON file (default: benchmark_baseline.json in BASE_DIR).')
+        parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed median latency increase over the baseline, as a fraction.')
+        parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                            help='Ignore median latency increases smaller than this (timer noise).')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['user']!r}; generate_data creates one.")
+        if not user.is_staff:
+            raise CommandError(f'{user.username!r} must be a staff user.')
+        if HOST not in settings.ALLOWED_HOSTS and not settings.DEBUG and '*' not in settings.ALLOWED_HOSTS:
+            raise CommandError(f'Add {HOST!r} to ALLOWED_HOSTS to run the benchmark.')
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive.')
+        names = {name for name, _ in READS + WRITES}
+        unknown = set(options['only'] or ()) - names
+        if unknown:
+            raise CommandError(
+                f"Unknown endpoint(s) {', '.join(sorted(unknown))}; choose from {', '.join(sorted(names))}."
+            )
+
+        self.client = Client(HTTP_HOST=HOST)
+        self.client.force_login(user)
+        self.total = options['requests']
+        self.concurrency = options['concurrency']
+        wanted = lambda name: not options['only'] or name in options['only']
+
+        results = {}
+        self.stdout.write(
+            f"{'endpoint':<26} {'queries':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}"
+        )
+        for name, path in READS:
+            if wanted(name):
+                results[name] = self.report(name, self.run_read(path))
+        if not options['no_writes']:
+            for name, path in WRITES:
+                if wanted(name):
+                    result = self.run_write(path)
+                    if result is None:
+                        self.stdout.write(f'{name:<26} skipped: needs {self.total + 2} pending requests')
+                    else:
+                        results[name] = self.report(name, result)
+
+        path = options['baseline'] or default_baseline()
+        run = {'created_at': datetime.now().isoformat(timespec='seconds'), 'data': _data_size(), 'results': results}
+        if options['save_baseline']:
+            with open(path, 'w') as fh:
+                json.dump(run, fh, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'Saved the baseline to {path}.'))
+        elif os.path.exists(path):
+            self.compare(path, run, options['tolerance'], options['min_delta_ms'])
+        elif options['baseline']:
+            raise CommandError(f'No baseline at {path}.')
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<26} {result['queries']:>7} {result['rps']:>8.1f} {result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>6}"
+        )
+        return result
+
+    def count_queries(self, method, path):
+        with CaptureQueriesContext(connection) as captured:
+            getattr(self.client, method)(path)
+        return len(captured)
+
+    def run_read(self, path):
+        # the first request fills the caches; count the queries of a warm one
+        self.client.get(path)
+        queries = self.count_queries('get', path)
+        clients = local()
+
+        def one(_):
+            if not hasattr(clients, 'client'):
+                clients.client = Client(HTTP_HOST=HOST)
+                clients.client.cookies = self.client.cookies
+            start = time.perf_counter()
+            status = clients.client.get(path).status_code
+            return time.perf_counter() - start, status
+
+        started = time.perf_counter()
+        if self.concurrency == 1:
+            outcomes = [one(i) for i in range(self.total)]
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                outcomes = list(pool.map(one, range(self.total)))
+        elapsed = time.perf_counter() - started
+        return _result([t for t, _ in outcomes], sum(s >= 300 for _, s in outcomes), elapsed, queries)
+
+    def run_write(self, path):
+        pending = list(
+            DonationRequest.objects.filter(status='pending').order_by('id')
+            .values_list('id', flat=True)[:self.total + 2]
+        )
+        if len(pending) < self.total + 2:
+            return None
+        latencies = []
+        errors = 0
+        with transaction.atomic():
+            self.client.post(path.format(pk=pending[0]))
+            queries = self.count_queries('post', path.format(pk=pending[1]))
+            started = time.perf_counter()
+            for pk in pending[2:]:
+                start = time.perf_counter()
+                # a 400 for lack of stock is a valid outcome, not an error
+                status = self.client.post(path.format(pk=pk)).status_code
+                latencies.append(time.perf_counter() - start)
+                errors += status >= 300 and status != 400
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return _result(latencies, errors, elapsed, queries)
+
+    def compare(self, path, run, tolerance, min_delta_ms):
+        with open(path) as fh:
+            baseline = json.load(fh)
+        self.stdout.write(f"\nCompared with the baseline of {baseline.get('created_at', '?')} ({path}):")
+        if baseline.get('data') != run['data']:
+            self.stdout.write(self.style.WARNING(
+                f"Data sizes differ (baseline {baseline.get('data')}, now {run['data']}); expect drift."
+            ))
+        regressions = []
+        for name, result in run['results'].items():
+            before = baseline.get('results', {}).get(name)
+            if before is None:
+                self.stdout.write(f'{name:<26} new')
+                continue
+            change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0
+            problems = []
+            if result['queries'] > before['queries']:
+                problems.append(f"queries {before['queries']} -> {result['queries']}")
+            if change > tolerance and result['p50_ms'] - before['p50_ms'] >= min_delta_ms:
+                problems.append(f"p50 {before['p50_ms']:.1f} -> {result['p50_ms']:.1f} ms")
+            if result['errors'] > before['errors']:
+                problems.append(f"errors {before['errors']} -> {result['errors']}")
+            line = f'{name:<26} p50 {change:+.0%}, queries {result["queries"] - before["queries"]:+d}'
+            if problems:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(f"{line}  REGRESSED: {'; '.join(problems)}"))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(f"{len(regressions)} endpoint(s) regressed: {', '.join(regressions)}.")
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
@@ -0,0 +1,116 @@
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import local
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from core.models import User
+
+# (sync view under WSGI, async twin under ASGI)
+DEFAULT_PAIRS = [
+    ('/dashboard/', '/async/dashboard/'),
+    ('/search_donors/?blood_group=A%2B&eligible=1', '/async/search_donors/?blood_group=A%2B&eligible=1'),
+    ('/api/inventory/', '/async/api/inventory/'),
+    ('/api/requests/', '/async/api/requests/'),
+]
+HOST = 'localhost'
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of sorted latencies in seconds, in milliseconds."""
+    return ordered[max(0, math.ceil(len(ordered) * pct / 100) - 1)] * 1000
+
+
+def _summary(mode, path, latencies, errors, elapsed):
+    ordered = sorted(latencies) or [0]
+    return {
+        'mode': mode,
+        'path': path,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': percentile(ordered, 50),
+        'p95_ms': percentile(ordered, 95),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent-request throughput of the sync views under WSGI with their async '
+        'twins under ASGI, in process (no network). Reads only, but logging in as --user '
+        'stores one session row.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username to make the requests as.')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=400, help='Requests per path and mode.')
+        parser.add_argument('--pair', nargs=2, action='append', metavar=('WSGI_PATH', 'ASGI_PATH'),
+                            help='Paths to compare; repeatable. Defaults to the dashboard, search and API lists.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['user']!r}.")
+        if HOST not in settings.ALLOWED_HOSTS and not settings.DEBUG and '*' not in settings.ALLOWED_HOSTS:
+            raise CommandError(f'Add {HOST!r} to ALLOWED_HOSTS to run the benchmark.')
+
+        login = Client(HTTP_HOST=HOST)
+        login.force_login(user)
+        self.cookies = login.cookies
+        self.concurrency = options['concurrency']
+        self.total = options['requests']
+
+        self.stdout.write(f"{'mode':<6} {'path':<55} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+        for wsgi_path, asgi_path in options['pair'] or DEFAULT_PAIRS:
+            for result in (self.run_wsgi(wsgi_path), asyncio.run(self.run_asgi(asgi_path))):
+                self.stdout.write(
+                    f"{result['mode']:<6} {result['path']:<55} {result['rps']:>9.1f} "
+                    f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['errors']:>7}"
+                )
+
+    def run_wsgi(self, path):
+        clients = local()
+
+        def one(_):
+            if not hasattr(clients, 'client'):
+                clients.client = Client(HTTP_HOST=HOST)
+                clients.client.cookies = self.cookies
+            start = time.perf_counter()
+            status = clients.client.get(path).status_code
+            return time.perf_counter() - start, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            outcomes = list(pool.map(one, range(self.total)))
+        elapsed = time.perf_counter() - started
+        return _summary('wsgi', path, [t for t, _ in outcomes], sum(s >= 400 for _, s in outcomes), elapsed)
+
+    async def run_asgi(self, path):
+        client = AsyncClient(headers={'host': HOST})
+        client.cookies = self.cookies
+        gate = asyncio.Semaphore(self.concurrency)
+
+        async def one():
+            async with gate:
+                start = time.perf_counter()
+                status = (await client.get(path)).status_code
+                return time.perf_counter() - start, status
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*[one() for _ in range(self.total)])
+        elapsed = time.perf_counter() - started
+        # async ORM calls ran on the shared sync thread; release its connection
+        await sync_to_async(_close_connections)()
+        return _summary('asgi', path, [t for t, _ in outcomes], sum(s >= 400 for _, s in outcomes), elapsed)
+
+
+def _close_connections():
+    from django.db import connections
+    connections.close_all()
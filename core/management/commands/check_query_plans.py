@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.queryplans import HOT_QUERYSETS, check_hot_querysets
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the hot querysets and fail if any of them does a full table scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        failures = check_hot_querysets(using=options['database'])
+        for name in HOT_QUERYSETS:
+            if name in failures:
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {name}: {', '.join(failures[name])}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok         {name}"))
+        if failures:
+            raise CommandError(f'{len(failures)} hot queryset(s) do a full table scan.')
@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core import exports
+
+
+def _date(value):
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CommandError(f'Invalid date {value!r}; use YYYY-MM-DD.')
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Stream donation history or requests as CSV or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--start', type=_date, help='First day to include (YYYY-MM-DD).')
+        parser.add_argument('--end', type=_date, help='Last day to include (YYYY-MM-DD).')
+        parser.add_argument('--output', help='File to write; defaults to stdout.')
+
+    def handle(self, *args, **options):
+        lines = exports.stream(options['kind'], options['format'], options['start'], options['end'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as fh:
+                fh.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
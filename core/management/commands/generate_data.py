@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import synthetic
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic donors, blood banks, requests and donation history for load '
+        'tests and benchmarks. Sizes follow --rows (about that many rows in total, 10k to 1M) unless '
+        'given one by one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Approximate total rows to create.')
+        parser.add_argument('--donors', type=int)
+        parser.add_argument('--banks', type=int)
+        parser.add_argument('--requests', type=int)
+        parser.add_argument('--history', type=int, help='Donation history rows.')
+        parser.add_argument('--days', type=int, default=730, help='Spread dates over this many past days.')
+        parser.add_argument('--seed', type=int, help='Random seed, for the same data on every run.')
+        parser.add_argument('--password', help='Password of every generated donor (default: unusable).')
+        parser.add_argument('--staff-user', default='bench_admin',
+                            help='Staff account to create (without a password) for the benchmark command.')
+        parser.add_argument('--batch-size', type=int, default=synthetic.BATCH_SIZE)
+        parser.add_argument('--force', action='store_true', help='Run even with DEBUG off.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Refusing to write synthetic data with DEBUG off; pass --force if this is intended.')
+        sizes = synthetic.Sizes.for_rows(options['rows'])
+        for name in ('donors', 'banks', 'requests', 'history'):
+            if options[name] is not None:
+                setattr(sizes, name, options[name])
+        if min(sizes.donors, sizes.banks, sizes.requests, sizes.history) < 0 or options['days'] < 0:
+            raise CommandError('Sizes and --days must not be negative.')
+
+        staff = None
+        if options['staff_user']:
+            staff, created = User.objects.get_or_create(
+                username=options['staff_user'],
+                defaults={'email': f"{options['staff_user']}@example.com", 'is_staff': True, 'role': 'admin'},
+            )
+            if created:
+                staff.set_unusable_password()
+                staff.save(update_fields=['password'])
+
+        try:
+            counts = synthetic.generate(
+                sizes, days=options['days'], seed=options['seed'], password=options['password'],
+                approver=staff, batch_size=options['batch_size'],
+                log=self.stdout.write,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['donors']} donors, {counts['banks']} banks, {counts['requests']} requests "
+            f"and {counts['history']} donations."
+        ))
@@ -0,0 +1,42 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import imports
+
+
+class Command(BaseCommand):
+    help = 'Bulk import donors or blood banks from a CSV, NDJSON or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['donors', 'banks'])
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson', 'json'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=imports.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 8),
+                            help='Password hashing processes (donors only).')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or imports.format_for(options['path'])
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as fh:
+                records = imports.read_records(fh, fmt)
+                if options['kind'] == 'donors':
+                    result = imports.import_donors(
+                        records, batch_size=options['batch_size'],
+                        workers=options['workers'], dry_run=options['dry_run'],
+                    )
+                else:
+                    result = imports.import_banks(
+                        records, batch_size=options['batch_size'], dry_run=options['dry_run'],
+                    )
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result.created} {options['kind']}, skipped {result.skipped}."
+        ))
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core import analytics
+from core.models import DonationHistory, DonationRequest
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the DailyStat rollups from DonationHistory and DonationRequest. '
+        'Defaults to everything from the oldest record up to today.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD); defaults to today.')
+        parser.add_argument('--window-days', type=int, default=31,
+                            help='Days recomputed per transaction.')
+
+    def handle(self, *args, **options):
+        end = self._date(options['end']) or timezone.localdate()
+        start = self._date(options['start']) or self._oldest()
+        if start is None:
+            self.stdout.write('Nothing to rebuild.')
+            return
+        if start > end:
+            raise CommandError('--start must not be after --end.')
+
+        rows = 0
+        step = timedelta(days=max(1, options['window_days']))
+        while start <= end:
+            window_end = min(start + step - timedelta(days=1), end)
+            rows += analytics.rebuild(start, window_end)
+            start = window_end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} daily stat rows.'))
+
+    def _date(self, value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date {value!r}; use YYYY-MM-DD.')
+        return day
+
+    def _oldest(self):
+        firsts = [
+            DonationHistory.objects.aggregate(first=Min('donated_at'))['first'],
+            DonationRequest.objects.aggregate(first=Min('created_at'))['first'],
+        ]
+        firsts = [timezone.localdate(value) for value in firsts if value]
+        return min(firsts) if firsts else None
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute every dashboard aggregate from the source tables.'
+
+    def handle(self, *args, **options):
+        stats.refresh()
+        for key, value in sorted(stats.snapshot().items()):
+            self.stdout.write(f'{key}: {value}')
+        self.stdout.write(self.style.SUCCESS('Dashboard stats rebuilt.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import eligibility
+
+
+class Command(BaseCommand):
+    help = "Recompute every donor's last_donated and next_eligible_on from DonationHistory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        changed = eligibility.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated {changed} donor profiles.'))
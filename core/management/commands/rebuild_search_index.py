@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.models import DonorProfile
+from core.search import index_profiles, normalize
+
+
+class Command(BaseCommand):
+    help = 'Recompute normalized city keys and donor search tokens in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        profiles_done = tokens_written = 0
+        while True:
+            batch = list(
+                DonorProfile.objects.filter(id__gt=last_id).order_by('id').only('id', 'city', 'city_key')[:batch_size]
+            )
+            if not batch:
+                break
+            changed = []
+            for profile in batch:
+                key = normalize(profile.city)
+                if profile.city_key != key:
+                    profile.city_key = key
+                    changed.append(profile)
+            DonorProfile.objects.bulk_update(changed, ['city_key'])
+            tokens_written += index_profiles(batch)
+            profiles_done += len(batch)
+            last_id = batch[-1].id
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {profiles_done} profiles ({tokens_written} new tokens).'
+        ))
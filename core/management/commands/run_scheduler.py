@@ -0,0 +1,52 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core import stock
+
+logger = logging.getLogger(__name__)
+
+JOBS = ('expire_lots', 'check_levels')
+
+
+class Command(BaseCommand):
+    help = 'Run the periodic stock jobs (lot expiry, low-stock alerts) until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', action='append', choices=JOBS, help='Job to run; repeatable. Defaults to all.')
+        parser.add_argument('--expiry-interval', type=int, default=3600, help='Seconds between expiry sweeps.')
+        parser.add_argument('--alert-interval', type=int, default=300, help='Seconds between low-stock checks.')
+        parser.add_argument('--batch-size', type=int, default=stock.BATCH_SIZE,
+                            help='Inventory rows per expiry transaction.')
+        parser.add_argument('--threshold', type=int, help='Overrides settings.LOW_STOCK_THRESHOLD.')
+        parser.add_argument('--once', action='store_true', help='Run each job once and exit.')
+
+    def handle(self, *args, **options):
+        jobs = {
+            'expire_lots': (options['expiry_interval'], lambda: stock.expire_lots(batch_size=options['batch_size'])),
+            'check_levels': (options['alert_interval'], lambda: stock.check_levels(threshold=options['threshold'])),
+        }
+        selected = options['job'] or JOBS
+        if any(jobs[name][0] <= 0 for name in selected):
+            raise CommandError('Intervals must be positive.')
+        due = {name: 0 for name in selected}
+        try:
+            while True:
+                for name in selected:
+                    if time.monotonic() < due[name]:
+                        continue
+                    interval, run = jobs[name]
+                    close_old_connections()
+                    try:
+                        self.stdout.write(f'{name}: {run()}')
+                    except Exception:
+                        # keep the other jobs going; this one is retried next interval
+                        logger.exception('Scheduled job %s failed', name)
+                    due[name] = time.monotonic() + interval
+                if options['once']:
+                    break
+                time.sleep(max(0, min(due.values()) - time.monotonic()))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        processed = 0
+        last_stale_check = last_prune = 0
+        try:
+            while True:
+                if time.monotonic() - last_stale_check > 60:
+                    tasks.requeue_stale()
+                    last_stale_check = time.monotonic()
+                if time.monotonic() - last_prune > 3600:
+                    tasks.prune()
+                    last_prune = time.monotonic()
+                ran = tasks.run_pending(limit=options['batch_size'], threads=options['threads'])
+                processed += ran
+                if not ran:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Ran {processed} tasks.'))
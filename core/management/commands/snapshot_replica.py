@@ -0,0 +1,39 @@
+import os
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database to the read-only replica file '
+        '(BLOODMGMT_DB_REPLICA_NAME). Run it periodically, e.g. from cron.'
+    )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES.get('replica')
+        if replica is None:
+            raise CommandError('No replica configured; set BLOODMGMT_DB_REPLICA_NAME.')
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Snapshots are only for SQLite; PostgreSQL replicas are kept up by replication.')
+
+        target = os.environ['BLOODMGMT_DB_REPLICA_NAME']
+        partial = f'{target}.partial'
+        if os.path.exists(partial):
+            os.remove(partial)
+        connection = connections['default']
+        connection.ensure_connection()
+        destination = sqlite3.connect(partial)
+        try:
+            # the online backup API copies a consistent snapshot while writers carry on
+            connection.connection.backup(destination)
+            # a read-only file cannot use WAL without its -shm side file
+            destination.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            destination.close()
+        # readers holding the old file keep a consistent view until they reconnect
+        os.replace(partial, target)
+        self.stdout.write(self.style.SUCCESS(f'Replica snapshot written to {target}.'))
@@ -0,0 +1,308 @@
+"""
+Prometheus-style metrics: counters, gauges and histograms served as text at
+/metrics.
+
+Updates take no lock. Every thread adds to its own dict, and the dicts are
+merged only when they are read. When a thread exits, its dict is folded into
+a process total, so a server that starts a thread per connection does not
+keep one dict per thread it ever ran. When settings.METRICS_DIR is set, each
+process writes its merged values to <pid>.json in that directory at most
+every METRICS_FLUSH_SECONDS, by replacing the file. /metrics then combines
+the files of all worker processes: counters and histograms are summed, and
+for a gauge the most recently written value wins. Files of exited processes
+are kept, so their counts remain in the totals. A restarted process that
+reuses a pid starts its counters from zero, which Prometheus treats as a
+counter reset.
+
+Gauges that describe the database (stock per blood group, pending requests)
+are read when /metrics is served instead of being pushed.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = {}
+# live per-thread shards by holder id, and what exited threads left behind
+_shards = {}
+_retired = {}
+# reentrant: a shard can be retired by garbage collection while this thread holds it
+_shards_lock = threading.RLock()
+_local = threading.local()
+_next_flush = 0.0
+
+
+class _Holder:
+    __slots__ = ('values', '__weakref__')
+
+    def __init__(self):
+        self.values = {}
+
+
+def _retire(key, values):
+    with _shards_lock:
+        _shards.pop(key, None)
+        _merge(_retired, values.items())
+
+
+def _shard():
+    try:
+        return _local.holder.values
+    except AttributeError:
+        holder = _local.holder = _Holder()
+        with _shards_lock:
+            _shards[id(holder)] = holder.values
+        # the thread-local goes away with the thread; fold its values into _retired then
+        weakref.finalize(holder, _retire, id(holder), holder.values)
+        return holder.values
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _metrics[name] = self
+
+    def _key(self, labels):
+        return (self.name, tuple(str(labels.get(label, '')) for label in self.labelnames))
+
+    def merge(self, current, value):
+        return value if current is None else current + value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        values = _shard()
+        key = self._key(labels)
+        values[key] = values.get(key, 0) + amount
+        _maybe_flush()
+
+
+class Gauge(Metric):
+    """
+    A value set by the code (`set`) or read when scraped: `collect(scrape)`
+    returns {labels tuple: value}; `scrape` is a dict shared by the collectors
+    of one render() to compute common inputs once.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        _shard()[self._key(labels)] = [value, time.time()]
+        _maybe_flush()
+
+    def merge(self, current, value):
+        return value if current is None or value[1] >= current[1] else current
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        values = _shard()
+        key = self._key(labels)
+        # one count per bucket (made cumulative when rendered), then sum and count
+        entry = values.get(key)
+        if entry is None:
+            entry = values[key] = [0] * (len(self.buckets) + 3)
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-2] += value
+        entry[-1] += 1
+        _maybe_flush()
+
+    def merge(self, current, value):
+        return list(value) if current is None else [a + b for a, b in zip(current, value)]
+
+
+def _merge(into, items):
+    for (name, labels), value in items:
+        metric = _metrics.get(name)
+        if metric is not None:
+            key = (name, tuple(labels))
+            into[key] = metric.merge(into.get(key), value)
+    return into
+
+
+def local_values():
+    """This process's values, merged across live and exited threads."""
+    with _shards_lock:
+        merged = _merge({}, _retired.items())
+        # dict.copy() runs without releasing the GIL, so a writer cannot resize it mid-copy
+        shards = [shard.copy() for shard in _shards.values()]
+    for shard in shards:
+        _merge(merged, shard.items())
+    return merged
+
+
+def _store():
+    return getattr(settings, 'METRICS_DIR', '')
+
+
+def flush():
+    """Write this process's values to its file in METRICS_DIR."""
+    directory = _store()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    payload = json.dumps([[list(key), value] for key, value in local_values().items()])
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as fh:
+        fh.write(payload)
+    os.replace(tmp, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+def _maybe_flush():
+    global _next_flush
+    now = time.monotonic()
+    if now < _next_flush or not _store():
+        return
+    _next_flush = now + getattr(settings, 'METRICS_FLUSH_SECONDS', 5)
+    flush()
+
+
+atexit.register(flush)
+
+
+def all_values():
+    """Values of every process sharing METRICS_DIR (or just this one)."""
+    merged = {}
+    directory = _store()
+    own = f'{os.getpid()}.json'
+    if directory and os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as fh:
+                    items = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            _merge(merged, items)
+    return _merge(merged, local_values().items())
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    values = all_values()
+    scrape = {}
+    lines = []
+    for name, metric in sorted(_metrics.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        series = sorted((labels, value) for (n, labels), value in values.items() if n == name)
+        if isinstance(metric, Gauge) and metric.collect is not None:
+            series = sorted((tuple(labels), [value, 0]) for labels, value in metric.collect(scrape).items())
+        for labels, value in series:
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_labels(metric.labelnames, labels, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(metric.labelnames, labels)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_labels(metric.labelnames, labels)} {value[-1]}')
+            elif isinstance(metric, Gauge):
+                lines.append(f'{name}{_labels(metric.labelnames, labels)} {_number(value[0])}')
+            else:
+                lines.append(f'{name}{_labels(metric.labelnames, labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _snapshot(scrape):
+    if 'stats' not in scrape:
+        from . import stats
+        scrape['stats'] = stats.snapshot()
+    return scrape['stats']
+
+
+def _stock_units(scrape):
+    return {(row['blood_group'],): row['total_units'] or 0 for row in _snapshot(scrape)['inventory_by_group']}
+
+
+def _pending_requests(scrape):
+    return {(): _snapshot(scrape)['pending_requests']}
+
+
+REQUEST_DECISIONS = Counter(
+    'bloodmgmt_request_decisions_total', 'Approve/reject attempts by outcome and failure reason.',
+    ['action', 'outcome', 'reason'],
+)
+INVENTORY_CHANGES = Counter(
+    'bloodmgmt_inventory_changes_total', 'Committed inventory writes by kind.', ['kind'],
+)
+INVENTORY_UNITS = Counter(
+    'bloodmgmt_inventory_units_total', 'Units added to or removed from stock.', ['blood_group', 'direction'],
+)
+LOGINS = Counter('bloodmgmt_logins_total', 'Login attempts by result.', ['result'])
+HTTP_LATENCY = Histogram(
+    'bloodmgmt_http_request_duration_seconds', 'Time to produce a response, by view.',
+    ['view', 'method', 'status'],
+)
+STOCK_UNITS = Gauge('bloodmgmt_stock_units', 'Units in stock per blood group.', ['blood_group'], collect=_stock_units)
+PENDING_REQUESTS = Gauge('bloodmgmt_pending_requests', 'Donation requests awaiting a decision.', collect=_pending_requests)
+
+
+def count_inventory(kind, deltas):
+    """Count a committed inventory write of {blood_group: unit delta}."""
+    INVENTORY_CHANGES.inc(kind=kind)
+    for group, delta in deltas.items():
+        if delta:
+            INVENTORY_UNITS.inc(abs(delta), blood_group=group, direction='in' if delta > 0 else 'out')
+
+
+def _observe(request, response, started):
+    match = getattr(request, 'resolver_match', None)
+    view = (match.view_name or match._func_path) if match else 'unmatched'
+    HTTP_LATENCY.observe(
+        time.perf_counter() - started, view=view, method=request.method, status=f'{response.status_code // 100}xx',
+    )
+    return response
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            return _observe(request, await get_response(request), started)
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            return _observe(request, get_response(request), started)
+    return middleware
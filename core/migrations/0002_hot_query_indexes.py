@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bloodinventory',
+            options={'ordering': ['blood_bank__name', 'blood_group']},
+        ),
+        migrations.AlterField(
+            model_name='donationhistory',
+            name='donated_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AddIndex(
+            model_name='donationhistory',
+            index=models.Index(fields=['donor', '-donated_at'], name='hist_donor_donated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationhistory',
+            index=models.Index(fields=['-donated_at', '-id'], name='hist_donated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationrequest',
+            index=models.Index(fields=['status', '-created_at'], name='req_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationrequest',
+            index=models.Index(fields=['requester', '-created_at'], name='req_requester_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationrequest',
+            index=models.Index(fields=['-created_at', '-id'], name='req_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationrequest',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['-created_at'], name='req_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donorprofile',
+            index=models.Index(fields=['blood_group', 'city'], name='donor_group_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role'], name='user_role_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:14
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# frozen copies of core.search.normalize/tokenize as they were when this migration was written
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def tokenize(text):
+    return sorted(set(normalize(text).split()))
+
+
+def populate_search_index(apps, schema_editor):
+    DonorProfile = apps.get_model('core', 'DonorProfile')
+    DonorSearchToken = apps.get_model('core', 'DonorSearchToken')
+    profiles = list(DonorProfile.objects.only('id', 'city'))
+    for profile in profiles:
+        profile.city_key = normalize(profile.city)
+    DonorProfile.objects.bulk_update(profiles, ['city_key'], batch_size=1000)
+    DonorSearchToken.objects.bulk_create(
+        [DonorSearchToken(profile_id=p.id, token=t) for p in profiles for t in tokenize(p.city)],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonorSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=120)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='donorprofile',
+            name='donor_group_city_idx',
+        ),
+        migrations.AddField(
+            model_name='donorprofile',
+            name='city_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=120),
+        ),
+        migrations.AddIndex(
+            model_name='donorprofile',
+            index=models.Index(fields=['blood_group', 'city_key'], name='donor_group_citykey_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donorprofile',
+            index=models.Index(fields=['city_key'], name='donor_citykey_idx'),
+        ),
+        migrations.AddField(
+            model_name='donorsearchtoken',
+            name='profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='core.donorprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='donorsearchtoken',
+            index=models.Index(fields=['token', 'profile'], name='search_token_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='donorsearchtoken',
+            unique_together={('profile', 'token')},
+        ),
+        migrations.RunPython(populate_search_index, migrations.RunPython.noop),
+    ]
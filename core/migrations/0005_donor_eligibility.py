@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:25
+
+import datetime
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def populate_next_eligible_on(apps, schema_editor):
+    DonorProfile = apps.get_model('core', 'DonorProfile')
+    # the whole-blood default when this was written; rebuild_eligibility applies the current settings
+    interval = timedelta(days=56)
+    profiles = list(DonorProfile.objects.exclude(last_donated=None).only('id', 'last_donated'))
+    for profile in profiles:
+        profile.next_eligible_on = profile.last_donated + interval
+    DonorProfile.objects.bulk_update(profiles, ['next_eligible_on'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_dashboard_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donorprofile',
+            name='next_eligible_on',
+            field=models.DateField(default=datetime.date(1970, 1, 1), editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='donorprofile',
+            index=models.Index(fields=['blood_group', 'next_eligible_on'], name='donor_group_eligible_idx'),
+        ),
+        migrations.RunPython(populate_next_eligible_on, migrations.RunPython.noop),
+    ]
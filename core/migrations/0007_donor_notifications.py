@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonorNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('donor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL)),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='core.donationrequest')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['donor', '-sent_at'], name='notify_donor_sent_idx')],
+                'unique_together': {('request', 'donor')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_donor_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('O+', 'O+'), ('O-', 'O-'), ('AB+', 'AB+'), ('AB-', 'AB-')], max_length=3)),
+                ('city', models.CharField(blank=True, max_length=120)),
+                ('donated_units', models.BigIntegerField(default=0)),
+                ('requested_units', models.BigIntegerField(default=0)),
+                ('approved_units', models.BigIntegerField(default=0)),
+                ('rejected_units', models.BigIntegerField(default=0)),
+                ('blood_bank', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.bloodbank')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['blood_bank', 'day'], name='daily_stat_bank_day_idx'), models.Index(fields=['city', 'day'], name='daily_stat_city_day_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('blood_bank__isnull', False)), fields=('day', 'blood_group', 'blood_bank', 'city'), name='daily_stat_bank_uniq'), models.UniqueConstraint(condition=models.Q(('blood_bank__isnull', True)), fields=('day', 'blood_group', 'city'), name='daily_stat_nobank_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def wrap_existing_stock(apps, schema_editor):
+    # stock from before lot tracking has no known dates; it is used after dated lots
+    BloodInventory = apps.get_model('core', 'BloodInventory')
+    BloodLot = apps.get_model('core', 'BloodLot')
+    BloodLot.objects.bulk_create(
+        [
+            BloodLot(inventory_id=pk, units=units, units_left=units)
+            for pk, units in BloodInventory.objects.filter(units__gt=0).values_list('id', 'units').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloodLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collected_on', models.DateField(blank=True, null=True)),
+                ('expires_on', models.DateField(blank=True, null=True)),
+                ('units', models.PositiveIntegerField()),
+                ('units_left', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='core.bloodinventory')),
+            ],
+            options={
+                'ordering': ['expires_on', 'id'],
+                'indexes': [models.Index(condition=models.Q(('units_left__gt', 0)), fields=['inventory', 'expires_on', 'id'], name='lot_fifo_idx')],
+            },
+        ),
+        migrations.RunPython(wrap_existing_stock, migrations.RunPython.noop),
+    ]
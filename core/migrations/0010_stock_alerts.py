@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_blood_lots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodlot',
+            name='expired_units',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold', models.PositiveIntegerField()),
+                ('units', models.PositiveIntegerField()),
+                ('raised_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='core.bloodinventory')),
+            ],
+            options={
+                'ordering': ['-raised_at'],
+                'indexes': [models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['id'], name='stock_alert_unsent_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('inventory',), name='stock_alert_open_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_stock_alerts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='donornotification',
+            name='sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
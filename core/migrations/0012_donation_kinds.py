@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_notification_sent_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donationhistory',
+            name='kind',
+            field=models.CharField(choices=[('whole_blood', 'Whole blood'), ('double_red', 'Double red cells'), ('plasma', 'Plasma'), ('platelets', 'Platelets'), ('issued', 'Issued to a requester')], default='whole_blood', max_length=20),
+        ),
+    ]
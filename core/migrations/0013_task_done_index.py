@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_donation_kinds'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('status', 'done')), fields=['updated_at'], name='task_done_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_task_done_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailystat',
+            name='blood_bank',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_stats', to='core.bloodbank'),
+        ),
+    ]
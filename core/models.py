@@ -1,7 +1,10 @@
+import datetime
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from django.utils import timezone
 
 BLOOD_GROUPS = [
     ('A+', 'A+'), ('A-', 'A-'),
@@ -9,6 +12,19 @@ BLOOD_GROUPS = [
     ('O+', 'O+'), ('O-', 'O-'),
     ('AB+', 'AB+'), ('AB-', 'AB-'),
 ]
+BLOOD_GROUP_CODES = tuple(code for code, _ in BLOOD_GROUPS)
+
+ELIGIBLE_ALWAYS = datetime.date(1970, 1, 1)
+
+# what a DonationHistory row records; each donation kind has its own deferral
+DONATION_KINDS = [
+    ('whole_blood', 'Whole blood'),
+    ('double_red', 'Double red cells'),
+    ('plasma', 'Plasma'),
+    ('platelets', 'Platelets'),
+    ('issued', 'Issued to a requester'),
+]
+ISSUED = 'issued'
 
 ROLE_CHOICES = [
     ('admin', 'Admin'),
@@ -25,6 +41,11 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='donor')
     email = models.EmailField(_('email address'), unique=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['role'], name='user_role_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -44,14 +65,69 @@ class DonorProfile(models.Model):
     phone = models.CharField(max_length=20, blank=True)
     blood_group = models.CharField(max_length=3, choices=BLOOD_GROUPS, blank=True, null=True)
     city = models.CharField(max_length=120, blank=True)
+    # normalized copy of city (see core.search.normalize), kept in sync by save()
+    city_key = models.CharField(max_length=120, blank=True, default='', editable=False)
     last_donated = models.DateField(blank=True, null=True)
+    # first day the donor may give again, derived from last_donated by
+    # core.eligibility; never-donated profiles hold ELIGIBLE_ALWAYS so that
+    # "eligible today" is a plain range condition on an index
+    next_eligible_on = models.DateField(default=ELIGIBLE_ALWAYS, editable=False)
     profile_photo = models.ImageField(upload_to='profiles/', blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['blood_group', 'city_key'], name='donor_group_citykey_idx'),
+            models.Index(fields=['city_key'], name='donor_citykey_idx'),
+            models.Index(fields=['blood_group', 'next_eligible_on'], name='donor_group_eligible_idx'),
+        ]
+
     def __str__(self):
         bg = self.blood_group or "N/A"
         name = self.user.get_full_name() or self.user.username
         return f"{name} ({bg})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_last_donated = instance.__dict__.get('last_donated')
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .eligibility import next_eligible_date
+        from .search import normalize
+        self.city_key = normalize(self.city)
+        # keep a longer deferral recorded from history unless the date itself was edited
+        if self._state.adding or self.last_donated != getattr(self, '_loaded_last_donated', None):
+            self.next_eligible_on = next_eligible_date(self.last_donated)
+            self._loaded_last_donated = self.last_donated
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'city' in update_fields:
+                update_fields.add('city_key')
+            if 'last_donated' in update_fields:
+                update_fields.add('next_eligible_on')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+
+class DonorSearchToken(models.Model):
+    """
+    One row per normalized city word of a donor profile. Prefix lookups on
+    token are index range scans, unlike city__icontains on DonorProfile.
+    """
+    profile = models.ForeignKey(DonorProfile, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=120)
+
+    class Meta:
+        unique_together = ('profile', 'token')
+        indexes = [
+            models.Index(fields=['token', 'profile'], name='search_token_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} -> {self.profile_id}"
+
 
 class BloodInventory(models.Model):
     blood_group = models.CharField(max_length=3, choices=BLOOD_GROUPS)
@@ -66,6 +142,63 @@ class BloodInventory(models.Model):
         return f"{self.blood_bank.name} - {self.blood_group}: {self.units}"
 
 
+class BloodLot(models.Model):
+    """
+    Units of one collection held by a BloodInventory row. The row's units is
+    the maintained sum of units_left over its lots (see core.inventory), which
+    hand out stock earliest expiry first. Stock that predates lot tracking has
+    no expiry and is used last.
+    """
+    inventory = models.ForeignKey(BloodInventory, on_delete=models.CASCADE, related_name='lots')
+    collected_on = models.DateField(null=True, blank=True)
+    expires_on = models.DateField(null=True, blank=True)
+    units = models.PositiveIntegerField()
+    units_left = models.PositiveIntegerField()
+    expired_units = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['expires_on', 'id']
+        indexes = [
+            # one inventory row per (bank, group): this is the (bank, group, expiry) FIFO order
+            models.Index(
+                fields=['inventory', 'expires_on', 'id'], name='lot_fifo_idx',
+                condition=models.Q(units_left__gt=0),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.inventory_id} lot {self.pk}: {self.units_left}/{self.units} until {self.expires_on}"
+
+
+class StockAlert(models.Model):
+    """
+    An inventory row that fell below the low-stock threshold. A row has at
+    most one open alert (resolved_at unset), so a shortage is reported once
+    however often core.stock checks; notified_at records that it was sent.
+    """
+    inventory = models.ForeignKey(BloodInventory, on_delete=models.CASCADE, related_name='alerts')
+    threshold = models.PositiveIntegerField()
+    units = models.PositiveIntegerField()
+    raised_at = models.DateTimeField(default=timezone.now)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-raised_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['inventory'], condition=models.Q(resolved_at__isnull=True), name='stock_alert_open_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['id'], name='stock_alert_unsent_idx', condition=models.Q(notified_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.inventory_id}: {self.units} < {self.threshold}"
+
+
 REQUEST_STATUS = [
     ('pending', 'Pending'),
     ('approved', 'Approved'),
@@ -83,6 +216,15 @@ class DonationRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     approved_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='approved_requests')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-created_at'], name='req_status_created_idx'),
+            models.Index(fields=['requester', '-created_at'], name='req_requester_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='req_created_idx'),
+            # the pending queue is a small, hot slice of the table
+            models.Index(fields=['-created_at'], condition=models.Q(status='pending'), name='req_pending_idx'),
+        ]
+
     def __str__(self):
         return f"{self.requester.username} needs {self.units} units ({self.blood_group}) - {self.status}"
 
@@ -91,13 +233,127 @@ class DonationHistory(models.Model):
     """
     Records an actual donation event. donated_at is auto-set when the record is created.
     If you need to store historical dates from the past, remove auto_now_add and pass the date explicitly.
+    Rows of kind ISSUED record blood given to the requester of an approved
+    request; they are not donations and do not defer anyone.
     """
     donor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='donation_history')
     blood_group = models.CharField(max_length=3, choices=BLOOD_GROUPS)
     units = models.PositiveIntegerField(default=1)
+    kind = models.CharField(max_length=20, choices=DONATION_KINDS, default='whole_blood')
     donated_at = models.DateTimeField(auto_now_add=True)
     blood_bank = models.ForeignKey(BloodBank, on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['donor', '-donated_at'], name='hist_donor_donated_idx'),
+            models.Index(fields=['-donated_at', '-id'], name='hist_donated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.donor.username} gave {self.units} units on {self.donated_at.date()}"
 
+
+
+class DashboardStat(models.Model):
+    """
+    Pre-aggregated dashboard numbers (units per blood group, donor count,
+    pending request count), maintained incrementally by core.stats.
+    """
+    key = models.CharField(max_length=40, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+TASK_STATUS = (
+    ('pending', 'Pending'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
+
+
+class Task(models.Model):
+    """
+    A unit of deferred work run by the run_worker command (see core.tasks).
+    idempotency_key, when set, makes enqueueing the same work twice a no-op.
+    """
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=TASK_STATUS, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_after', 'id'], condition=models.Q(status='pending'), name='task_pending_idx'),
+            models.Index(fields=['started_at'], condition=models.Q(status='running'), name='task_running_idx'),
+            models.Index(fields=['updated_at'], condition=models.Q(status='done'), name='task_done_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class DonorNotification(models.Model):
+    """
+    One donor told about one request; used for dedup and per-donor rate
+    limits. The row is committed before the message goes out and sent_at is
+    set once the backend has taken it.
+    """
+    request = models.ForeignKey(DonationRequest, on_delete=models.CASCADE, related_name='notifications')
+    donor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('request', 'donor')
+        indexes = [
+            models.Index(fields=['donor', '-sent_at'], name='notify_donor_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.donor_id} notified of request {self.request_id}"
+
+
+class DailyStat(models.Model):
+    """
+    Units per day x blood group x bank x city, maintained incrementally by
+    core.analytics. Donations carry their bank (and its city); requests carry
+    only a city, so their rows have no bank. Approved and rejected units are
+    counted on the day the request was made. city is the normalized key.
+    """
+    day = models.DateField()
+    blood_group = models.CharField(max_length=3, choices=BLOOD_GROUPS)
+    blood_bank = models.ForeignKey(BloodBank, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_stats')
+    city = models.CharField(max_length=120, blank=True)
+    donated_units = models.BigIntegerField(default=0)
+    requested_units = models.BigIntegerField(default=0)
+    approved_units = models.BigIntegerField(default=0)
+    rejected_units = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULLs never collide in a plain unique constraint, so rows without a bank get their own
+            models.UniqueConstraint(
+                fields=['day', 'blood_group', 'blood_bank', 'city'],
+                condition=models.Q(blood_bank__isnull=False), name='daily_stat_bank_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['day', 'blood_group', 'city'],
+                condition=models.Q(blood_bank__isnull=True), name='daily_stat_nobank_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['blood_bank', 'day'], name='daily_stat_bank_day_idx'),
+            models.Index(fields=['city', 'day'], name='daily_stat_city_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.blood_group} bank={self.blood_bank_id} {self.city}"
@@ -0,0 +1,140 @@
+"""
+Telling compatible donors about new blood requests.
+
+Creating a DonationRequest queues fan_out (see core.signals), so the work runs
+on the task worker, not the request thread. fan_out walks the matching donors
+(compatible blood group, eligible today, same city, not notified recently,
+not the requester) in keyset batches of plain value rows. Each batch first commits a
+DonorNotification per donor, then hands the donors whose rows are still
+unsent to the configured backend outside any transaction (a slow mail server
+must not hold the database write lock) and marks those rows sent. Memory use
+is bounded by the batch size however many donors match; a retried task skips
+donors an earlier attempt already reached and finishes the ones it claimed
+but did not get to send.
+"""
+import json
+import threading
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import tasks
+from .compatibility import source_groups
+from .eligibility import eligible_q
+from .models import DonationRequest, DonorNotification, DonorProfile
+from .search import normalize
+
+BATCH_SIZE = 500
+
+
+@dataclass
+class Notification:
+    user_id: int
+    email: str
+    subject: str
+    body: str
+
+
+class EmailBackend:
+    """Send through Django's EMAIL_BACKEND, one connection per batch."""
+
+    def send(self, notifications):
+        messages = [
+            EmailMessage(n.subject, n.body, settings.DEFAULT_FROM_EMAIL, [n.email])
+            for n in notifications if n.email
+        ]
+        with get_connection() as connection:
+            connection.send_messages(messages)
+
+
+class FileBackend:
+    """Append notifications as JSON lines to settings.NOTIFICATION_FILE_PATH."""
+    _lock = threading.Lock()
+
+    def send(self, notifications):
+        lines = ''.join(json.dumps(asdict(n)) + '\n' for n in notifications)
+        with self._lock, open(settings.NOTIFICATION_FILE_PATH, 'a', encoding='utf-8') as fh:
+            fh.write(lines)
+
+
+def get_backend():
+    return import_string(settings.NOTIFICATION_BACKEND)()
+
+
+def rate_limit():
+    return timedelta(hours=getattr(settings, 'NOTIFICATION_MIN_INTERVAL_HOURS', 24))
+
+
+def recipients(req, now=None):
+    """Donors to tell about `req`, as (profile id, user id, email, first name) rows ordered by profile id."""
+    now = now or timezone.now()
+    city_key = normalize(req.city)
+    if not city_key:
+        return DonorProfile.objects.none()
+    # already told about this request, or about any request too recently
+    recent = DonorNotification.objects.filter(
+        Q(request_id=req.pk) | Q(sent_at__gte=now - rate_limit()), sent_at__isnull=False,
+        donor_id=OuterRef('user_id'),
+    )
+    return (
+        DonorProfile.objects
+        .filter(blood_group__in=source_groups(req.blood_group), city_key=city_key)
+        .filter(eligible_q(timezone.localdate(now)))
+        .exclude(user_id=req.requester_id)
+        .exclude(Exists(recent))
+        .order_by('id')
+        .values_list('id', 'user_id', 'user__email', 'user__first_name')
+    )
+
+
+def _message(req, first_name):
+    subject = f'Urgent: {req.blood_group} blood needed in {req.city}'
+    where = f' at {req.hospital_name}' if req.hospital_name else ''
+    body = (
+        f'Hello {first_name or "donor"},\n\n'
+        f'{req.units} unit(s) of blood compatible with {req.blood_group} are needed{where} in {req.city}. '
+        'You are eligible to donate; please contact the hospital or your nearest blood bank if you can help.\n'
+    )
+    return subject, body
+
+
+@tasks.task(atomic=False)
+def fan_out(request_id, batch_size=BATCH_SIZE):
+    """Notify every matching donor of a request; returns how many were notified."""
+    req = DonationRequest.objects.filter(pk=request_id, status='pending').first()
+    if req is None:
+        return 0
+    backend = get_backend()
+    qs = recipients(req)
+    sent = 0
+    last_id = 0
+    while True:
+        rows = list(qs.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            return sent
+        last_id = rows[-1][0]
+        with transaction.atomic():
+            DonorNotification.objects.bulk_create(
+                [DonorNotification(request_id=req.pk, donor_id=user_id) for _, user_id, _, _ in rows],
+                ignore_conflicts=True,
+            )
+        unsent = DonorNotification.objects.filter(
+            request_id=req.pk, donor_id__in=[row[1] for row in rows], sent_at=None,
+        )
+        claimed = dict(unsent.values_list('donor_id', 'id'))
+        notifications = []
+        for _, user_id, email, first_name in rows:
+            if user_id in claimed:
+                subject, body = _message(req, first_name)
+                notifications.append(Notification(user_id, email, subject, body))
+        if not notifications:
+            continue
+        backend.send(notifications)
+        DonorNotification.objects.filter(id__in=claimed.values()).update(sent_at=timezone.now())
+        sent += len(notifications)
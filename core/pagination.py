@@ -0,0 +1,55 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.pagination import CursorPagination
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    """The raw values of `cursor`; raises ValueError unless there are `size` of them."""
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('cursor does not match the ordering')
+    return values
+
+
+def rows_after(ordering, values):
+    """Rows strictly after `values` in `ordering`, as one OR of prefix comparisons."""
+    condition = Q()
+    for i, name in enumerate(ordering):
+        field = name.lstrip('-')
+        step = Q(**{f'{field}__lt' if name.startswith('-') else f'{field}__gt': values[i]})
+        for prev, value in zip(ordering[:i], values):
+            step &= Q(**{prev.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination. Pages are fetched with a WHERE on the ordering
+    key instead of OFFSET, and no COUNT(*) is issued, so every page costs the
+    same number of queries regardless of table size.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-id',)
+
+
+class CreatedAtPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class DonatedAtPagination(KeysetPagination):
+    ordering = ('-donated_at', '-id')
+
+
+class IdPagination(KeysetPagination):
+    ordering = ('id',)
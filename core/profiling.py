@@ -0,0 +1,210 @@
+"""
+Opt-in request profiling.
+
+ProfilingMiddleware samples settings.PROFILING_SAMPLE_RATE of requests (0,
+the default, takes it out of the stack). For a sampled request it records
+wall time, SQL query count and time, statements run more than once (the mark
+of a related object loaded lazily in a loop) and template render time. The
+numbers go to a Server-Timing header, to a ring buffer of the last
+PROFILING_BUFFER_SIZE requests that staff can read at /custom_admin/profiling/,
+and to a per-view summary logged by core.profiling every
+PROFILING_LOG_INTERVAL seconds.
+
+Queries are seen through an execute wrapper on every connection and
+templates through a wrapper around the Django template backend. Both report
+to a context variable, so an unsampled request pays one lookup per query, and
+async views are followed into their sync_to_async threads.
+"""
+import logging
+import random
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('bloodmgmt_profile', default=None)
+_buffer = deque(maxlen=200)
+_window = {}
+_window_started = time.monotonic()
+_window_lock = threading.Lock()
+_install_lock = threading.Lock()
+_original_render = Template.render
+
+
+class Profile:
+    __slots__ = ('started', 'queries', 'db_time', 'template_time', 'rendering', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+        self.statements = Counter()
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.db_time += time.perf_counter() - start
+        profile.queries += 1
+        profile.statements[sql] += 1
+
+
+def _timed_render(self, context=None, request=None):
+    profile = _current.get()
+    if profile is None or profile.rendering:
+        # templates rendered from inside another are already being timed
+        return _original_render(self, context, request)
+    profile.rendering = True
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        profile.template_time += time.perf_counter() - start
+        profile.rendering = False
+
+
+def _watch_connection(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install():
+    global _buffer
+    with _install_lock:
+        if Template.render is _timed_render:
+            return
+        _buffer = deque(maxlen=getattr(settings, 'PROFILING_BUFFER_SIZE', 200))
+        connection_created.connect(_watch_connection, dispatch_uid='core.profiling')
+        for connection in connections.all(initialized_only=True):
+            _watch_connection(connection)
+        Template.render = _timed_render
+
+
+def recent():
+    """The buffered request profiles, newest first."""
+    return list(reversed(_buffer))
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return request.path
+    return match.view_name or match._func_path
+
+
+def _summarize(rows):
+    walls = sorted(row['total_ms'] for row in rows)
+    return {
+        'requests': len(rows),
+        'p50_ms': round(statistics.median(walls), 1),
+        'p95_ms': round(walls[min(len(walls) - 1, int(len(walls) * 0.95))], 1),
+        'queries_avg': round(sum(row['queries'] for row in rows) / len(rows), 1),
+        'db_ms_avg': round(sum(row['db_ms'] for row in rows) / len(rows), 1),
+        'with_duplicates': sum(1 for row in rows if row['duplicates']),
+    }
+
+
+def summary(entries=None):
+    """{view: aggregate} over `entries` (default: the ring buffer)."""
+    by_view = {}
+    for entry in _buffer if entries is None else entries:
+        by_view.setdefault(entry['view'], []).append(entry)
+    return {view: _summarize(rows) for view, rows in by_view.items()}
+
+
+def _aggregate(entry):
+    global _window, _window_started
+    with _window_lock:
+        _window.setdefault(entry['view'], []).append(entry)
+        if time.monotonic() - _window_started < getattr(settings, 'PROFILING_LOG_INTERVAL', 60):
+            return
+        window, _window, _window_started = _window, {}, time.monotonic()
+    for view, rows in sorted(window.items(), key=lambda item: -sum(r['total_ms'] for r in item[1])):
+        stats = _summarize(rows)
+        logger.info(
+            '%s: %d sampled, p50 %.1f ms, p95 %.1f ms, %.1f queries (%.1f ms) per request, %d with repeated queries',
+            view, stats['requests'], stats['p50_ms'], stats['p95_ms'], stats['queries_avg'],
+            stats['db_ms_avg'], stats['with_duplicates'],
+        )
+
+
+def _finish(profile, request, response):
+    total = time.perf_counter() - profile.started
+    duplicates = [
+        {'count': count, 'sql': sql[:300]}
+        for sql, count in profile.statements.most_common(5) if count > 1
+    ]
+    entry = {
+        'at': time.time(),
+        'method': request.method,
+        'path': request.path,
+        'view': _view_name(request),
+        'status': response.status_code,
+        'total_ms': round(total * 1000, 1),
+        'queries': profile.queries,
+        'db_ms': round(profile.db_time * 1000, 1),
+        'template_ms': round(profile.template_time * 1000, 1),
+        'duplicates': duplicates,
+    }
+    timings = [
+        f"total;dur={entry['total_ms']}",
+        f"db;dur={entry['db_ms']};desc=\"{profile.queries} queries\"",
+        f"tpl;dur={entry['template_ms']}",
+    ]
+    if duplicates:
+        timings.append(f'dupq;desc="{sum(d["count"] for d in duplicates)} repeated"')
+    response['Server-Timing'] = ', '.join(timings)
+    _buffer.append(entry)
+    _aggregate(entry)
+    return response
+
+
+@sync_and_async_middleware
+def ProfilingMiddleware(get_response):
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+    if rate <= 0:
+        raise MiddlewareNotUsed
+    install()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if random.random() >= rate:
+                return await get_response(request)
+            profile = Profile()
+            token = _current.set(profile)
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(profile, request, response)
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            if random.random() >= rate:
+                return get_response(request)
+            profile = Profile()
+            token = _current.set(profile)
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(profile, request, response)
+    return middleware
@@ -0,0 +1,59 @@
+"""
+EXPLAIN checks for the querysets behind the busiest pages.
+
+Each entry in HOT_QUERYSETS builds the queryset a view or viewset runs;
+find_full_scans() inspects the plan and reports any step that reads a whole
+table instead of using an index.
+"""
+import re
+
+from . import approvals, inventory, notifications, search
+from .models import User, BloodLot, DonationRequest, DonationHistory
+
+
+HOT_QUERYSETS = {
+    'dashboard.total_donors': lambda: User.objects.filter(role='donor').values('id'),
+    'dashboard.pending_requests': lambda: DonationRequest.objects.filter(status='pending').values('id'),
+    'admin_requests': lambda: approvals.queue(),
+    'admin_requests.older': lambda: approvals.queue(after=['2000-01-01T00:00:00Z', 1]),
+    'api.requests.staff': lambda: DonationRequest.objects.filter(status='pending').order_by('-created_at')[:50],
+    'api.requests.own': lambda: DonationRequest.objects.filter(requester_id=1).order_by('-created_at')[:50],
+    'api.history.staff': lambda: DonationHistory.objects.order_by('-donated_at', '-id')[:50],
+    'api.history.own': lambda: DonationHistory.objects.filter(donor_id=1).order_by('-donated_at')[:50],
+    'search_donors.group': lambda: search.build_queryset(blood_group='A+')[:20],
+    'search_donors.group_city': lambda: search.build_queryset(blood_group='A+', city='Dhaka')[:20],
+    'search_donors.terms': lambda: search.build_queryset(terms=['dha'])[:20],
+    'search_donors.eligible': lambda: search.build_queryset(blood_group='A+', eligible=True)[:20],
+    'notifications.recipients': lambda: notifications.recipients(
+        DonationRequest(pk=1, blood_group='A+', city='Dhaka')
+    ).filter(id__gt=0)[:500],
+    'inventory.fifo_lots': lambda: BloodLot.objects.filter(inventory_id=1, units_left__gt=0).order_by(
+        *inventory.fifo_order()
+    ).values_list('id', 'units_left'),
+    'stock.expired_lots': lambda: BloodLot.objects.filter(
+        expires_on__lt='2000-01-01', units_left__gt=0, inventory_id__gt=0,
+    ).order_by('inventory_id').values_list('inventory_id', flat=True).distinct()[:500],
+}
+
+# SQLite: "SCAN core_x" without an index; PostgreSQL: "Seq Scan on core_x".
+_SQLITE_SCAN = re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)')
+_PG_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def find_full_scans(plan, vendor):
+    pattern = _PG_SCAN if vendor == 'postgresql' else _SQLITE_SCAN
+    return pattern.findall(plan)
+
+
+def check_hot_querysets(using='default'):
+    """Return {name: [tables scanned]} for every hot queryset that does a full scan."""
+    from django.db import connections
+
+    vendor = connections[using].vendor
+    failures = {}
+    for name, build in HOT_QUERYSETS.items():
+        plan = build().using(using).explain()
+        scans = find_full_scans(plan, vendor)
+        if scans:
+            failures[name] = scans
+    return failures
@@ -0,0 +1,124 @@
+"""
+Primary/replica routing.
+
+Writes always go to "default". Reads go to the "replica" alias (configured
+in bloodmgmt/database.py: a read-only SQLite snapshot or a PostgreSQL
+replica) only inside use_replica(), which wraps the reporting paths:
+dashboards, search, history lists and exports. Everything else, including
+approvals and inventory changes, reads from the primary.
+
+Read-your-writes: once anything is written during a request, the rest of that
+request reads from the primary, and ReplicaStickinessMiddleware sets a short
+cookie that keeps the user's next requests there too while the replica
+catches up.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+STICKY_COOKIE = 'bloodmgmt_primary'
+
+_use_replica = ContextVar('bloodmgmt_use_replica', default=False)
+# per-request {'pinned': bool, 'wrote': bool}, shared by reference so that
+# writes made in sync_to_async threads are seen by the middleware
+_request_state = ContextVar('bloodmgmt_request_state', default=None)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def _pinned():
+    state = _request_state.get()
+    return state is not None and (state['pinned'] or state['wrote'])
+
+
+def read_alias():
+    """The alias reads issued right now should use."""
+    if _use_replica.get() and replica_configured() and not _pinned():
+        return REPLICA
+    return PRIMARY
+
+
+@contextmanager
+def _replica_reads():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def use_replica(view=None):
+    """Route reads to the replica in a block (`with use_replica():`) or a sync or async view."""
+    if view is None:
+        return _replica_reads()
+    if iscoroutinefunction(view):
+        async def wrapper(*args, **kwargs):
+            with _replica_reads():
+                return await view(*args, **kwargs)
+        markcoroutinefunction(wrapper)
+    else:
+        def wrapper(*args, **kwargs):
+            with _replica_reads():
+                return view(*args, **kwargs)
+    return wraps(view)(wrapper)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {PRIMARY, REPLICA}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def _finish(state, response):
+    if state['wrote'] and replica_configured():
+        response.set_cookie(
+            STICKY_COOKIE, '1', max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+            httponly=True, samesite='Lax',
+        )
+    return response
+
+
+@sync_and_async_middleware
+def ReplicaStickinessMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            state = {'pinned': STICKY_COOKIE in request.COOKIES, 'wrote': False}
+            token = _request_state.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                _request_state.reset(token)
+            return _finish(state, response)
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            state = {'pinned': STICKY_COOKIE in request.COOKIES, 'wrote': False}
+            token = _request_state.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                _request_state.reset(token)
+            return _finish(state, response)
+    return middleware
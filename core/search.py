@@ -0,0 +1,179 @@
+"""
+Donor search.
+
+City names are normalized (accents stripped, lower-cased, punctuation
+collapsed) and split into words stored in DonorSearchToken. A free-text query
+is parsed into an optional blood group plus city terms; every term becomes an
+index range scan on the token table, so lookups stay sub-linear in the number
+of donors. Results are ranked (exact city first), paged with keyset cursors
+(no OFFSET, no COUNT(*), see core.pagination) and loaded together with their
+user in one joined query.
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .eligibility import eligible_q
+from .models import BLOOD_GROUP_CODES, DonorProfile, DonorSearchToken
+from .pagination import decode_cursor, encode_cursor, rows_after
+
+PAGE_SIZE = 20
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def tokenize(text):
+    return sorted(set(normalize(text).split()))
+
+
+def parse_query(q):
+    """Split a free-text query into (blood_group, city_terms)."""
+    blood_group = None
+    terms = []
+    for word in (q or '').split():
+        if blood_group is None and word.upper() in BLOOD_GROUP_CODES:
+            blood_group = word.upper()
+        else:
+            terms.extend(normalize(word).split())
+    return blood_group, terms
+
+
+def _token_prefix(term):
+    # token >= term AND token < term + U+FFFF is a prefix match that every
+    # backend can answer from the token index (LIKE ... ESCAPE cannot on SQLite)
+    return DonorSearchToken.objects.filter(
+        token__gte=term, token__lt=term + '\uffff'
+    ).values('profile_id')
+
+
+def build_queryset(blood_group=None, city=None, terms=(), eligible=False):
+    qs = DonorProfile.objects.all()
+    if blood_group:
+        qs = qs.filter(blood_group=blood_group)
+    if city:
+        qs = qs.filter(city_key=normalize(city))
+    for term in terms:
+        qs = qs.filter(id__in=_token_prefix(term))
+    if eligible:
+        qs = qs.filter(eligible_q())
+
+    ordering = ['city_key', 'id']
+    if terms:
+        phrase = ' '.join(terms)
+        qs = qs.annotate(rank=Case(
+            When(city_key=phrase, then=Value(0)),
+            When(city_key__startswith=phrase, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ))
+        ordering.insert(0, 'rank')
+    return qs.order_by(*ordering)
+
+
+@dataclass
+class SearchPage:
+    results: list
+    number: int
+    next_cursor: str = None
+    previous_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _reverse(ordering):
+    return [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+
+def _page_queryset(q, blood_group, city, eligible, after, before, page_size):
+    """The page's queryset and its ordering, or (None, None) for an empty query."""
+    parsed_group, terms = parse_query(q)
+    blood_group = blood_group or parsed_group
+    if not (blood_group or city or terms):
+        return None, None
+    qs = build_queryset(blood_group, city, terms, eligible).select_related('user').only(
+        'id', 'phone', 'blood_group', 'city', 'city_key', 'last_donated', 'next_eligible_on',
+        'user__id', 'user__username', 'user__first_name', 'user__last_name',
+    )
+    ordering = list(qs.query.order_by)
+    cursor = before or after
+    if cursor:
+        try:
+            # WHERE on the ordering key rather than OFFSET, so deep pages cost the same as the first
+            values = decode_cursor(cursor, len(ordering))
+            if before:
+                qs = qs.filter(rows_after(_reverse(ordering), values)).order_by(*_reverse(ordering))
+            else:
+                qs = qs.filter(rows_after(ordering, values))
+        except (ValueError, TypeError):
+            # a tampered or stale cursor starts over from the first page
+            before = after = None
+    # fetch one extra row to learn whether there is another page without COUNT(*)
+    return qs[:page_size + 1], (ordering, bool(after), bool(before))
+
+
+def _page(rows, state, page, page_size):
+    ordering, after, before = state
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before:
+        rows.reverse()
+    key = lambda row: encode_cursor([getattr(row, name.lstrip('-')) for name in ordering])
+    next_cursor = key(rows[-1]) if rows and (before or more) else None
+    previous_cursor = key(rows[0]) if rows and (after or (before and more)) else None
+    return SearchPage(rows, page, next_cursor, previous_cursor)
+
+
+def search(q='', blood_group=None, city=None, eligible=False, after=None, before=None, page=1,
+           page_size=PAGE_SIZE):
+    """One page of results; `after`/`before` are the cursors of a previous SearchPage, `page` only labels it."""
+    page = max(int(page), 1)
+    qs, state = _page_queryset(q, blood_group, city, eligible, after, before, page_size)
+    if qs is None:
+        return SearchPage([], 1)
+    return _page(list(qs), state, page, page_size)
+
+
+async def asearch(q='', blood_group=None, city=None, eligible=False, after=None, before=None, page=1,
+                  page_size=PAGE_SIZE):
+    page = max(int(page), 1)
+    qs, state = _page_queryset(q, blood_group, city, eligible, after, before, page_size)
+    if qs is None:
+        return SearchPage([], 1)
+    return _page([profile async for profile in qs], state, page, page_size)
+
+
+def index_profiles(profiles):
+    """(Re)build the search tokens of the given profiles; returns rows written."""
+    wanted = {(p.pk, token) for p in profiles for token in tokenize(p.city)}
+    ids = [p.pk for p in profiles]
+    existing = set(
+        DonorSearchToken.objects.filter(profile_id__in=ids).values_list('profile_id', 'token')
+    )
+    stale = existing - wanted
+    if stale:
+        stale_filter = Q()
+        for profile_id, token in stale:
+            stale_filter |= Q(profile_id=profile_id, token=token)
+        DonorSearchToken.objects.filter(stale_filter).delete()
+    missing = wanted - existing
+    DonorSearchToken.objects.bulk_create(
+        [DonorSearchToken(profile_id=profile_id, token=token) for profile_id, token in missing],
+        ignore_conflicts=True,
+    )
+    return len(missing)
@@ -1,9 +1,13 @@
 
+from datetime import timedelta
+
 from rest_framework import serializers
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from .analytics import DIMENSIONS, INTERVALS, METRICS
 from .models import (
-    DonorProfile, BloodBank, BloodInventory,
-    DonationRequest, DonationHistory, BLOOD_GROUPS
+    DonorProfile, BloodBank, BloodInventory, BloodLot,
+    DonationRequest, DonationHistory, BLOOD_GROUPS, BLOOD_GROUP_CODES
 )
 
 User = get_user_model()
@@ -33,12 +37,26 @@ class DonorProfileSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def validate_blood_group(self, value):
-        valid = [b[0] for b in BLOOD_GROUPS]
-        if value not in valid:
+        if value not in BLOOD_GROUP_CODES:
             raise serializers.ValidationError("Invalid blood group.")
         return value
 
 
+class PublicUserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name')
+
+
+class PublicDonorProfileSerializer(serializers.ModelSerializer):
+    """What any signed-in user may see of a donor: no email, phone or donation dates."""
+    user = PublicUserSerializer(read_only=True)
+
+    class Meta:
+        model = DonorProfile
+        fields = ('id', 'user', 'blood_group', 'city')
+
+
 class BloodBankSerializer(serializers.ModelSerializer):
     class Meta:
         model = BloodBank
@@ -54,6 +72,24 @@ class BloodInventorySerializer(serializers.ModelSerializer):
         read_only_fields = ('blood_bank',)
 
 
+class BloodLotSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BloodLot
+        fields = ['id', 'inventory', 'collected_on', 'expires_on', 'units', 'units_left', 'created_at']
+        read_only_fields = ['inventory', 'units_left', 'created_at']
+
+    def validate_units(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Units must be greater than zero.")
+        return value
+
+    def validate(self, attrs):
+        collected_on, expires_on = attrs.get('collected_on'), attrs.get('expires_on')
+        if collected_on and expires_on and expires_on < collected_on:
+            raise serializers.ValidationError("expires_on must not be before collected_on.")
+        return attrs
+
+
 class DonationRequestSerializer(serializers.ModelSerializer):
     requester = serializers.PrimaryKeyRelatedField(read_only=True)
     status = serializers.CharField(read_only=True)
@@ -63,8 +99,7 @@ class DonationRequestSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def validate_blood_group(self, value):
-        valid = [b[0] for b in BLOOD_GROUPS]
-        if value not in valid:
+        if value not in BLOOD_GROUP_CODES:
             raise serializers.ValidationError("Invalid blood group.")
         return value
 
@@ -80,3 +115,51 @@ class DonationHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = DonationHistory
         fields = '__all__'
+
+
+class BulkDecisionSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(choices=['approve', 'reject'])
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    blood_group = serializers.ChoiceField(choices=BLOOD_GROUPS, required=False)
+    city = serializers.CharField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if not any(key in attrs for key in ('ids', 'blood_group', 'city', 'created_before')):
+            raise serializers.ValidationError("Give a list of ids or at least one filter.")
+        return attrs
+
+    def get_filters(self):
+        data = self.validated_data
+        filters = {}
+        if 'blood_group' in data:
+            filters['blood_group'] = data['blood_group']
+        if 'city' in data:
+            filters['city__iexact'] = data['city']
+        if 'created_before' in data:
+            filters['created_at__lt'] = data['created_before']
+        return filters
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    """Query parameters of the analytics API; the range defaults to the last 30 days."""
+    metric = serializers.ChoiceField(choices=METRICS, default='donated_units')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    interval = serializers.ChoiceField(choices=list(INTERVALS), default='day')
+    by = serializers.ChoiceField(choices=list(DIMENSIONS), default='bank')
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    blood_group = serializers.ChoiceField(choices=BLOOD_GROUPS, required=False)
+    bank = serializers.IntegerField(required=False)
+    city = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=29))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        return attrs
+
+    def get_filters(self):
+        data = self.validated_data
+        return {key: data[key] for key in ('blood_group', 'bank', 'city') if key in data}
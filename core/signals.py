@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import User, DonorProfile, BloodBank, BLOOD_GROUPS, BloodInventory
+from . import analytics, caching, eligibility, events, inventory, notifications, stats, tasks
+from .models import User, DonorProfile, BloodBank, BloodInventory, DonationRequest, DonationHistory
 
 
 @receiver(post_save, sender=User)
@@ -12,9 +13,101 @@ def create_profile_for_donor(sender, instance, created, **kwargs):
 @receiver(post_save, sender=BloodBank)
 def create_inventory_for_new_bank(sender, instance, created, **kwargs):
     if created:
-        for bg, _ in BLOOD_GROUPS:
-            BloodInventory.objects.get_or_create(
-                blood_bank=instance,
-                blood_group=bg,
-                defaults={'units': 10}
-            )
+        inventory.seed_bank_inventory([instance])
+
+
+@receiver(post_save, sender=DonorProfile)
+def index_donor_for_search(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'city' not in update_fields:
+        return
+    from .search import index_profiles
+    index_profiles([instance])
+
+
+@receiver(post_save, sender=BloodInventory)
+@receiver(post_delete, sender=BloodInventory)
+def refresh_inventory_stats(sender, instance, **kwargs):
+    stats.refresh_groups(instance.blood_group)
+    caching.invalidate_on_commit('inventory')
+
+
+@receiver(post_save, sender=BloodInventory)
+def publish_inventory_change(sender, instance, **kwargs):
+    events.publish_on_commit(events.INVENTORY, {
+        'type': 'set', 'id': instance.pk, 'blood_group': instance.blood_group, 'units': instance.units,
+    })
+
+
+@receiver(post_delete, sender=BloodInventory)
+def publish_inventory_delete(sender, instance, **kwargs):
+    events.publish_on_commit(events.INVENTORY, {'type': 'deleted', 'id': instance.pk})
+
+
+@receiver(pre_delete, sender=BloodBank)
+def keep_bank_rollups(sender, instance, **kwargs):
+    analytics.detach_bank(instance.pk)
+
+
+@receiver(post_save, sender=BloodBank)
+@receiver(post_delete, sender=BloodBank)
+def evict_bank_caches(sender, instance, **kwargs):
+    # inventory rows embed their bank
+    caching.invalidate_on_commit('banks', 'inventory')
+
+
+@receiver(post_save, sender=DonationRequest)
+def track_pending_requests(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        if instance.status == 'pending':
+            stats.bump(stats.PENDING, 1)
+    elif update_fields is None or 'status' in update_fields:
+        stats.refresh(stats.PENDING)
+
+
+@receiver(post_save, sender=DonationRequest)
+def count_new_request(sender, instance, created, **kwargs):
+    if created:
+        analytics.record_requests([instance])
+
+
+@receiver(post_save, sender=DonationRequest)
+def notify_donors_of_request(sender, instance, created, **kwargs):
+    if created and instance.status == 'pending':
+        tasks.enqueue(notifications.fan_out, {'request_id': instance.pk}, key=f'notify:{instance.pk}')
+
+
+@receiver(post_save, sender=DonationRequest)
+def publish_request_change(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        events.publish_on_commit(events.REQUESTS, {
+            'type': 'created', 'id': instance.pk, 'blood_group': instance.blood_group,
+            'units': instance.units, 'city': instance.city, 'status': instance.status,
+        })
+    elif update_fields is None or 'status' in update_fields:
+        events.publish_on_commit(events.REQUESTS, {'type': 'status', 'ids': [instance.pk], 'status': instance.status})
+
+
+@receiver(post_delete, sender=DonationRequest)
+def untrack_pending_request(sender, instance, **kwargs):
+    stats.refresh(stats.PENDING)
+
+
+@receiver(post_save, sender=User)
+def track_donor_count(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        if instance.role == 'donor':
+            stats.bump(stats.DONORS, 1)
+    elif update_fields is None or 'role' in update_fields:
+        stats.refresh(stats.DONORS)
+
+
+@receiver(post_delete, sender=User)
+def untrack_donor(sender, instance, **kwargs):
+    stats.refresh(stats.DONORS)
+
+
+@receiver(post_save, sender=DonationHistory)
+def update_donor_eligibility(sender, instance, created, **kwargs):
+    if created:
+        eligibility.record_history([instance])
+        analytics.record_history([instance])
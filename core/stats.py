@@ -0,0 +1,108 @@
+"""
+Dashboard aggregates.
+
+The dashboards read every number from DashboardStat in one query instead of
+summing BloodInventory and counting users and requests on each page load.
+Code paths that change stock or request status with queryset.update() (which
+fires no signals) bump the affected counters with an F() update in the same
+transaction. Model saves and deletes, e.g. from the Django admin, recompute
+just the affected key from the source table (see core.signals).
+"""
+from asgiref.sync import sync_to_async
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+
+from . import caching
+from .models import BLOOD_GROUPS, BloodInventory, DashboardStat, DonationRequest, User
+
+GROUPS = [code for code, _ in BLOOD_GROUPS]
+DONORS = 'donors'
+PENDING = 'pending_requests'
+
+
+def units_key(blood_group):
+    return f'units:{blood_group}'
+
+
+ALL_KEYS = [DONORS, PENDING] + [units_key(g) for g in GROUPS]
+
+
+def _compute(key):
+    if key == DONORS:
+        return User.objects.filter(role='donor').count()
+    if key == PENDING:
+        return DonationRequest.objects.filter(status='pending').count()
+    group = key.split(':', 1)[1]
+    return BloodInventory.objects.filter(blood_group=group).aggregate(total=Sum('units'))['total'] or 0
+
+
+def refresh(*keys):
+    """Recompute `keys` (default: all) from the source tables."""
+    keys = keys or ALL_KEYS
+    DashboardStat.objects.bulk_create(
+        [DashboardStat(key=key, value=_compute(key)) for key in keys],
+        update_conflicts=True,
+        unique_fields=['key'],
+        update_fields=['value'],
+    )
+    caching.invalidate_on_commit('stats')
+
+
+def refresh_groups(*groups):
+    refresh(*[units_key(g) for g in groups if g in GROUPS])
+
+
+def bump(key, delta):
+    if not delta:
+        return
+    if not DashboardStat.objects.filter(key=key).update(value=F('value') + delta):
+        # never computed yet: the source table already reflects the change
+        refresh(key)
+    else:
+        caching.invalidate_on_commit('stats')
+
+
+def bump_units(deltas):
+    """Apply {blood_group: unit delta} with a single UPDATE."""
+    deltas = {units_key(g): d for g, d in deltas.items() if d}
+    if len(deltas) < 2:
+        for key, delta in deltas.items():
+            bump(key, delta)
+        return
+    updated = DashboardStat.objects.filter(key__in=deltas).update(value=F('value') + Case(
+        *[When(key=key, then=Value(delta)) for key, delta in deltas.items()],
+        output_field=BigIntegerField(),
+    ))
+    if updated < len(deltas):
+        present = set(DashboardStat.objects.filter(key__in=deltas).values_list('key', flat=True))
+        refresh(*[key for key in deltas if key not in present])
+    caching.invalidate_on_commit('stats')
+
+
+def snapshot():
+    values = dict(DashboardStat.objects.values_list('key', 'value'))
+    missing = [key for key in ALL_KEYS if key not in values]
+    if missing:
+        refresh(*missing)
+        values.update(DashboardStat.objects.filter(key__in=missing).values_list('key', 'value'))
+    return _summary(values)
+
+
+async def asnapshot():
+    """snapshot() for async views; only a first-ever refresh leaves the event loop."""
+    values = {key: value async for key, value in DashboardStat.objects.values_list('key', 'value')}
+    missing = [key for key in ALL_KEYS if key not in values]
+    if missing:
+        await sync_to_async(refresh)(*missing)
+        async for key, value in DashboardStat.objects.filter(key__in=missing).values_list('key', 'value'):
+            values[key] = value
+    return _summary(values)
+
+
+def _summary(values):
+    return {
+        'total_donors': values[DONORS],
+        'pending_requests': values[PENDING],
+        'inventory_by_group': [
+            {'blood_group': g, 'total_units': values[units_key(g)]} for g in GROUPS
+        ],
+    }
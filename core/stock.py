@@ -0,0 +1,133 @@
+"""
+Periodic stock upkeep, run by the run_scheduler command.
+
+expire_lots() writes off lots past their expiry date. It works through
+inventory rows in keyset batches; each batch is one transaction with a
+grouped read of the expired units and set-based UPDATEs of the lots and their
+rows, whatever the number of banks. The rows are locked first, in the same
+order core.inventory locks them, so a sweep and an approval never deadlock.
+
+check_levels() compares every inventory row with settings.LOW_STOCK_THRESHOLD
+in one query. It opens a StockAlert for each new shortage and resolves the
+alerts of rows that have recovered. Then it sends one summary of the alerts
+not sent yet to the staff. A shortage stays one open alert until it recovers,
+so it is not re-sent on every run. A failed send is retried on the next run.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import caching, events, stats
+from .inventory import count_on_commit
+from .models import BloodInventory, BloodLot, StockAlert, User
+from .notifications import Notification, get_backend
+
+BATCH_SIZE = 500
+
+
+def low_stock_threshold():
+    return getattr(settings, 'LOW_STOCK_THRESHOLD', 5)
+
+
+def _expire_batch(inventory_ids, today):
+    expired = BloodLot.objects.filter(inventory_id__in=inventory_ids, expires_on__lt=today, units_left__gt=0)
+    with transaction.atomic():
+        groups = dict(
+            BloodInventory.objects.select_for_update().filter(id__in=inventory_ids)
+            .order_by('id').values_list('id', 'blood_group')
+        )
+        units = dict(
+            expired.order_by().values('inventory_id').annotate(units=Sum('units_left'))
+            .values_list('inventory_id', 'units')
+        )
+        if not units:
+            return 0
+        expired.update(expired_units=F('expired_units') + F('units_left'), units_left=0)
+        # Greatest: a row edited outside core.inventory may hold less than its lots
+        BloodInventory.objects.filter(id__in=units).update(units=Greatest(F('units') - Case(
+            *[When(id=inventory_id, then=Value(n)) for inventory_id, n in units.items()], default=Value(0),
+        ), Value(0)))
+        totals = defaultdict(int)
+        for inventory_id, n in units.items():
+            totals[groups[inventory_id]] -= n
+        stats.bump_units(totals)
+        count_on_commit('expire', totals)
+        caching.invalidate_on_commit('inventory')
+        events.publish_on_commit(events.INVENTORY, {
+            'type': 'expired', 'rows': [[inventory_id, -n] for inventory_id, n in units.items()],
+        })
+    return sum(units.values())
+
+
+def expire_lots(today=None, batch_size=BATCH_SIZE):
+    """Write off the units left in lots that expired before `today`; returns the units removed."""
+    today = today or timezone.localdate()
+    rows = (
+        BloodLot.objects.filter(expires_on__lt=today, units_left__gt=0)
+        .order_by('inventory_id').values_list('inventory_id', flat=True).distinct()
+    )
+    removed = 0
+    last = 0
+    while True:
+        batch = list(rows.filter(inventory_id__gt=last)[:batch_size])
+        if not batch:
+            return removed
+        removed += _expire_batch(batch, today)
+        last = batch[-1]
+
+
+def _open_alerts(threshold, now):
+    open_alert = StockAlert.objects.filter(inventory=OuterRef('pk'), resolved_at=None)
+    short = (
+        BloodInventory.objects.filter(units__lt=threshold)
+        .exclude(Exists(open_alert)).order_by().values_list('id', 'units')
+    )
+    # bulk_create returns the rows a concurrent tick beat us to as well, so count what actually landed
+    opened = StockAlert.objects.filter(resolved_at=None, raised_at=now)
+    before = opened.count()
+    StockAlert.objects.bulk_create(
+        [StockAlert(inventory_id=pk, threshold=threshold, units=units, raised_at=now) for pk, units in short],
+        batch_size=1000, ignore_conflicts=True,
+    )
+    return opened.count() - before
+
+
+def _summary(alerts):
+    by_bank = defaultdict(list)
+    for bank, city, group, units, threshold in alerts:
+        by_bank[(bank, city)].append(f'{group}: {units} (threshold {threshold})')
+    lines = [f'{bank}, {city}: ' + ', '.join(groups) for (bank, city), groups in sorted(by_bank.items())]
+    subject = f'Low blood stock at {len(by_bank)} bank(s)'
+    body = 'The following blood banks are running low:\n\n' + '\n'.join(lines) + '\n'
+    return subject, body
+
+
+def send_alerts():
+    """Send the staff one summary of the open alerts not sent yet; returns how many were covered."""
+    unsent = StockAlert.objects.filter(notified_at=None, resolved_at=None)
+    rows = list(unsent.order_by('id').values_list(
+        'id', 'inventory__blood_bank__name', 'inventory__blood_bank__city', 'inventory__blood_group',
+        'units', 'threshold',
+    ))
+    if not rows:
+        return 0
+    staff = User.objects.filter(is_staff=True, is_active=True).exclude(email='').values_list('id', 'email')
+    subject, body = _summary([row[1:] for row in rows])
+    get_backend().send([Notification(user_id, email, subject, body) for user_id, email in staff])
+    StockAlert.objects.filter(id__in=[row[0] for row in rows]).update(notified_at=timezone.now())
+    return len(rows)
+
+
+def check_levels(threshold=None):
+    """Open alerts for new shortages, resolve recovered ones and send what is new."""
+    threshold = low_stock_threshold() if threshold is None else threshold
+    now = timezone.now()
+    with transaction.atomic():
+        resolved = StockAlert.objects.filter(resolved_at=None, inventory__units__gte=threshold).update(resolved_at=now)
+        opened = _open_alerts(threshold, now)
+    sent = send_alerts()
+    return {'opened': opened, 'resolved': resolved, 'sent': sent}
@@ -0,0 +1,195 @@
+"""
+Synthetic data for load tests and benchmarks (see the generate_data command).
+
+Donors, blood banks, requests and donation history are written in chunks
+with bulk_create, one transaction per chunk, so memory stays flat from ten
+thousand to a million rows. Blood groups follow their usual population
+shares, cities are drawn from a fixed list with a few large ones dominating,
+and dates are spread over the last `days`, requests arriving as pending and
+most of the older ones decided. A fixed `seed` gives the same data again.
+
+As in core.imports, bulk_create sends no signals: search tokens are written
+per chunk, and eligibility, the analytics rollups and the dashboard counters
+are rebuilt once at the end.
+"""
+import random
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import analytics, caching, eligibility, inventory, search, stats
+from .models import BloodBank, DonationHistory, DonationRequest, DonorProfile, User
+
+BATCH_SIZE = 2000
+USERNAME_PREFIX = 'synth'
+
+KIND_WEIGHTS = {'whole_blood': 80, 'plasma': 10, 'platelets': 8, 'double_red': 2}
+GROUP_WEIGHTS = {'O+': 38, 'A+': 34, 'B+': 9, 'AB+': 3, 'O-': 7, 'A-': 6, 'B-': 2, 'AB-': 1}
+CITIES = [
+    ('Dhaka', 30), ('Chattogram', 14), ('Khulna', 8), ('Rajshahi', 8), ('Sylhet', 7), ('Barishal', 5),
+    ('Rangpur', 5), ('Mymensingh', 5), ('Cumilla', 4), ('Gazipur', 4), ('Narayanganj', 3), ('Bogura', 3),
+    ('Jessore', 2), ('Dinajpur', 1), ('Cox\'s Bazar', 1),
+]
+FIRST_NAMES = ['Rahim', 'Karim', 'Ayesha', 'Fatima', 'Nusrat', 'Tanvir', 'Sadia', 'Imran', 'Farhana', 'Arif']
+LAST_NAMES = ['Hossain', 'Rahman', 'Ahmed', 'Islam', 'Khan', 'Chowdhury', 'Akter', 'Uddin', 'Sarkar', 'Das']
+HOSPITALS = ['Medical College Hospital', 'General Hospital', 'Sadar Hospital', 'Specialized Hospital']
+
+
+@dataclass
+class Sizes:
+    donors: int
+    banks: int
+    requests: int
+    history: int
+
+    @classmethod
+    def for_rows(cls, rows):
+        """Split about `rows` database rows (users, profiles and tokens count as one donor each)."""
+        return cls(donors=rows * 3 // 20, banks=max(1, rows // 1000), requests=rows // 5, history=rows * 3 // 10)
+
+
+def _weighted(rng, choices, k):
+    values, weights = zip(*choices.items()) if isinstance(choices, dict) else zip(*choices)
+    return rng.choices(values, weights=weights, k=k)
+
+
+def _chunks(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def _moment(rng, days, now):
+    """A daytime moment within the last `days` days."""
+    day = now.date() - timedelta(days=rng.randint(0, days))
+    return timezone.make_aware(datetime.combine(day, time(rng.randint(7, 21), rng.randint(0, 59))))
+
+
+@contextmanager
+def _backdated():
+    # auto_now_add would stamp every generated row with the current time
+    fields = [DonationRequest._meta.get_field('created_at'), DonationHistory._meta.get_field('donated_at')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def create_banks(rng, count, batch_size=BATCH_SIZE):
+    cities = _weighted(rng, CITIES, count)
+    for start, size in _chunks(count, batch_size):
+        with transaction.atomic():
+            banks = BloodBank.objects.bulk_create([
+                BloodBank(
+                    name=f'{city} Blood Centre {start + i + 1}', city=city,
+                    address=f'{rng.randint(1, 200)} Hospital Road, {city}',
+                    contact=f'+8801{rng.randint(10**8, 10**9 - 1)}',
+                )
+                for i, city in enumerate(cities[start:start + size])
+            ])
+            inventory.seed_bank_inventory(banks, overrides={
+                bank.pk: {group: rng.randint(0, 60) for group in GROUP_WEIGHTS} for bank in banks
+            })
+
+
+def create_donors(rng, count, password=None, batch_size=BATCH_SIZE):
+    """Create `count` donor users with profiles; returns [(user_id, blood_group, city)]."""
+    hashed = make_password(password)
+    first = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    donors = []
+    for start, size in _chunks(count, batch_size):
+        groups = _weighted(rng, GROUP_WEIGHTS, size)
+        cities = _weighted(rng, CITIES, size)
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    username=f'{USERNAME_PREFIX}{first + start + i}',
+                    email=f'{USERNAME_PREFIX}{first + start + i}@example.com',
+                    first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                    password=hashed, role='donor',
+                )
+                for i in range(size)
+            ])
+            profiles = DonorProfile.objects.bulk_create([
+                DonorProfile(
+                    user_id=user.pk, phone=f'01{rng.randint(10**8, 10**9 - 1)}',
+                    blood_group=group, city=city, city_key=search.normalize(city),
+                )
+                for user, group, city in zip(users, groups, cities)
+            ])
+            search.index_profiles(profiles)
+        donors.extend((user.pk, group, city) for user, group, city in zip(users, groups, cities))
+    return donors
+
+
+def create_requests(rng, count, requesters, days, approver=None, batch_size=BATCH_SIZE):
+    now = timezone.localtime()
+    groups = _weighted(rng, GROUP_WEIGHTS, count)
+    with _backdated():
+        for start, size in _chunks(count, batch_size):
+            rows = []
+            for group in groups[start:start + size]:
+                user_id, _, city = rng.choice(requesters)
+                created_at = _moment(rng, days, now)
+                # the last fortnight is still being worked through
+                if (now - created_at).days < 14 and rng.random() < 0.7:
+                    status = 'pending'
+                else:
+                    status = 'approved' if rng.random() < 0.8 else 'rejected'
+                rows.append(DonationRequest(
+                    requester_id=user_id, blood_group=group, units=rng.choice((1, 1, 1, 2, 2, 3, 4)), city=city,
+                    hospital_name=f'{city} {rng.choice(HOSPITALS)}', status=status, created_at=created_at,
+                    approved_by=approver if status == 'approved' else None,
+                ))
+            with transaction.atomic():
+                DonationRequest.objects.bulk_create(rows)
+
+
+def create_history(rng, count, donors, bank_ids, days, batch_size=BATCH_SIZE):
+    now = timezone.localtime()
+    with _backdated():
+        for start, size in _chunks(count, batch_size):
+            rows = []
+            for _ in range(size):
+                user_id, group, _ = rng.choice(donors)
+                rows.append(DonationHistory(
+                    donor_id=user_id, blood_group=group, units=1, kind=_weighted(rng, KIND_WEIGHTS, 1)[0],
+                    blood_bank_id=rng.choice(bank_ids) if bank_ids else None,
+                    donated_at=_moment(rng, days, now),
+                ))
+            with transaction.atomic():
+                DonationHistory.objects.bulk_create(rows)
+
+
+def generate(sizes, days=730, seed=None, password=None, approver=None, batch_size=BATCH_SIZE, log=None):
+    """Write `sizes` worth of synthetic data and rebuild what depends on it; returns the row counts."""
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    log(f'Creating {sizes.banks} banks')
+    create_banks(rng, sizes.banks, batch_size)
+    log(f'Creating {sizes.donors} donors')
+    donors = create_donors(rng, sizes.donors, password, batch_size)
+    if not donors and (sizes.requests or sizes.history):
+        raise ValueError('Requests and history need at least one donor.')
+    log(f'Creating {sizes.requests} requests')
+    create_requests(rng, sizes.requests, donors, days, approver, batch_size)
+    log(f'Creating {sizes.history} donations')
+    bank_ids = list(BloodBank.objects.values_list('id', flat=True))
+    create_history(rng, sizes.history, donors, bank_ids, days, batch_size)
+
+    log('Rebuilding eligibility, rollups and counters')
+    eligibility.rebuild(batch_size)
+    today = timezone.localdate()
+    analytics.rebuild(today - timedelta(days=days), today)
+    stats.refresh()
+    caching.invalidate('banks', 'inventory', 'stats')
+    return {
+        'banks': sizes.banks, 'donors': len(donors), 'requests': sizes.requests, 'history': sizes.history,
+    }
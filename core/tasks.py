@@ -0,0 +1,170 @@
+"""
+Database-backed background tasks.
+
+enqueue() inserts a Task row inside the caller's transaction, so work is
+queued if and only if the change that caused it commits. The run_worker
+command claims due tasks with a conditional UPDATE (two workers never run the
+same task), runs them on a thread pool and retries failures with exponential
+backoff until max_attempts is reached. By default a handler and its "done"
+mark commit together, so a task's database effects are applied once.
+
+With settings.TASKS_EAGER (the default with DEBUG) the due tasks are run in
+process right after the enqueueing transaction commits instead, for
+development without a worker. Finished tasks are deleted by prune() after
+settings.TASKS_KEEP_DONE_DAYS; failed ones are kept for inspection.
+"""
+import logging
+import traceback
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 3600
+# a task still "running" after this long is assumed to belong to a dead worker
+STALE_AFTER = timedelta(minutes=10)
+
+_registry = {}
+
+
+def task(func=None, atomic=True):
+    """
+    Register `func` as a task handler; it is enqueued and looked up by dotted
+    path. Handlers with atomic=False manage their own transactions (e.g. to
+    commit progress in batches) and must be safe to run again after a failure.
+    """
+    if func is None:
+        return lambda f: task(f, atomic=atomic)
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    func.task_atomic = atomic
+    _registry[func.task_name] = func
+    return func
+
+
+def _handler(name):
+    if name not in _registry:
+        # importing the module runs its @task decorators
+        import_string(name)
+    return _registry[name]
+
+
+def _name(func_or_name):
+    return getattr(func_or_name, 'task_name', func_or_name)
+
+
+def enqueue_many(func_or_name, items, delay=None, max_attempts=MAX_ATTEMPTS):
+    """
+    Queue one task per (payload, idempotency_key) in `items`; the key may be
+    None. Items whose key was already queued are skipped.
+    """
+    name = _name(func_or_name)
+    run_after = timezone.now() + (delay or timedelta())
+    Task.objects.bulk_create(
+        [
+            Task(name=name, payload=payload or {}, idempotency_key=key,
+                 run_after=run_after, max_attempts=max_attempts)
+            for payload, key in items
+        ],
+        ignore_conflicts=True,
+    )
+    if getattr(settings, 'TASKS_EAGER', False):
+        transaction.on_commit(lambda: run_pending(name=name))
+
+
+def enqueue(func_or_name, payload=None, key=None, delay=None, max_attempts=MAX_ATTEMPTS):
+    enqueue_many(func_or_name, [(payload, key)], delay=delay, max_attempts=max_attempts)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def requeue_stale(now=None):
+    """Give tasks abandoned by a dead worker back to the queue (or fail them if out of attempts)."""
+    now = now or timezone.now()
+    stale = Task.objects.filter(status='running', started_at__lt=now - STALE_AFTER)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', last_error='Worker stopped while running the task.', updated_at=now,
+    )
+    return failed + stale.update(status='pending', run_after=now, updated_at=now)
+
+
+def prune(keep=None, batch_size=1000, now=None):
+    """Delete tasks finished more than `keep` ago (default: TASKS_KEEP_DONE_DAYS); returns rows deleted."""
+    now = now or timezone.now()
+    if keep is None:
+        keep = timedelta(days=getattr(settings, 'TASKS_KEEP_DONE_DAYS', 7))
+    old = Task.objects.filter(status='done', updated_at__lt=now - keep)
+    deleted = 0
+    while True:
+        ids = list(old.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Task.objects.filter(id__in=ids).delete()[0]
+
+
+def claim(limit, name=None, now=None):
+    """Mark up to `limit` due tasks as running and return them."""
+    now = now or timezone.now()
+    due = Task.objects.filter(status='pending', run_after__lte=now)
+    if name:
+        due = due.filter(name=name)
+    claimed = []
+    for task_id in due.order_by('run_after', 'id').values_list('id', flat=True)[:limit]:
+        if Task.objects.filter(id=task_id, status='pending').update(
+            status='running', started_at=now, attempts=F('attempts') + 1, updated_at=now,
+        ):
+            claimed.append(task_id)
+    return list(Task.objects.filter(id__in=claimed).order_by('run_after', 'id'))
+
+
+def run_task(task):
+    """Run one claimed task; returns True if it succeeded."""
+    try:
+        handler = _handler(task.name)
+        with transaction.atomic() if handler.task_atomic else nullcontext():
+            handler(**task.payload)
+            Task.objects.filter(pk=task.pk).update(status='done', last_error='', updated_at=timezone.now())
+    except Exception:
+        now = timezone.now()
+        error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            logger.error('Task %s #%s failed for good:\n%s', task.name, task.pk, error)
+            Task.objects.filter(pk=task.pk).update(status='failed', last_error=error, updated_at=now)
+        else:
+            logger.warning('Task %s #%s failed, attempt %s of %s', task.name, task.pk, task.attempts, task.max_attempts)
+            Task.objects.filter(pk=task.pk).update(
+                status='pending', last_error=error, run_after=now + backoff(task.attempts), updated_at=now,
+            )
+        return False
+    return True
+
+
+def _run_in_thread(task):
+    try:
+        return run_task(task)
+    finally:
+        connection.close()
+
+
+def run_pending(limit=100, threads=1, name=None):
+    """Claim and run up to `limit` due tasks; returns how many were run."""
+    claimed = claim(limit, name=name)
+    if threads > 1 and len(claimed) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(_run_in_thread, claimed))
+    else:
+        for task in claimed:
+            run_task(task)
+    return len(claimed)
@@ -1,3 +1,852 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gc
+import io
+import json
+import threading
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from bloodmgmt.database import databases
+
+from . import (
+    analytics, approvals, caching, compatibility, eligibility, imports, metrics, notifications, routers, search, stock as upkeep,
+    tasks,
+)
+from .allocation import ApprovalError, Draw, allocate, plan
+from .inventory import receive_lot, set_units
+from .models import (
+    ELIGIBLE_ALWAYS, ISSUED, BloodBank, DailyStat, BloodInventory, BloodLot, DonationHistory, DonationRequest, DonorProfile,
+    DonorNotification, DonorSearchToken, StockAlert, Task, User,
+)
+
+
+def make_user(username, **extra):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', **extra)
+
+
+def make_bank(name, city, units):
+    """A bank whose inventory is empty except for `units` ({blood_group: units})."""
+    bank = BloodBank.objects.create(name=name, city=city)
+    for row in bank.inventory.all():
+        set_units(row, units.get(row.blood_group, 0))
+    return bank
+
+
+def make_donor(username, blood_group='A+', city='Dhaka', **profile):
+    user = make_user(username, role='donor')
+    donor = user.donor_profile
+    donor.blood_group, donor.city = blood_group, city
+    for name, value in profile.items():
+        setattr(donor, name, value)
+    donor.save()
+    return donor
+
+
+def stock(bank, group):
+    return BloodInventory.objects.get(blood_bank=bank, blood_group=group).units
+
+
+def make_request(requester, blood_group='A+', units=1, city='Dhaka', hospital_name='General Hospital'):
+    return DonationRequest.objects.create(
+        requester=requester, blood_group=blood_group, units=units, city=city, hospital_name=hospital_name,
+    )
+
+
+class AllocateTests(TestCase):
+    def setUp(self):
+        self.requester = make_user('patient', role='donor')
+
+    def test_prefers_exact_group_and_local_bank(self):
+        local = make_bank('Local', 'Dhaka', {'A+': 3, 'O-': 10})
+        make_bank('Far', 'Khulna', {'A+': 10})
+        draws = allocate(make_request(self.requester, units=2))
+        self.assertEqual([(d.blood_bank_id, d.blood_group, d.units) for d in draws], [(local.pk, 'A+', 2)])
+        self.assertEqual(stock(local, 'A+'), 1)
+        self.assertEqual(stock(local, 'O-'), 10)
+
+    def test_splits_across_banks_and_groups(self):
+        local = make_bank('Local', 'Dhaka', {'A+': 1, 'O-': 1})
+        far = make_bank('Far', 'Khulna', {'A+': 2})
+        draws = allocate(make_request(self.requester, units=3))
+        self.assertEqual(
+            sorted((d.blood_bank_id, d.blood_group, d.units) for d in draws),
+            sorted([(local.pk, 'A+', 1), (far.pk, 'A+', 2)]),
+        )
+        self.assertEqual((stock(local, 'A+'), stock(far, 'A+'), stock(local, 'O-')), (0, 0, 1))
+
+    def test_not_enough_stock_changes_nothing(self):
+        bank = make_bank('Local', 'Dhaka', {'A+': 1})
+        with self.assertRaises(ApprovalError) as caught:
+            allocate(make_request(self.requester, units=2))
+        self.assertEqual(caught.exception.code, 'insufficient')
+        self.assertEqual(stock(bank, 'A+'), 1)
+
+    def test_replans_when_stock_moved(self):
+        bank = make_bank('Local', 'Dhaka', {'A+': 2})
+        row = bank.inventory.get(blood_group='A+')
+        req = make_request(self.requester, units=2)
+        # the first plan was read before another approval drew the stock
+        stale = [Draw(row.pk, bank.pk, 'A+', 5)]
+        with mock.patch('core.allocation.plan', side_effect=[stale, plan(req)]) as planned:
+            draws = allocate(req)
+        self.assertEqual(planned.call_count, 2)
+        self.assertEqual([d.units for d in draws], [2])
+        self.assertEqual(stock(bank, 'A+'), 0)
+
+
+@override_settings(TASKS_EAGER=False)
+class ProcessBatchTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('admin', is_staff=True, role='admin')
+        self.requester = make_user('patient', role='donor')
+
+    def test_approves_while_stock_lasts(self):
+        bank = make_bank('Local', 'Dhaka', {'A+': 5})
+        requests = [make_request(self.requester, units=2) for _ in range(3)]
+        results = approvals.process_batch('approve', self.admin, ids=[r.pk for r in requests])
+
+        self.assertEqual([r['status'] for r in results], ['approved', 'approved', 'error'])
+        self.assertEqual(stock(bank, 'A+'), 1)
+        self.assertEqual(
+            list(DonationRequest.objects.order_by('id').values_list('status', flat=True)),
+            ['approved', 'approved', 'pending'],
+        )
+        self.assertEqual(Task.objects.filter(name=approvals.record_approval.task_name).count(), 2)
+
+        tasks.run_pending()
+        issued = DonationHistory.objects.filter(donor=self.requester)
+        self.assertEqual(list(issued.values_list('kind', 'units')), [(ISSUED, 2), (ISSUED, 2)])
+        self.requester.donor_profile.refresh_from_db()
+        self.assertIsNone(self.requester.donor_profile.last_donated)
+
+    def test_reports_unknown_and_processed_ids(self):
+        make_bank('Local', 'Dhaka', {'A+': 5})
+        done = make_request(self.requester)
+        approvals.process_batch('reject', self.admin, ids=[done.pk])
+        pending = make_request(self.requester)
+        results = approvals.process_batch('approve', self.admin, ids=[done.pk, 999, pending.pk, pending.pk])
+        self.assertEqual(
+            sorted((r['id'], r['status']) for r in results),
+            [(done.pk, 'error'), (pending.pk, 'approved'), (999, 'error')],
+        )
+
+    def test_rejects_by_filter_in_chunks(self):
+        a_requests = [make_request(self.requester, 'A+') for _ in range(5)]
+        other = make_request(self.requester, 'B+')
+        results = approvals.process_batch('reject', self.admin, filters={'blood_group': 'A+'}, chunk_size=2)
+        self.assertEqual(sorted(r['id'] for r in results), [r.pk for r in a_requests])
+        self.assertEqual(DonationRequest.objects.filter(status='rejected').count(), 5)
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'pending')
+
+    def test_conflicting_chunk_is_redone_one_by_one(self):
+        bank = make_bank('Local', 'Dhaka', {'A+': 3})
+        requests = [make_request(self.requester, units=2) for _ in range(2)]
+        row = bank.inventory.get(blood_group='A+')
+        # the chunk plans against a snapshot taken before another writer drew stock
+        stale = [(row.pk, bank.pk, 'A+', 10, 'Dhaka', None)]
+        with mock.patch('core.approvals.candidate_rows', return_value=stale):
+            results = approvals.process_batch('approve', self.admin, ids=[r.pk for r in requests])
+        self.assertEqual([r['status'] for r in results], ['approved', 'error'])
+        self.assertEqual(stock(bank, 'A+'), 1)
+        self.assertEqual(DonationRequest.objects.filter(status='approved').count(), 1)
+
+
+class SetUnitsTests(TestCase):
+    def setUp(self):
+        self.bank = make_bank('Local', 'Dhaka', {'A+': 5})
+        self.row = self.bank.inventory.get(blood_group='A+')
+
+    def lots_total(self):
+        return sum(BloodLot.objects.filter(inventory=self.row).values_list('units_left', flat=True))
+
+    def test_compare_and_set(self):
+        self.assertTrue(set_units(self.row, 8, expected=5))
+        self.assertEqual((stock(self.bank, 'A+'), self.lots_total()), (8, 8))
+
+    def test_stale_expected_value_is_rejected(self):
+        stale = BloodInventory.objects.get(pk=self.row.pk)
+        # an approval draws stock after the admin loaded the page
+        set_units(self.row, 3, expected=5)
+        self.assertFalse(set_units(stale, 9, expected=5))
+        self.assertEqual((stock(self.bank, 'A+'), self.lots_total()), (3, 3))
+        self.assertEqual(stale.units, 5)
+
+    def test_inventory_page_reports_conflict(self):
+        self.client.force_login(make_user('admin', is_staff=True, role='admin'))
+        url = reverse('manage_inventory')
+        self.client.post(url, {'inventory_id': self.row.pk, 'units': 7, 'expected_units': 5})
+        response = self.client.post(url, {'inventory_id': self.row.pk, 'units': 1, 'expected_units': 5}, follow=True)
+        self.assertContains(response, 'changed meanwhile')
+        self.assertEqual(stock(self.bank, 'A+'), 7)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(make_user('admin', is_staff=True, role='admin'))
+        requester = make_user('patient', role='donor')
+        self.requests = [make_request(requester) for _ in range(7)]
+        self.requester = requester
+
+    def walk(self, url):
+        ids = []
+        while url:
+            data = self.api.get(url).json()
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+            if len(ids) == 3:
+                # rows arriving mid-walk neither repeat nor shift the later pages
+                make_request(self.requester)
+        return ids
+
+    def test_pages_cover_every_row_once(self):
+        ids = self.walk('/api/requests/?page_size=3')
+        self.assertEqual(ids, [r.pk for r in reversed(self.requests)])
+
+    def test_later_pages_cost_the_same(self):
+        with CaptureQueriesContext(connection) as first:
+            data = self.api.get('/api/requests/?page_size=2').json()
+        with self.assertNumQueries(len(first)):
+            self.api.get(data['next'])
+
+
+class ClaimTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def add(self, name='core.tests.noop', delay=0, **extra):
+        return Task.objects.create(name=name, run_after=self.now + timedelta(seconds=delay), **extra)
+
+    def test_claims_due_tasks_in_order(self):
+        later = self.add(delay=-10)
+        first = self.add(delay=-60)
+        self.add(delay=60)
+        self.add(status='done', delay=-60)
+        claimed = tasks.claim(10, now=self.now)
+        self.assertEqual([t.pk for t in claimed], [first.pk, later.pk])
+        self.assertTrue(all(t.status == 'running' and t.attempts == 1 for t in claimed))
+
+    def test_limit_and_name(self):
+        for _ in range(3):
+            self.add(delay=-1)
+        other = self.add(name='core.tests.other', delay=-1)
+        self.assertEqual([t.pk for t in tasks.claim(1, name='core.tests.other', now=self.now)], [other.pk])
+        self.assertEqual(len(tasks.claim(2, now=self.now)), 2)
+
+    def test_a_task_is_claimed_once(self):
+        self.add(delay=-1)
+        self.assertEqual(len(tasks.claim(5, now=self.now)), 1)
+        self.assertEqual(tasks.claim(5, now=self.now), [])
+
+    def test_lost_race_is_skipped(self):
+        task = self.add(delay=-1)
+        real_filter = Task.objects.filter
+
+        def racing(*args, **kwargs):
+            if kwargs.get('status') == 'pending' and 'id' in kwargs:
+                # another worker claims the row between the read and the UPDATE
+                real_filter(pk=task.pk).update(status='running')
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(Task.objects, 'filter', side_effect=racing):
+            self.assertEqual(tasks.claim(5, now=self.now), [])
+
+
+class DonorApiTests(TestCase):
+    def setUp(self):
+        self.donor = make_user('donor', role='donor', first_name='Rahim')
+        profile = self.donor.donor_profile
+        profile.phone = '01700000000'
+        profile.blood_group = 'A+'
+        profile.city = 'Dhaka'
+        profile.last_donated = timezone.localdate()
+        profile.save()
+        self.api = APIClient()
+
+    def test_other_users_see_no_contact_details(self):
+        self.api.force_authenticate(make_user('newcomer', role='donor'))
+        listed = self.api.get('/api/donors/?blood_group=A%2B').json()['results']
+        self.assertEqual([row['user']['username'] for row in listed], ['donor'])
+        one = self.api.get(f'/api/donors/{self.donor.donor_profile.pk}/').json()
+        for row in (listed[0], one):
+            self.assertEqual(set(row), {'id', 'user', 'blood_group', 'city'})
+            self.assertNotIn('email', row['user'])
+
+    def test_staff_see_contact_details(self):
+        self.api.force_authenticate(make_user('admin', is_staff=True, role='admin'))
+        row = self.api.get('/api/donors/?blood_group=A%2B').json()['results'][0]
+        self.assertEqual((row['phone'], row['user']['email']), ('01700000000', 'donor@example.com'))
+        self.assertIsNotNone(row['last_donated'])
+
+
+class SearchTests(TestCase):
+    def test_city_is_normalized_and_tokenized(self):
+        donor = make_donor('d1', city='São Paulo-East')
+        self.assertEqual(donor.city_key, 'sao paulo east')
+        tokens = DonorSearchToken.objects.filter(profile=donor).order_by('token').values_list('token', flat=True)
+        self.assertEqual(list(tokens), ['east', 'paulo', 'sao'])
+        donor.city = 'Dhaka'
+        donor.save()
+        self.assertEqual(list(DonorSearchToken.objects.filter(profile=donor).values_list('token', flat=True)), ['dhaka'])
+
+    def test_parse_query(self):
+        self.assertEqual(search.parse_query("o- Cox's Bazar"), ('O-', ['cox', 's', 'bazar']))
+        self.assertEqual(search.parse_query('dhaka'), (None, ['dhaka']))
+
+    def test_exact_city_ranks_first_and_prefixes_match(self):
+        suburb = make_donor('d1', city='Dhaka Cantonment')
+        other = make_donor('d2', city='North Dhaka')
+        exact = make_donor('d3', city='Dhaka')
+        make_donor('d4', city='Khulna')
+        make_donor('d5', blood_group='B+', city='Dhaka')
+        page = search.search('A+ dhaka')
+        self.assertEqual([p.pk for p in page.results], [exact.pk, suburb.pk, other.pk])
+        self.assertEqual([p.pk for p in search.search('dhak', blood_group='A+').results], [exact.pk, suburb.pk, other.pk])
+
+    def test_empty_query_returns_nothing(self):
+        make_donor('d1')
+        self.assertEqual(search.search('').results, [])
+
+    def test_cursors_walk_both_ways(self):
+        for i in range(25):
+            make_donor(f'd{i}', city=['Dhaka', 'Dhaka Cantonment', 'Dhakuria'][i % 3])
+        expected = [p.pk for p in search.build_queryset(terms=['dhak'])]
+        pages = [search.search('dhak', page_size=10)]
+        while pages[-1].has_next:
+            pages.append(search.search('dhak', page_size=10, after=pages[-1].next_cursor))
+        self.assertEqual([p.pk for page in pages for p in page.results], expected)
+        self.assertEqual(len(pages), 3)
+        self.assertFalse(pages[0].has_previous)
+
+        back = search.search('dhak', page_size=10, before=pages[2].previous_cursor)
+        self.assertEqual(back.results, pages[1].results)
+        self.assertTrue(back.has_previous and back.has_next)
+        first = search.search('dhak', page_size=10, before=back.previous_cursor)
+        self.assertEqual(first.results, pages[0].results)
+        self.assertFalse(first.has_previous)
+
+    def test_tampered_cursor_starts_over(self):
+        for i in range(3):
+            make_donor(f'd{i}')
+        page = search.search('dhaka', page_size=2, after='not-a-cursor')
+        self.assertEqual(len(page.results), 2)
+        self.assertFalse(page.has_previous)
+
+
+class CompatibilityTests(TestCase):
+    def test_matrix(self):
+        expected = {
+            'O-': {'O-', 'O+', 'A-', 'A+', 'B-', 'B+', 'AB-', 'AB+'},
+            'O+': {'O+', 'A+', 'B+', 'AB+'},
+            'A-': {'A-', 'A+', 'AB-', 'AB+'},
+            'A+': {'A+', 'AB+'},
+            'B-': {'B-', 'B+', 'AB-', 'AB+'},
+            'B+': {'B+', 'AB+'},
+            'AB-': {'AB-', 'AB+'},
+            'AB+': {'AB+'},
+        }
+        self.assertEqual({d: set(r) for d, r in compatibility.DONOR_TO_RECIPIENTS.items()}, expected)
+        for donor, recipients in expected.items():
+            for recipient in compatibility.GROUPS:
+                self.assertEqual(compatibility.can_receive(recipient, donor), recipient in recipients)
+
+    def test_sources_exact_first_o_negative_last(self):
+        self.assertEqual(compatibility.source_groups('A+'), ('A+', 'O+', 'A-', 'O-'))
+        self.assertEqual(compatibility.source_groups('O-'), ('O-',))
+        for recipient in compatibility.GROUPS:
+            sources = compatibility.source_groups(recipient)
+            self.assertEqual(sources[0], recipient)
+            self.assertEqual(sources[-1], 'O-')
+        self.assertEqual(compatibility.source_groups('X'), ())
+
+    def test_candidate_sources_sum_stock_per_group(self):
+        make_bank('One', 'Dhaka', {'A+': 2, 'O-': 1})
+        make_bank('Two', 'Khulna', {'A+': 3, 'B+': 9})
+        self.assertEqual(compatibility.candidate_sources('A+'), [
+            {'blood_group': 'A+', 'rank': 0, 'exact': True, 'total_units': 5, 'banks': 2},
+            {'blood_group': 'O-', 'rank': 3, 'exact': False, 'total_units': 1, 'banks': 1},
+        ])
+
+
+class EligibilityTests(TestCase):
+    def setUp(self):
+        self.donor = make_donor('donor')
+        self.today = timezone.localdate()
+
+    def donate(self, kind='whole_blood', days_ago=0):
+        entry = DonationHistory.objects.create(donor=self.donor.user, blood_group='A+', units=1, kind=kind)
+        if days_ago:
+            DonationHistory.objects.filter(pk=entry.pk).update(donated_at=entry.donated_at - timedelta(days=days_ago))
+        return entry
+
+    def state(self):
+        self.donor.refresh_from_db()
+        return self.donor.last_donated, self.donor.next_eligible_on
+
+    def eligible_ids(self):
+        return list(DonorProfile.objects.filter(eligibility.eligible_q()).values_list('id', flat=True))
+
+    def test_new_donor_is_eligible(self):
+        self.assertEqual(self.state(), (None, ELIGIBLE_ALWAYS))
+        self.assertEqual(self.eligible_ids(), [self.donor.pk])
+
+    def test_donation_defers_by_its_kind(self):
+        self.donate('double_red')
+        self.donate('plasma')
+        # the shorter plasma deferral does not cut the double red one short
+        self.assertEqual(self.state(), (self.today, self.today + timedelta(days=112)))
+        self.assertEqual(self.eligible_ids(), [])
+
+    @override_settings(DONATION_DEFERRAL_DAYS={'platelets': 2})
+    def test_deferral_is_configurable(self):
+        self.donate('platelets')
+        self.assertEqual(self.state(), (self.today, self.today + timedelta(days=2)))
+
+    def test_issued_blood_does_not_defer(self):
+        self.donate(ISSUED)
+        self.assertEqual(self.state(), (None, ELIGIBLE_ALWAYS))
+
+    def test_dates_never_move_back(self):
+        self.donate()
+        last_week = self.today - timedelta(days=7)
+        eligibility.record_donations({self.donor.user_id: (last_week, last_week + timedelta(days=56))})
+        self.assertEqual(self.state(), (self.today, self.today + timedelta(days=56)))
+
+    def test_rebuild_matches_history(self):
+        self.donate('whole_blood', days_ago=60)
+        self.donate('plasma', days_ago=10)
+        self.donate(ISSUED)
+        DonorProfile.objects.filter(pk=self.donor.pk).update(last_donated=None, next_eligible_on=ELIGIBLE_ALWAYS)
+        self.assertEqual(eligibility.rebuild(), 1)
+        ten_days_ago = self.today - timedelta(days=10)
+        self.assertEqual(self.state(), (ten_days_ago, ten_days_ago + timedelta(days=28)))
+        self.assertEqual(eligibility.rebuild(), 0)
+
+    def test_rebuild_keeps_a_later_date_entered_by_hand(self):
+        self.donate('plasma', days_ago=30)
+        yesterday = self.today - timedelta(days=1)
+        DonorProfile.objects.filter(pk=self.donor.pk).update(last_donated=yesterday)
+        eligibility.rebuild()
+        self.assertEqual(self.state(), (yesterday, yesterday + timedelta(days=56)))
+
+
+@override_settings(TASKS_EAGER=False, NOTIFICATION_BACKEND='core.notifications.EmailBackend')
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.requester = make_donor('patient', blood_group='A+')
+        self.matching = [
+            make_donor('a_pos', blood_group='A+', city='dhaka'),
+            make_donor('o_neg', blood_group='O-', city='Dhaka '),
+        ]
+        make_donor('b_pos', blood_group='B+')
+        make_donor('far', blood_group='A+', city='Khulna')
+        make_donor('resting', blood_group='A+', last_donated=timezone.localdate())
+
+    def new_request(self):
+        return make_request(self.requester.user)
+
+    def test_recipients_are_compatible_eligible_and_local(self):
+        rows = notifications.recipients(self.new_request())
+        self.assertEqual([row[0] for row in rows], [p.pk for p in self.matching])
+
+    def test_each_donor_is_told_once(self):
+        req = self.new_request()
+        self.assertEqual(notifications.fan_out(req.pk, batch_size=1), 2)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a_pos@example.com', 'o_neg@example.com'])
+        self.assertEqual(notifications.fan_out(req.pk), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_rate_limit_across_requests(self):
+        notifications.fan_out(self.new_request().pk)
+        self.assertEqual(notifications.fan_out(self.new_request().pk), 0)
+        DonorNotification.objects.update(sent_at=timezone.now() - timedelta(hours=25))
+        self.assertEqual(notifications.fan_out(self.new_request().pk), 2)
+
+    def test_retry_sends_only_what_was_not_sent(self):
+        req = self.new_request()
+        with mock.patch.object(notifications.EmailBackend, 'send', side_effect=OSError('relay down')):
+            with self.assertRaises(OSError):
+                notifications.fan_out(req.pk)
+        self.assertEqual(DonorNotification.objects.filter(sent_at=None).count(), 2)
+        self.assertEqual(notifications.fan_out(req.pk), 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_decided_requests_are_skipped(self):
+        req = self.new_request()
+        DonationRequest.objects.filter(pk=req.pk).update(status='rejected')
+        self.assertEqual(notifications.fan_out(req.pk), 0)
+        self.assertEqual(mail.outbox, [])
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(make_user('admin', is_staff=True, role='admin'))
+
+    def read(self, body, fmt):
+        return imports.read_records(imports.text_stream(io.BytesIO(body)), fmt)
+
+    def test_donors_from_csv_with_errors_per_line(self):
+        body = (
+            b'username,email,blood_group,city,last_donated\n'
+            b'rahim,rahim@example.com,a+,Dhaka,2020-01-02\n'
+            b',nobody@example.com,A+,Dhaka,\n'
+            b'karim,karim@example.com,Z+,Dhaka,\n'
+            b'rahim2,RAHIM@example.com,O-,Dhaka,\n'
+            b'ayesha,ayesha@example.com,B+,Dhaka,yesterday\n'
+        )
+        result = imports.import_donors(self.read(body, 'csv'))
+        self.assertEqual((result.created, result.skipped), (1, 4))
+        self.assertEqual([e['line'] for e in result.errors], [3, 4, 5, 6])
+        profile = DonorProfile.objects.get(user__username='rahim')
+        self.assertEqual((profile.blood_group, profile.last_donated), ('A+', date(2020, 1, 2)))
+        self.assertEqual(list(profile.search_tokens.values_list('token', flat=True)), ['dhaka'])
+
+    def test_existing_accounts_are_skipped(self):
+        make_user('rahim')
+        result = imports.import_donors(enumerate([{'username': 'rahim', 'email': 'new@example.com'}], start=1))
+        self.assertEqual((result.created, result.errors[0]['line']), (0, 1))
+
+    def test_dry_run_writes_nothing(self):
+        result = imports.import_banks(enumerate([{'name': 'A'}, {'name': 'B'}], start=1), dry_run=True)
+        self.assertEqual(result.created, 2)
+        self.assertFalse(BloodBank.objects.exists())
+
+    def test_unreadable_records_are_reported_and_the_rest_imported(self):
+        body = b'{"name": "A", "A+": 4}\nnot json\n[1]\n{"name": "B"}\n'
+        upload = SimpleUploadedFile('banks.ndjson', body)
+        response = self.api.post('/api/bloodbanks/import/', {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['created'], data['skipped']), (2, 2))
+        self.assertEqual([e['line'] for e in data['errors']], [2, 3])
+        self.assertEqual(stock(BloodBank.objects.get(name='A'), 'A+'), 4)
+
+    def test_non_object_items_in_a_json_body(self):
+        response = self.api.post('/api/bloodbanks/import/', [{'name': 'A'}, 5, 'x'], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['errors'], [
+            {'line': 2, 'error': 'Each record must be an object.'},
+            {'line': 3, 'error': 'Each record must be an object.'},
+        ])
+
+    def test_a_json_file_must_be_a_list(self):
+        upload = SimpleUploadedFile('banks.json', b'{"name": "A"}')
+        self.assertEqual(self.api.post('/api/bloodbanks/import/', {'file': upload}).status_code, 400)
+        self.assertFalse(BloodBank.objects.exists())
+
+    def test_bad_encoding_stops_with_an_error(self):
+        # large enough that the bad bytes arrive after the first chunks were read
+        body = b'name,city\n' + b'A,Dhaka\n' * 2000 + b'\xff\xfe,x\n'
+        result = imports.import_banks(self.read(body, 'csv'), batch_size=500)
+        self.assertGreater(result.created, 0)
+        self.assertEqual(len(result.errors), 1)
+        self.assertIn('Could not read', result.errors[0]['error'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(make_user('admin', is_staff=True, role='admin'))
+        donor = make_donor('donor').user
+        bank = make_bank('Local', 'Dhaka', {})
+        self.today = timezone.localdate()
+        self.rows = []
+        for days_ago in (10, 5, 0):
+            entry = DonationHistory.objects.create(donor=donor, blood_group='A+', units=1, blood_bank=bank)
+            DonationHistory.objects.filter(pk=entry.pk).update(donated_at=entry.donated_at - timedelta(days=days_ago))
+            self.rows.append(entry.pk)
+        DonationHistory.objects.filter(pk=self.rows[-1]).update(kind='plasma')
+
+    def export(self, query=''):
+        return self.client.get(f'/custom_admin/export/history/{query}')
+
+    def csv_ids(self, response):
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        return [int(row['id']) for row in csv.DictReader(lines)]
+
+    def test_csv_streams_every_row_oldest_first(self):
+        response = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(self.csv_ids(response), self.rows)
+
+    def test_date_filters_are_inclusive_days(self):
+        since = (self.today - timedelta(days=5)).isoformat()
+        self.assertEqual(self.csv_ids(self.export(f'?start={since}')), self.rows[1:])
+        self.assertEqual(self.csv_ids(self.export(f'?start={since}&end={since}')), self.rows[1:2])
+
+    def test_ndjson(self):
+        response = self.export('?format=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], self.rows)
+        self.assertEqual(rows[0]['donor_username'], 'donor')
+        self.assertEqual([row['kind'] for row in rows], ['whole_blood', 'whole_blood', 'plasma'])
+
+    def test_bad_parameters_are_rejected(self):
+        for query in ('?start=foo', '?end=2024-02-30', '?format=xml'):
+            self.assertEqual(self.export(query).status_code, 400, query)
+        self.assertEqual(self.client.get('/custom_admin/export/users/').status_code, 400)
+
+    def test_staff_only(self):
+        self.client.force_login(make_user('visitor', role='donor'))
+        self.assertEqual(self.export().status_code, 302)
+
+
+class ExpireLotsTests(TestCase):
+    def test_expired_units_are_written_off(self):
+        bank = make_bank('Local', 'Dhaka', {})
+        row = bank.inventory.get(blood_group='A+')
+        today = timezone.localdate()
+        old = receive_lot(row, 3, expires_on=today - timedelta(days=1))
+        fresh = receive_lot(row, 2, expires_on=today + timedelta(days=7))
+        self.assertEqual(upkeep.expire_lots(today), 3)
+        self.assertEqual(stock(bank, 'A+'), 2)
+        old.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((old.units_left, old.expired_units, fresh.units_left), (0, 3, 2))
+        self.assertEqual(upkeep.expire_lots(today), 0)
+
+
+@override_settings(NOTIFICATION_BACKEND='core.notifications.EmailBackend')
+class CheckLevelsTests(TestCase):
+    def setUp(self):
+        make_user('admin', is_staff=True, role='admin')
+        self.bank = make_bank('Local', 'Dhaka', {group: 10 for group in compatibility.GROUPS})
+        self.row = self.bank.inventory.get(blood_group='A+')
+
+    def test_a_shortage_is_reported_once_until_it_recovers(self):
+        set_units(self.row, 2)
+        self.assertEqual(upkeep.check_levels(5), {'opened': 1, 'resolved': 0, 'sent': 1})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('A+: 2 (threshold 5)', mail.outbox[0].body)
+        self.assertEqual(upkeep.check_levels(5), {'opened': 0, 'resolved': 0, 'sent': 0})
+        self.assertEqual(len(mail.outbox), 1)
+
+        set_units(self.row, 8)
+        self.assertEqual(upkeep.check_levels(5), {'opened': 0, 'resolved': 1, 'sent': 0})
+        set_units(self.row, 1)
+        self.assertEqual(upkeep.check_levels(5)['opened'], 1)
+        self.assertEqual(StockAlert.objects.count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_a_failed_send_is_retried(self):
+        set_units(self.row, 2)
+        with mock.patch.object(notifications.EmailBackend, 'send', side_effect=OSError('relay down')):
+            with self.assertRaises(OSError):
+                upkeep.check_levels(5)
+        self.assertEqual(StockAlert.objects.filter(notified_at=None).count(), 1)
+        self.assertEqual(upkeep.check_levels(5), {'opened': 0, 'resolved': 0, 'sent': 1})
+
+
+@override_settings(TASKS_EAGER=False)
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.admin = make_user('admin', is_staff=True, role='admin')
+        self.donor = make_donor('donor').user
+        self.bank = make_bank('Central', 'Dhaka', {'A+': 10})
+
+    def rollups(self):
+        return list(
+            DailyStat.objects.order_by(F('blood_bank_id').asc(nulls_first=True), 'day', 'blood_group', 'city')
+            .values_list(
+                'day', 'blood_group', 'blood_bank_id', 'city',
+                'donated_units', 'requested_units', 'approved_units', 'rejected_units',
+            )
+        )
+
+    def assert_matches_rebuild(self):
+        incremental = self.rollups()
+        analytics.rebuild(self.today, self.today)
+        self.assertEqual(incremental, self.rollups())
+        return incremental
+
+    def test_bump_creates_then_adds(self):
+        key = (self.today, 'O-', None, 'dhaka')
+        analytics.bump({key: {'requested_units': 2, 'approved_units': 0}})
+        analytics.bump({key: {'requested_units': 3}})
+        self.assertEqual(self.rollups(), [(self.today, 'O-', None, 'dhaka', 0, 5, 0, 0)])
+
+    def test_incremental_updates_match_rebuild(self):
+        DonationHistory.objects.create(donor=self.donor, blood_group='A+', units=2, blood_bank=self.bank)
+        DonationHistory.objects.create(donor=self.donor, blood_group='A+', units=1)
+        approve, reject = make_request(self.donor, units=3), make_request(self.donor, units=1, city='DHAKA')
+        approvals.process_batch('approve', self.admin, ids=[approve.pk])
+        approvals.process_batch('reject', self.admin, ids=[reject.pk])
+        tasks.run_pending()
+        self.assertEqual(self.assert_matches_rebuild(), [
+            (self.today, 'A+', None, '', 1, 0, 0, 0),
+            (self.today, 'A+', None, 'dhaka', 0, 4, 3, 1),
+            (self.today, 'A+', self.bank.pk, 'dhaka', 2, 0, 0, 0),
+        ])
+
+    def test_reports(self):
+        DonationHistory.objects.create(donor=self.donor, blood_group='A+', units=2, blood_bank=self.bank)
+        DonationHistory.objects.create(donor=self.donor, blood_group='B+', units=5)
+        self.assertEqual(
+            analytics.timeseries('donated_units', self.today, self.today),
+            [{'period': self.today, 'value': 7}],
+        )
+        self.assertEqual(
+            analytics.top('donated_units', 'bank', self.today, self.today),
+            [{'key': self.bank.pk, 'name': 'Central', 'value': 2}],
+        )
+        self.assertEqual(
+            [row['key'] for row in analytics.top('donated_units', 'blood_group', self.today, self.today)],
+            ['B+', 'A+'],
+        )
+
+    def test_deleting_a_bank_keeps_its_totals(self):
+        other = make_bank('Other', 'Khulna', {})
+        for bank in (self.bank, other, None):
+            DonationHistory.objects.create(donor=self.donor, blood_group='A+', units=2, blood_bank=bank)
+        self.bank.delete()
+        other.delete()
+        self.assertEqual(self.assert_matches_rebuild(), [(self.today, 'A+', None, '', 6, 0, 0, 0)])
+
+
+class CachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = []
+
+    def get(self, namespace, user=None):
+        return caching.cached(namespace, ['list'], lambda: self.builds.append(namespace) or len(self.builds), user=user)
+
+    def test_invalidate_drops_only_its_namespace(self):
+        self.assertEqual((self.get('banks'), self.get('banks'), self.get('inventory')), (1, 1, 2))
+        caching.invalidate('banks')
+        self.assertEqual((self.get('banks'), self.get('inventory')), (3, 2))
+
+    def test_keys_vary_by_role_not_user(self):
+        staff = make_user('admin', is_staff=True, role='admin')
+        first, second = make_user('d1', role='donor'), make_user('d2', role='donor')
+        self.assertEqual([self.get('banks', u) for u in (staff, first, second, None)], [1, 2, 2, 3])
+
+    def test_invalidate_on_commit_waits_for_the_commit(self):
+        self.get('banks')
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.invalidate_on_commit('banks')
+            self.assertEqual(self.get('banks'), 1)
+        self.assertEqual(self.get('banks'), 2)
+
+    def test_cached_api_list_sees_a_new_bank(self):
+        api = APIClient()
+        api.force_authenticate(make_user('admin', is_staff=True, role='admin'))
+        self.assertEqual(api.get('/api/bloodbanks/').json()['results'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            BloodBank.objects.create(name='New', city='Dhaka')
+        self.assertEqual([b['name'] for b in api.get('/api/bloodbanks/').json()['results']], ['New'])
+        self.assertGreaterEqual(caching.cache_stats()['banks']['misses'], 2)
+
+
+@mock.patch('core.routers.replica_configured', return_value=True)
+class RouterTests(SimpleTestCase):
+    def respond(self, cookies=None, write=False):
+        """Run a view through the stickiness middleware; returns (aliases it read from, response)."""
+        seen = []
+
+        @routers.use_replica
+        def view(request):
+            seen.append(routers.read_alias())
+            if write:
+                routers.PrimaryReplicaRouter().db_for_write(BloodBank)
+                seen.append(routers.read_alias())
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        response = routers.ReplicaStickinessMiddleware(view)(request)
+        return seen, response
+
+    def test_only_marked_reads_use_the_replica(self, configured):
+        self.assertEqual(routers.read_alias(), routers.PRIMARY)
+        with routers.use_replica():
+            self.assertEqual(routers.read_alias(), routers.REPLICA)
+        self.assertEqual(routers.read_alias(), routers.PRIMARY)
+
+    def test_a_write_pins_the_rest_of_the_request_and_the_next_ones(self, configured):
+        seen, response = self.respond(write=True)
+        self.assertEqual(seen, [routers.REPLICA, routers.PRIMARY])
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        seen, response = self.respond(cookies={routers.STICKY_COOKIE: '1'})
+        self.assertEqual(seen, [routers.PRIMARY])
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+    def test_reads_without_writes_stay_on_the_replica(self, configured):
+        seen, response = self.respond()
+        self.assertEqual(seen, [routers.REPLICA])
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+    def test_no_replica_no_routing(self, configured):
+        configured.return_value = False
+        seen, response = self.respond(write=True)
+        self.assertEqual(seen, [routers.PRIMARY, routers.PRIMARY])
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+    def test_async_views(self, configured):
+        @routers.use_replica
+        async def view(request):
+            return routers.read_alias()
+
+        self.assertEqual(asyncio.run(view(None)), routers.REPLICA)
+
+
+@override_settings(METRICS_DIR='')
+class MetricsTests(SimpleTestCase):
+    def logins(self, result):
+        return metrics.local_values().get((metrics.LOGINS.name, (result,)), 0)
+
+    def test_exited_threads_keep_their_counts(self):
+        def worker():
+            for _ in range(100):
+                metrics.LOGINS.inc(result='thread-test')
+
+        before, shards = self.logins('thread-test'), len(metrics._shards)
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gc.collect()
+        self.assertEqual(self.logins('thread-test'), before + 400)
+        self.assertLessEqual(len(metrics._shards), shards)
+
+    def test_render(self):
+        metrics.LOGINS.inc(result='render-test')
+        metrics.HTTP_LATENCY.observe(0.02, view='render-test', method='GET', status='2xx')
+        snapshot = {'inventory_by_group': [{'blood_group': 'A+', 'total_units': 7}], 'pending_requests': 3}
+        with mock.patch('core.stats.snapshot', return_value=snapshot) as read:
+            text = metrics.render()
+        read.assert_called_once()
+        self.assertIn('# TYPE bloodmgmt_logins_total counter', text)
+        self.assertIn('bloodmgmt_logins_total{result="render-test"}', text)
+        self.assertIn('bloodmgmt_stock_units{blood_group="A+"} 7', text)
+        self.assertIn('bloodmgmt_pending_requests 3', text)
+        labels = 'view="render-test",method="GET",status="2xx"'
+        self.assertIn(f'bloodmgmt_http_request_duration_seconds_bucket{{{labels},le="0.01"}} 0', text)
+        self.assertIn(f'bloodmgmt_http_request_duration_seconds_bucket{{{labels},le="0.025"}} 1', text)
+        self.assertIn(f'bloodmgmt_http_request_duration_seconds_count{{{labels}}} 1', text)
+
+
+class DatabaseConfigTests(SimpleTestCase):
+    def test_connections_are_not_kept_under_asgi(self):
+        self.assertEqual(databases(settings.BASE_DIR, {})['default']['CONN_MAX_AGE'], 600)
+        self.assertEqual(databases(settings.BASE_DIR, {'BLOODMGMT_ASGI': '1'})['default']['CONN_MAX_AGE'], 0)
+        env = {'BLOODMGMT_ASGI': '1', 'BLOODMGMT_DB_CONN_MAX_AGE': '60'}
+        self.assertEqual(databases(settings.BASE_DIR, env)['default']['CONN_MAX_AGE'], 60)
@@ -1,15 +1,17 @@
 # core/urls.py
 from django.urls import path, include
 from rest_framework import routers
-from . import views
+from . import async_views, views
 
 
 router = routers.DefaultRouter()
 router.register(r'api/users', views.UserViewSet, basename='api-users')
+router.register(r'api/donors', views.DonorProfileViewSet, basename='api-donors')
 router.register(r'api/bloodbanks', views.BloodBankViewSet, basename='api-bloodbanks')
 router.register(r'api/inventory', views.BloodInventoryViewSet, basename='api-inventory')
 router.register(r'api/requests', views.DonationRequestViewSet, basename='api-requests')
 router.register(r'api/history', views.DonationHistoryViewSet, basename='api-history')
+router.register(r'api/analytics', views.AnalyticsViewSet, basename='api-analytics')
 
 urlpatterns = [
 
@@ -30,12 +32,25 @@ urlpatterns = [
     path('custom_admin/requests/', views.admin_requests, name='admin_requests'),
     path('custom_admin/requests/approve/<int:pk>/', views.admin_request_approve, name='admin_request_approve'),
     path('custom_admin/requests/reject/<int:pk>/', views.admin_request_reject, name='admin_request_reject'),
+    path('custom_admin/requests/bulk/', views.admin_requests_bulk, name='admin_requests_bulk'),
     path('custom_admin/donors/', views.admin_donors, name='admin_donors'),
     path('custom_admin/inventory/', views.manage_inventory, name='manage_inventory'),
     path('custom_admin/inventory/update/<int:pk>/', views.update_inventory, name='update_inventory'),
+    path('custom_admin/cache/', views.cache_stats, name='cache_stats'),
+    path('custom_admin/profiling/', views.profiling_stats, name='profiling_stats'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('custom_admin/events/', views.admin_events, name='admin_events'),
+    path('custom_admin/export/<str:kind>/', views.export_data, name='export_data'),
 
 
 
 
+    path('async/dashboard/', async_views.dashboard, name='async_dashboard'),
+    path('async/search_donors/', async_views.search_donors, name='async_search_donors'),
+    *[
+        path(f'async/api/{kind}/', async_views.api_list, {'kind': kind}, name=f'async-api-{kind}')
+        for kind in async_views.LISTS
+    ],
+
     path('', include(router.urls)),
 ]
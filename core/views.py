@@ -1,3 +1,5 @@
+import asyncio
+from collections import Counter
 
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
@@ -5,33 +7,69 @@ from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseBadRequest
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date
+from django.core.exceptions import ValidationError
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.db.models import Sum, Q
-from django.db import transaction
 from django.views.decorators.http import require_POST
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django import forms
-from django.views.decorators.csrf import csrf_exempt
 
 from .models import (
     User, DonorProfile, BloodBank, BloodInventory,
-    DonationRequest, DonationHistory, BLOOD_GROUPS
+    DonationRequest, DonationHistory, BLOOD_GROUP_CODES
 )
 from .serializers import (
-    UserSerializer, DonorProfileSerializer,
+    UserSerializer, DonorProfileSerializer, PublicDonorProfileSerializer,
     BloodBankSerializer, BloodInventorySerializer,
-    DonationRequestSerializer, DonationHistorySerializer
+    DonationRequestSerializer, DonationHistorySerializer, BloodLotSerializer,
+    AnalyticsQuerySerializer, BulkDecisionSerializer
 )
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
-
+from .pagination import (
+    CreatedAtPagination, DonatedAtPagination, IdPagination, decode_cursor, encode_cursor,
+)
+from . import (
+    analytics, approvals, caching, compatibility, events, exports, imports, inventory, metrics, profiling, search,
+    stats,
+)
+from .caching import CachedListMixin
+from .allocation import ApprovalError
+from .routers import read_alias, use_replica
+from rest_framework.permissions import IsAuthenticated
+
+EVENT_KEEPALIVE_SECONDS = 15
+
+
+
+def _run_import(request, importer):
+    """
+    Feed an uploaded file (multipart "file", ?file_format=csv|ndjson|json to
+    override its extension) or a JSON list body to an importer.
+    """
+    upload = request.FILES.get('file')
+    if upload is not None:
+        # not ?format=, which DRF takes as the response renderer
+        fmt = request.query_params.get('file_format') or imports.format_for(upload.name)
+        records = imports.read_records(imports.text_stream(upload.file), fmt)
+    elif isinstance(request.data, list):
+        records = enumerate(request.data, start=1)
+    else:
+        return Response({"detail": "Upload a file or post a JSON list."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        result = importer(records, dry_run=request.query_params.get('dry_run') == '1')
+    except (ValueError, UnicodeDecodeError) as exc:
+        return Response({"detail": f"Could not read import: {exc}"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result.as_dict(), status=status.HTTP_200_OK)
 
 
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    # only the columns UserSerializer exposes; skips password hashes and flags
+    queryset = User.objects.only('id', 'username', 'email', 'first_name', 'last_name', 'role')
     serializer_class = UserSerializer
+    pagination_class = IdPagination
 
     def get_permissions(self):
         if self.action == 'create':
@@ -40,29 +78,109 @@ class UserViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated()]
         return [IsAdminUser()]
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        return _run_import(request, imports.import_donors)
+
     def get_queryset(self):
         user = getattr(self.request, 'user', None)
         if not user or not user.is_authenticated or not user.is_staff:
-            return User.objects.filter(pk=user.pk) if user and user.is_authenticated else User.objects.none()
+            return self.queryset.filter(pk=user.pk) if user and user.is_authenticated else User.objects.none()
         return super().get_queryset()
 
 
-class BloodBankViewSet(viewsets.ModelViewSet):
+class BloodBankViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = BloodBank.objects.all()
     serializer_class = BloodBankSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = IdPagination
+    cache_namespace = 'banks'
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        return _run_import(request, imports.import_banks)
 
-class BloodInventoryViewSet(viewsets.ModelViewSet):
-    queryset = BloodInventory.objects.all()
+
+class BloodInventoryViewSet(CachedListMixin, viewsets.ModelViewSet):
+    # BloodInventorySerializer nests the bank, so join it instead of one query per row
+    queryset = BloodInventory.objects.select_related('blood_bank')
     serializer_class = BloodInventorySerializer
     permission_classes = [IsAdminUser]
+    pagination_class = IdPagination
+    cache_namespace = 'inventory'
+
+    def perform_create(self, serializer):
+        # the units arrive as one lot, so the row's lots add up to its total
+        units = serializer.validated_data.pop('units', 0)
+        inv = serializer.save(units=0)
+        if units:
+            inventory.receive_lot(inv, units)
+
+    def perform_update(self, serializer):
+        data = dict(serializer.validated_data)
+        units = data.pop('units', None)
+        inventory.save_changes(serializer.instance, data)
+        if units is not None and units != serializer.instance.units:
+            inventory.set_units(serializer.instance, units)
+
+    @action(detail=True, methods=['get', 'post'])
+    def lots(self, request, pk=None):
+        """GET: the row's lots with stock left, earliest expiry first. POST: receive a new lot."""
+        inv = self.get_object()
+        if request.method == 'GET':
+            lots = inv.lots.filter(units_left__gt=0).order_by(*inventory.fifo_order())
+            return Response(BloodLotSerializer(lots, many=True).data)
+        serializer = BloodLotSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lot = inventory.receive_lot(inv, **serializer.validated_data)
+        return Response(BloodLotSerializer(lot).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def adjust(self, request, pk=None):
+        inv = self.get_object()
+        try:
+            delta = int(request.data.get('delta'))
+        except (TypeError, ValueError):
+            return Response({"detail": "delta must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if not inventory.adjust_units(inv.pk, delta, inv.blood_group):
+            return Response({"detail": "Not enough units"}, status=status.HTTP_409_CONFLICT)
+        inv.refresh_from_db(fields=['units'])
+        return Response(self.get_serializer(inv).data)
+
+
+class DonorProfileViewSet(viewsets.ReadOnlyModelViewSet):
+    # ?eligible=1 filters on the indexed next_eligible_on column
+    serializer_class = DonorProfileSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = IdPagination
+
+    def get_serializer_class(self):
+        # contact details and donation dates are for staff only
+        if self.request.user.is_staff:
+            return DonorProfileSerializer
+        return PublicDonorProfileSerializer
+
+    def list(self, request, *args, **kwargs):
+        with use_replica():
+            return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        params = self.request.query_params
+        q_group, terms = search.parse_query(params.get('q', ''))
+        blood_group = params.get('blood_group', '').upper()
+        return search.build_queryset(
+            blood_group=blood_group if blood_group in BLOOD_GROUP_CODES else q_group,
+            city=params.get('city', '').strip(),
+            terms=terms,
+            eligible=params.get('eligible') == '1',
+        ).select_related('user')
 
 
 class DonationRequestViewSet(viewsets.ModelViewSet):
     queryset = DonationRequest.objects.all()
     serializer_class = DonationRequestSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -76,42 +194,49 @@ class DonationRequestViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def approve(self, request, pk=None):
         req = self.get_object()
-        if req.status != 'pending':
-            return Response({"detail": "Already processed."}, status=status.HTTP_400_BAD_REQUEST)
-
-        with transaction.atomic():
-
-            inv = BloodInventory.objects.select_for_update().filter(blood_group=req.blood_group).first()
-            if not inv:
-                return Response({"detail": "No inventory available for this blood group."}, status=status.HTTP_400_BAD_REQUEST)
-
-            if inv.units >= req.units:
-                inv.units -= req.units
-                inv.save()
-
-                req.status = 'approved'
-                req.approved_by = request.user
-                req.save()
-
-                DonationHistory.objects.create(
-                    donor=req.requester,
-                    blood_group=req.blood_group,
-                    units=req.units,
-                    blood_bank=inv.blood_bank
-                )
+        try:
+            draws = approvals.approve_request(req, request.user)
+        except ApprovalError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "detail": "Approved",
+            "allocations": [
+                {"blood_bank": d.blood_bank_id, "blood_group": d.blood_group, "units": d.units}
+                for d in draws
+            ],
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        serializer = BulkDecisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = approvals.process_batch(
+            serializer.validated_data['action'],
+            request.user,
+            ids=serializer.validated_data.get('ids'),
+            filters=serializer.get_filters(),
+        )
+        return Response({
+            'summary': dict(Counter(r['status'] for r in results)),
+            'results': results,
+        }, status=status.HTTP_200_OK)
 
-                return Response({"detail": "Approved"}, status=status.HTTP_200_OK)
-            else:
-                return Response({"detail": "Not enough units"}, status=status.HTTP_400_BAD_REQUEST)
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def sources(self, request, pk=None):
+        req = self.get_object()
+        return Response({
+            'blood_group': req.blood_group,
+            'units': req.units,
+            'sources': compatibility.candidate_sources(req.blood_group),
+        })
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def reject(self, request, pk=None):
         req = self.get_object()
-        if req.status != 'pending':
-            return Response({"detail": "Already processed."}, status=status.HTTP_400_BAD_REQUEST)
-        req.status = 'rejected'
-        req.approved_by = request.user
-        req.save()
+        try:
+            approvals.reject_request(req, request.user)
+        except ApprovalError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"detail": "Rejected"}, status=status.HTTP_200_OK)
 
 
@@ -119,6 +244,11 @@ class DonationHistoryViewSet(viewsets.ModelViewSet):
     queryset = DonationHistory.objects.all()
     serializer_class = DonationHistorySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = DonatedAtPagination
+
+    def list(self, request, *args, **kwargs):
+        with use_replica():
+            return super().list(request, *args, **kwargs)
 
     def get_queryset(self):
         user = self.request.user
@@ -132,8 +262,53 @@ class DonationHistoryViewSet(viewsets.ModelViewSet):
 
 
 
+class AnalyticsViewSet(viewsets.ViewSet):
+    """Time series and top-N reports, read from the DailyStat rollups only."""
+    permission_classes = [IsAdminUser]
+
+    def _query(self, request):
+        serializer = AnalyticsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data, serializer.get_filters()
+
+    @action(detail=False, methods=['get'])
+    @use_replica
+    def timeseries(self, request):
+        data, filters = self._query(request)
+        return Response({
+            'metric': data['metric'],
+            'interval': data['interval'],
+            'start': data['start'],
+            'end': data['end'],
+            'results': analytics.timeseries(
+                data['metric'], data['start'], data['end'], interval=data['interval'], **filters,
+            ),
+        })
+
+    @action(detail=False, methods=['get'])
+    @use_replica
+    def top(self, request):
+        data, filters = self._query(request)
+        return Response({
+            'metric': data['metric'],
+            'by': data['by'],
+            'start': data['start'],
+            'end': data['end'],
+            'results': analytics.top(
+                data['metric'], data['by'], data['start'], data['end'], limit=data['limit'], **filters,
+            ),
+        })
+
+
+
+
 def home(request):
-    return render(request, 'core/home.html')
+    content = caching.cached(
+        'home', ['content'],
+        lambda: render_to_string('core/home_content.html', {'user': request.user}),
+        user=request.user,
+    )
+    return render(request, 'core/home.html', {'content': content})
 
 
 def user_register(request):
@@ -158,7 +333,7 @@ def user_register(request):
             role='donor'
         )
 
-        if blood_group in [b[0] for b in BLOOD_GROUPS]:
+        if blood_group in BLOOD_GROUP_CODES:
             profile, created = DonorProfile.objects.get_or_create(user=user, defaults={'blood_group': blood_group})
             if not created:
                 profile.blood_group = blood_group
@@ -167,7 +342,7 @@ def user_register(request):
         login(request, user)
         return redirect('dashboard')
 
-    blood_groups = [b[0] for b in BLOOD_GROUPS]
+    blood_groups = BLOOD_GROUP_CODES
     return render(request, 'core/register.html', {'blood_groups': blood_groups})
 
 
@@ -177,6 +352,7 @@ def user_login(request):
         password = request.POST.get('password', '').strip()
 
         if not email or not password:
+            metrics.LOGINS.inc(result='incomplete')
             messages.error(request, 'Please enter email and password.')
             return redirect('login')
 
@@ -188,8 +364,10 @@ def user_login(request):
 
         if user:
             login(request, user)
+            metrics.LOGINS.inc(result='success')
             return redirect('dashboard')
 
+        metrics.LOGINS.inc(result='invalid')
         messages.error(request, 'Invalid credentials')
         return redirect('login')
 
@@ -203,26 +381,24 @@ def user_logout(request):
 
 
 @login_required
+@use_replica
 def dashboard(request):
     user = request.user
+    summary = caching.cached('stats', ['snapshot', read_alias()], stats.snapshot)
     if user.is_staff or user.role == 'admin':
-        total_donors = User.objects.filter(role='donor').count()
-        inventory_by_group = BloodInventory.objects.values('blood_group').annotate(total_units=Sum('units'))
-        pending_requests = DonationRequest.objects.filter(status='pending').count()
         context = {
-            'total_donors': total_donors,
-            'inventory_by_group': inventory_by_group,
-            'pending_requests': pending_requests,
+            'total_donors': summary['total_donors'],
+            'inventory_by_group': summary['inventory_by_group'],
+            'pending_requests': summary['pending_requests'],
         }
         return render(request, 'core/admin_dashboard.html', context)
     else:
         profile = getattr(user, 'donor_profile', None)
-        donation_history = DonationHistory.objects.filter(donor=user).order_by('-donated_at')
-        available = BloodInventory.objects.values('blood_group').annotate(total_units=Sum('units'))
+        donation_history = DonationHistory.objects.filter(donor=user).select_related('blood_bank').order_by('-donated_at')
         context = {
             'profile': profile,
             'donation_history': donation_history,
-            'available': available,
+            'available': summary['inventory_by_group'],
         }
         return render(request, 'core/donor_dashboard.html', context)
 
@@ -241,7 +417,7 @@ def make_request(request):
             messages.error(request, 'Invalid units value.')
             return redirect('make_request')
 
-        if bg not in [b[0] for b in BLOOD_GROUPS] or units <= 0:
+        if bg not in BLOOD_GROUP_CODES or units <= 0:
             messages.error(request, 'Invalid blood group or units.')
             return redirect('make_request')
 
@@ -255,16 +431,36 @@ def make_request(request):
         messages.success(request, 'Request submitted.')
         return redirect('dashboard')
 
-    return render(request, 'core/make_request.html', {'blood_groups': [b[0] for b in BLOOD_GROUPS]})
+    return render(request, 'core/make_request.html', {'blood_groups': BLOOD_GROUP_CODES})
 
 
 @login_required
+@use_replica
 def search_donors(request):
     q = request.GET.get('q', '').strip()
-    results = DonorProfile.objects.filter(
-        Q(blood_group__iexact=q) | Q(city__icontains=q)
-    ) if q else []
-    return render(request, 'core/search.html', {'results': results, 'q': q})
+    blood_group = request.GET.get('blood_group', '')
+    if blood_group not in BLOOD_GROUP_CODES:
+        blood_group = ''
+    city = request.GET.get('city', '').strip()
+    eligible = request.GET.get('eligible') == '1'
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+
+    result_page = search.search(
+        q, blood_group=blood_group, city=city, eligible=eligible,
+        after=request.GET.get('after'), before=request.GET.get('before'), page=page,
+    )
+    return render(request, 'core/search.html', {
+        'results': result_page.results,
+        'page': result_page,
+        'q': q,
+        'blood_group': blood_group,
+        'city': city,
+        'eligible': eligible,
+        'blood_groups': BLOOD_GROUP_CODES,
+    })
 
 
 @login_required
@@ -280,7 +476,7 @@ def edit_profile(request):
         profile.phone = request.POST.get('phone', '').strip()
         profile.city = request.POST.get('city', '').strip()
         bg = request.POST.get('blood_group', profile.blood_group)
-        if bg in [b[0] for b in BLOOD_GROUPS]:
+        if bg in BLOOD_GROUP_CODES:
             profile.blood_group = bg
 
         if request.FILES.get('profile_photo'):
@@ -292,7 +488,7 @@ def edit_profile(request):
 
     return render(request, 'core/edit_profile.html', {
         'profile': profile,
-        'blood_groups': [b[0] for b in BLOOD_GROUPS],
+        'blood_groups': BLOOD_GROUP_CODES,
     })
 
 
@@ -304,42 +500,82 @@ def staff_required(view_func):
 
 @staff_required
 def admin_requests(request):
-    requests_qs = DonationRequest.objects.all().order_by('-created_at')
-    return render(request, 'core/admin_requests.html', {'requests': requests_qs})
+    after = None
+    if request.GET.get('after'):
+        try:
+            created_at, pk = decode_cursor(request.GET['after'], len(approvals.QUEUE_ORDERING))
+            after = [DonationRequest._meta.get_field('created_at').to_python(created_at), int(pk)]
+        except (ValueError, TypeError, ValidationError):
+            return HttpResponseBadRequest('Invalid cursor.')
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    rows = list(approvals.queue(after))
+    next_cursor = None
+    if len(rows) > approvals.QUEUE_PAGE_SIZE:
+        rows = rows[:approvals.QUEUE_PAGE_SIZE]
+        next_cursor = encode_cursor([rows[-1].created_at, rows[-1].pk])
+    return render(request, 'core/admin_requests.html', {
+        'requests': rows,
+        'page': page,
+        'offset': (page - 1) * approvals.QUEUE_PAGE_SIZE,
+        'next_cursor': next_cursor,
+        'blood_groups': BLOOD_GROUP_CODES,
+        'live_updates': settings.LIVE_UPDATES,
+    })
 
 
 @require_POST
 @staff_required
-def admin_request_approve(request, pk):
-    req = get_object_or_404(DonationRequest, pk=pk)
-    if req.status != 'pending':
-        messages.warning(request, 'Request already processed.')
+def admin_requests_bulk(request):
+    action_name = request.POST.get('action')
+    if action_name not in approvals.BATCH_ACTIONS:
+        messages.error(request, 'Choose approve or reject.')
         return redirect('admin_requests')
+    try:
+        ids = [int(i) for i in request.POST.getlist('ids')]
+    except ValueError:
+        messages.error(request, 'Invalid request selection.')
+        return redirect('admin_requests')
+    blood_group = request.POST.get('blood_group', '')
+    filters = {'blood_group': blood_group} if blood_group in BLOOD_GROUP_CODES else None
 
-    with transaction.atomic():
-        inv = BloodInventory.objects.select_for_update().filter(blood_group=req.blood_group).first()
-        if not inv:
-            messages.error(request, 'No inventory for this blood group.')
-            return redirect('admin_requests')
-
-        if inv.units >= req.units:
-            inv.units -= req.units
-            inv.save()
+    if request.POST.get('scope') == 'all':
+        results = approvals.process_batch(action_name, request.user, filters=filters or {})
+    elif ids:
+        results = approvals.process_batch(action_name, request.user, ids=ids)
+    else:
+        messages.warning(request, 'No requests selected.')
+        return redirect('admin_requests')
 
-            req.status = 'approved'
-            req.approved_by = request.user
-            req.save()
+    counts = Counter(r['status'] for r in results)
+    done = counts.get('approved', 0) + counts.get('rejected', 0)
+    messages.success(request, f"{done} request(s) {'approved' if action_name == 'approve' else 'rejected'}.")
+    if counts.get('error'):
+        failed = ', '.join([f"#{r['id']} ({r['detail']})" for r in results if r['status'] == 'error'][:20])
+        messages.warning(request, f"{counts['error']} request(s) failed: {failed}")
+    return redirect('admin_requests')
 
-            DonationHistory.objects.create(
-                donor=req.requester,
-                blood_group=req.blood_group,
-                units=req.units,
-                blood_bank=inv.blood_bank
-            )
 
-            messages.success(request, 'Request approved.')
+@require_POST
+@staff_required
+def admin_request_approve(request, pk):
+    req = get_object_or_404(DonationRequest, pk=pk)
+    try:
+        draws = approvals.approve_request(req, request.user)
+    except ApprovalError as exc:
+        if exc.code == 'processed':
+            messages.warning(request, 'Request already processed.')
+        elif exc.code == 'no_inventory':
+            messages.error(request, 'No inventory for this blood group.')
         else:
             messages.error(request, 'Not enough units.')
+        return redirect('admin_requests')
+
+    banks = len({d.blood_bank_id for d in draws})
+    messages.success(request, 'Request approved.' if banks == 1 else f'Request approved from {banks} blood banks.')
     return redirect('admin_requests')
 
 
@@ -347,16 +583,102 @@ def admin_request_approve(request, pk):
 @staff_required
 def admin_request_reject(request, pk):
     req = get_object_or_404(DonationRequest, pk=pk)
-    if req.status != 'pending':
+    try:
+        approvals.reject_request(req, request.user)
+    except ApprovalError:
         messages.warning(request, 'Request already processed.')
         return redirect('admin_requests')
-    req.status = 'rejected'
-    req.approved_by = request.user
-    req.save()
     messages.success(request, 'Request rejected.')
     return redirect('admin_requests')
 
 
+@staff_required
+@use_replica
+def export_data(request, kind):
+    if kind not in exports.EXPORTS:
+        return HttpResponseBadRequest('Unknown export.')
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest('format must be csv or ndjson.')
+    dates = {}
+    for name in ('start', 'end'):
+        raw = request.GET.get(name)
+        try:
+            # parse_date returns None for text that is not a date, ValueError for an impossible one
+            dates[name] = parse_date(raw) if raw else None
+        except ValueError:
+            dates[name] = None
+        if raw and dates[name] is None:
+            return HttpResponseBadRequest('start and end must be YYYY-MM-DD dates.')
+    start, end = dates['start'], dates['end']
+
+    response = StreamingHttpResponse(
+        exports.stream(kind, fmt, start, end, using=read_alias()),
+        content_type=exports.FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+@staff_required
+def cache_stats(request):
+    return JsonResponse(caching.cache_stats())
+
+
+def metrics_view(request):
+    """
+    Prometheus text format for every worker sharing METRICS_DIR. Open to
+    staff sessions and to `Authorization: Bearer <METRICS_TOKEN>` when a
+    token is configured.
+    """
+    token = settings.METRICS_TOKEN
+    authorized = request.user.is_active and request.user.is_staff
+    if token and not authorized:
+        authorized = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_required
+def profiling_stats(request):
+    """Sampled request profiles kept by ProfilingMiddleware in this process."""
+    return JsonResponse({'summary': profiling.summary(), 'recent': profiling.recent()})
+
+
+@staff_required
+async def admin_events(request):
+    """
+    Server-sent events for the admin pages (?channels=inventory,requests).
+    Needs an ASGI server; each open stream is a coroutine waiting on the broker.
+    """
+    if not settings.LIVE_UPDATES:
+        return HttpResponse('Live updates need the ASGI server.', status=501)
+    channels = [c for c in request.GET.get('channels', '').split(',') if c in events.CHANNELS]
+    if not channels:
+        return HttpResponseBadRequest('channels must list inventory and/or requests.')
+
+    async def stream():
+        subscription = events.get_broker().subscribe(channels)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    channel, data = await asyncio.wait_for(subscription.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # a comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                else:
+                    yield events.format_sse(channel, data)
+        finally:
+            await subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @staff_required
 def admin_donors(request):
     donors = User.objects.filter(role='donor').order_by('username')
@@ -364,18 +686,6 @@ def admin_donors(request):
     return render(request, 'core/admin_donors.html', {'donors': donor_profiles})
 
 
-
-
-@receiver(post_save, sender=BloodBank)
-def create_inventory_for_new_bank(sender, instance, created, **kwargs):
-    if created:
-        for bg, _ in BLOOD_GROUPS:
-            BloodInventory.objects.get_or_create(
-                blood_bank=instance,
-                blood_group=bg,
-                defaults={'units': 10} 
-            )
-
 @staff_required
 def manage_inventory(request):
     inventories = BloodInventory.objects.select_related('blood_bank').all().order_by('blood_bank__name', 'blood_group')
@@ -385,10 +695,16 @@ def manage_inventory(request):
         units = request.POST.get('units')
 
         try:
-            inv = BloodInventory.objects.get(id=inventory_id)
-            inv.units = int(units)
-            inv.save()
-            messages.success(request, f"{inv.blood_bank.name} - {inv.blood_group} updated to {units} units.")
+            inv = BloodInventory.objects.select_related('blood_bank').get(id=inventory_id)
+            units = int(units)
+            expected = request.POST.get('expected_units')
+            expected = int(expected) if expected else None
+            if units < 0:
+                messages.error(request, "Units cannot be negative.")
+            elif inventory.set_units(inv, units, expected=expected):
+                messages.success(request, f"{inv.blood_bank.name} - {inv.blood_group} updated to {units} units.")
+            else:
+                messages.error(request, f"{inv.blood_bank.name} - {inv.blood_group} changed meanwhile; reload and try again.")
         except BloodInventory.DoesNotExist:
             messages.error(request, "Inventory record not found.")
         except ValueError:
@@ -397,7 +713,8 @@ def manage_inventory(request):
         return redirect('manage_inventory')
 
     context = {
-        'inventories': inventories
+        'inventories': inventories,
+        'live_updates': settings.LIVE_UPDATES,
     }
     return render(request, 'core/manage_inventory.html', context)
 
@@ -411,8 +728,7 @@ def update_inventory(request, pk):
         if units < 0:
             messages.error(request, 'Units cannot be negative.')
         else:
-            inv.units = units
-            inv.save()
+            inventory.set_units(inv, units)
             messages.success(request, f'{inv.blood_group} units updated.')
     except ValueError:
         messages.error(request, 'Invalid units value.')